@@ -1,6 +1,8 @@
 import sqlite3
 import os # Need this to check if the database file exists
 
+from sqlite_profile import connect
+
 # --- Setting up my dummy database ---
 def setup_database():
 
@@ -37,9 +39,10 @@ def setup_database():
 # --- My custom DatabaseConnection context manager ---
 class DatabaseConnection:
 
-    def __init__(self, db_name):
+    def __init__(self, db_name, profile=None):
 
         self.db_name = db_name
+        self.profile = profile  # sqlite_profile name; None means SQLITE_PROFILE
         self.conn = None    # Will hold my connection object
         self.cursor = None  # Will hold my cursor object
 
@@ -49,7 +52,7 @@ class DatabaseConnection:
         It's where I establish the database connection and give back the cursor.
         """
         try:
-            self.conn = sqlite3.connect(self.db_name)
+            self.conn = connect(self.db_name, profile=self.profile)
             self.cursor = self.conn.cursor()
             print(f"Database connection to '{self.db_name}' opened for me.")
             return self.cursor # This is what I'll get as 'as cursor'
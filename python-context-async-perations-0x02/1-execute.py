@@ -1,6 +1,8 @@
 import sqlite3
 import os
 
+from sqlite_profile import connect
+
 # --- My updated dummy database setup ---
 def setup_database():
 
@@ -39,9 +41,10 @@ def setup_database():
 # --- My custom ExecuteQuery context manager ---
 class ExecuteQuery:
 
-    def __init__(self, db_name, query, params=None):
+    def __init__(self, db_name, query, params=None, profile=None):
 
         self.db_name = db_name
+        self.profile = profile  # sqlite_profile name; None means SQLITE_PROFILE
         self.query = query
         # Ensure params is a tuple/list, even if None or a single item
         self.params = params if params is not None else ()
@@ -56,7 +59,7 @@ class ExecuteQuery:
     def __enter__(self):
 
         try:
-            self.conn = sqlite3.connect(self.db_name)
+            self.conn = connect(self.db_name, profile=self.profile)
             self.cursor = self.conn.cursor()
             print(f"Database connection to '{self.db_name}' opened for query execution.")
 
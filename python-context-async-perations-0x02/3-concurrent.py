@@ -2,6 +2,8 @@ import asyncio
 import aiosqlite
 import sqlite3
 
+from sqlite_profile import apply_profile_async, connect_kwargs
+
 
 def setup_database():
 
@@ -41,7 +43,8 @@ def setup_database():
 async def async_fetch_users():
 
     print("Starting to fetch all users...")
-    async with aiosqlite.connect('users.db') as db:
+    async with aiosqlite.connect('users.db', **connect_kwargs()) as db:
+        await apply_profile_async(db)
         # Wait for 1 second to simulate a slow query
         await asyncio.sleep(1)
         async with db.execute('SELECT * FROM users') as cursor:
@@ -53,7 +56,8 @@ async def async_fetch_users():
 async def async_fetch_older_users():
 
     print("Starting to fetch older users...")
-    async with aiosqlite.connect('users.db') as db:
+    async with aiosqlite.connect('users.db', **connect_kwargs()) as db:
+        await apply_profile_async(db)
         # Wait for 1 second to simulate a slow query
         await asyncio.sleep(1)
         async with db.execute('SELECT * FROM users WHERE age > 40') as cursor:
@@ -0,0 +1,23 @@
+"""SQLite connection profiles for this directory's scripts.
+
+The implementation lives in python-decorators-0x01/sqlite_profile.py; it is
+loaded from there by path so both directories apply the same profiles, and
+this file stays a plain module (no symlink) on every platform.
+"""
+import importlib.util
+import os
+
+_SHARED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                            'python-decorators-0x01', 'sqlite_profile.py')
+
+_spec = importlib.util.spec_from_file_location('_shared_sqlite_profile', _SHARED_PATH)
+_shared = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_shared)
+
+PROFILES = _shared.PROFILES
+DEFAULT_PROFILE = _shared.DEFAULT_PROFILE
+get_profile = _shared.get_profile
+connect_kwargs = _shared.connect_kwargs
+apply_profile = _shared.apply_profile
+apply_profile_async = _shared.apply_profile_async
+connect = _shared.connect
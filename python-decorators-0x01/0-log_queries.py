@@ -1,43 +1,20 @@
 import sqlite3
-import functools
-from datetime import datetime
 
-
-#### decorator to log SQL queries
-
-def log_queries(func):
-
-
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-
-        if 'query' in kwargs:
-            query = kwargs['query']
-        # Method 2: If query is the first positional argument
-        elif args:
-            query = args[0]
-        else:
-            query = "No query found"
-
-        # Log the SQL query with timestamp
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"[{timestamp}] [LOG] Executing SQL Query: {query}")
+from query_metrics import instrument, metrics_snapshot, prometheus_text
+from sqlite_profile import connect
 
 
-        result = func(*args, **kwargs)
-
-
-        completion_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"[{completion_time}] [LOG] Query executed successfully")
-
-        return result
-
-    return wrapper
+#### decorator to log SQL queries
+# Records each query's wall time (perf_counter_ns), rows returned and
+# literal-free fingerprint into per-fingerprint latency histograms instead of
+# printing two timestamps per call. Read them back with metrics_snapshot() or
+# prometheus_text(); use @log_queries(sample_rate=0.01) on hot paths.
+log_queries = instrument
 
 
 @log_queries
 def fetch_all_users(query):
-    conn = sqlite3.connect('users.db')
+    conn = connect('users.db')
     cursor = conn.cursor()
     cursor.execute(query)
     results = cursor.fetchall()
@@ -70,4 +47,12 @@ if __name__ == "__main__":
 
     #### fetch users while logging the query
     users = fetch_all_users(query="SELECT * FROM users")
-    print(f"Retrieved {len(users)} users: {users}")
\ No newline at end of file
+    print(f"Retrieved {len(users)} users: {users}")
+
+    for user_id in range(1, 4):
+        fetch_all_users(query=f"SELECT * FROM users WHERE id = {user_id}")
+
+    for query, stats in metrics_snapshot().items():
+        print(f"{query}: {stats['count']} calls, {stats['rows']} rows, "
+              f"avg {stats['avg_ms']:.3f}ms, p95 {stats['p95_ms']:.3f}ms")
+    print(prometheus_text())
\ No newline at end of file
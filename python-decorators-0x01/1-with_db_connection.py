@@ -1,23 +1,7 @@
 import sqlite3
-import functools
 
-def with_db_connection(func):
-
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        conn = None # Initialize conn to None
-        try:
-            conn = sqlite3.connect('users.db')
-
-            result = func(conn, *args, **kwargs)
-            return result
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            raise # Re-raise the exception after printing
-        finally:
-            if conn:
-                conn.close() # Close the connection
-    return wrapper
+# Pooled, write_batch-aware and coroutine-aware; see connection_pool.py
+from connection_pool import with_pooled_connection as with_db_connection
 
 @with_db_connection
 def get_user_by_id(conn, user_id):
@@ -1,33 +1,46 @@
 import sqlite3
 import functools
+import inspect
+import time
+from contextlib import contextmanager
 
-
-def with_db_connection(func):
-
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        conn = None
-        try:
-            conn = sqlite3.connect('users.db')
-            # Pass the connection as the first argument to the decorated function
-            result = func(conn, *args, **kwargs)
-            return result
-        except sqlite3.Error as e:
-            print(f"Database connection or operation error: {e}")
-            raise
-        finally:
-            if conn:
-                conn.close()
-    return wrapper
+from async_pool import transaction
+from cache_store import track_writes, track_writes_async
+from connection_pool import get_pool, with_pooled_connection as with_db_connection
+from write_batch import WriteBatch, current_batch
 
 # --- New transactional decorator ---
 def transactional(func):
 
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(conn, *args, **kwargs):
+            try:
+                async with track_writes_async(conn):
+                    async with transaction(conn):
+                        result = await func(conn, *args, **kwargs)
+                print("Transaction committed successfully.")
+                return result
+            except Exception as e:
+                print(f"Transaction rolled back due to error: {e}")
+                raise
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
+        batch = current_batch(conn)
+        if batch is not None:
+            # A savepoint in the batch's transaction, committed with the batch
+            try:
+                return batch.run(func, conn, *args, **kwargs)
+            except Exception as e:
+                print(f"Batched write rolled back due to error: {e}")
+                raise
         try:
-            result = func(conn, *args, **kwargs)
-            conn.commit()
+            # Cached results for the tables written here are dropped on commit
+            with track_writes(conn):
+                result = func(conn, *args, **kwargs)
+                conn.commit()
             print("Transaction committed successfully.")
             return result
         except Exception as e: # Catch any exception
@@ -39,6 +52,16 @@ def transactional(func):
             raise
     return wrapper
 
+@contextmanager
+def write_batch(max_items=500, max_delay=0.2, on_commit=None):
+    """Groups @with_db_connection/@transactional calls on users.db into few commits
+
+    See write_batch.WriteBatch for the savepoint and group-commit rules.
+    """
+    with get_pool().connection() as conn:
+        with WriteBatch(conn, max_items, max_delay, on_commit) as batch:
+            yield batch
+
 # --- Database Setup  ---
 def setup_database():
     conn = sqlite3.connect('users.db')
@@ -85,6 +108,44 @@ def update_and_fail(conn, user_id, new_email):
     print(f"Successfully executed UPDATE for user ID {user_id}. Now raising an error...")
     raise ValueError("Simulating an error during transaction!")
 
+# --- Quiet variant for bulk updates ---
+@with_db_connection
+@transactional
+def set_user_email(conn, user_id, new_email):
+    conn.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+
+
+def bulk_update_demo(count=5000):
+    user_ids = (1, 2, 3)
+    original = {user_id: get_user_email(user_id=user_id) for user_id in user_ids}
+
+    # Baseline: one transaction per call, so one fsync per row
+    per_call = 50
+    started = time.perf_counter()
+    for i in range(per_call):
+        set_user_email(user_id=user_ids[i % 3], new_email=f"user{i}@example.com")
+    print(f"One commit per call: {per_call / (time.perf_counter() - started):,.0f} rows/s")
+
+    def report(batch_report):
+        print(f"  batch: {batch_report['items']} rows, {batch_report['failed']} failed, "
+              f"{batch_report['latency'] * 1000:.1f} ms open, {batch_report['commit_time'] * 1000:.1f} ms commit")
+
+    started = time.perf_counter()
+    with write_batch(max_items=1000, on_commit=report) as batch:
+        for i in range(count):
+            set_user_email(user_id=user_ids[i % 3], new_email=f"bulk{i}@example.com")
+        # Duplicate email violates UNIQUE: only this call is undone
+        try:
+            set_user_email(user_id=1, new_email=f"bulk{count - 1}@example.com")
+        except sqlite3.IntegrityError:
+            pass
+    elapsed = time.perf_counter() - started
+    print(f"Batched: {count / elapsed:,.0f} rows/s; stats: {batch.stats()}")
+
+    with write_batch() as batch:
+        for user_id, email in original.items():
+            set_user_email(user_id=user_id, new_email=email)
+
 
 # --- Main execution ---
 if __name__ == "__main__":
@@ -109,4 +170,7 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"An unexpected error occurred during rollback test: {e}")
 
-    print(f"User 2 email after rollback attempt: {get_user_email(user_id=2)}")
\ No newline at end of file
+    print(f"User 2 email after rollback attempt: {get_user_email(user_id=2)}")
+
+    print("\n--- Bulk email updates: per-call commits vs write_batch ---")
+    bulk_update_demo()
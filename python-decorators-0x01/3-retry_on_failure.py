@@ -1,46 +1,94 @@
 import time
+import asyncio
 import sqlite3
 import functools
+import inspect
 
-
-# --- db_connection decorator ---
-def with_db_connection(func):
-
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        conn = None
-        try:
-            conn = sqlite3.connect('users.db')
-
-            result = func(conn, *args, **kwargs)
-            return result
-        except sqlite3.Error as e:
-            print(f"Database connection or operation error in with_db_connection: {e}")
-            raise
-        finally:
-            if conn:
-                conn.close()
-
-    return wrapper
+from connection_pool import with_pooled_connection as with_db_connection
+from retry_policy import CircuitOpenError, RetryPolicy, get_breaker, get_budget
 
 
 # --- New retry_on_failure decorator ---
-def retry_on_failure(retries=3, delay=2):
+def retry_on_failure(retries=3, delay=2, max_delay=30, target=None, policy=None,
+                     breaker=None, budget=None):
+    """Retries transient database errors with exponential backoff and full jitter
+
+    `delay` is the base of the backoff: attempt n waits a random time in
+    [0, min(max_delay, delay * 2**n)]. Errors that a retry can't fix are
+    re-raised at once (see retry_policy.is_transient). Functions sharing a
+    `target` name share one circuit breaker and one retry budget, so a
+    struggling database sees fewer calls rather than more.
+    """
+    retry_policy = policy or RetryPolicy(retries, base_delay=delay, max_delay=max_delay)
 
     def decorator(func):
+        name = target or func.__qualname__
+        circuit = breaker or get_breaker(name)
+        retry_budget = budget or get_budget(name)
+
+        def next_wait(e, attempt):
+            """Seconds to wait before retrying, or None to re-raise `e`"""
+            if not retry_policy.classifier(e):
+                circuit.record_ignored()
+                print(f"Non-transient error in {func.__name__}, not retrying: {e}")
+                return None
+            circuit.record_failure()
+            print(f"Attempt {attempt + 1}/{retry_policy.retries + 1} failed for {func.__name__}: {e}")
+            if not retry_policy.should_retry(e, attempt):
+                print(f"All {attempt + 1} attempts failed for {func.__name__}. Re-raising the last error.")
+                return None
+            if not retry_budget.try_spend():
+                print(f"Retry budget for {name} exhausted. Re-raising the last error.")
+                return None
+            wait = retry_policy.backoff(attempt)
+            print(f"Retrying in {wait:.2f} seconds...")
+            return wait
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                retry_budget.record_call()
+                attempt = 0
+                while True:
+                    circuit.before_call()
+                    try:
+                        result = await func(*args, **kwargs)
+                    except Exception as e:
+                        wait = next_wait(e, attempt)
+                        if wait is None:
+                            raise
+                        await asyncio.sleep(wait)  # yields to other tasks while backing off
+                        attempt += 1
+                    except BaseException:
+                        # Cancelled (e.g. by wait_for): no verdict, but free a half-open probe
+                        circuit.record_ignored()
+                        raise
+                    else:
+                        circuit.record_success()
+                        return result
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            for i in range(retries + 1):
+            retry_budget.record_call()
+            attempt = 0
+            while True:
+                circuit.before_call()  # raises CircuitOpenError while the circuit is open
                 try:
-                    return func(*args, **kwargs)
+                    result = func(*args, **kwargs)
                 except Exception as e:
-                    print(f"Attempt {i + 1}/{retries + 1} failed for {func.__name__}: {e}")
-                    if i < retries:
-                        print(f"Retrying in {delay} seconds...")
-                        time.sleep(delay)
-                    else:
-                        print(f"All {retries + 1} attempts failed for {func.__name__}. Re-raising the last error.")
+                    wait = next_wait(e, attempt)
+                    if wait is None:
                         raise
+                    time.sleep(wait)
+                    attempt += 1
+                except BaseException:
+                    # KeyboardInterrupt and the like: no verdict, but free a half-open probe
+                    circuit.record_ignored()
+                    raise
+                else:
+                    circuit.record_success()
+                    return result
 
         return wrapper
 
@@ -107,4 +155,18 @@ if __name__ == "__main__":
         for user in users_again:
             print(user)
     except Exception as e:
-        print(f"\nFailed to fetch users again after all retries: {e}")
\ No newline at end of file
+        print(f"\nFailed to fetch users again after all retries: {e}")
+
+    print("\n--- Persistent lock contention: the circuit opens and later calls fail fast ---")
+
+    @retry_on_failure(retries=1, delay=0.01, target='users-db-locked')
+    def always_locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    for call in range(5):
+        try:
+            always_locked()
+        except CircuitOpenError as e:
+            print(f"Call {call + 1}: {e}")
+        except sqlite3.OperationalError as e:
+            print(f"Call {call + 1}: gave up with {e}")
\ No newline at end of file
@@ -1,52 +1,105 @@
 import time
+import asyncio
 import sqlite3
 import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_store import AsyncSingleFlight, QueryCache, get_cache, prometheus_text, tables_read
+from connection_pool import with_pooled_connection as with_db_connection
+from write_batch import current_batch
+
+_MISSING = object()
+
+# --- Shared query cache ---
+# In-process sharded TTL cache by default; cache_store.configure_cache() or QUERY_CACHE_URL
+# switches to a store shared by every worker process. Writes made through
+# transactional (2-transactional.py) invalidate it by table.
+
+# Concurrent awaits of a key missed in a shared store share one query;
+# QueryCache coalesces them itself in load_async
+_async_flights = AsyncSingleFlight()
+
+def _cache_key(store, func, args, kwargs):
+    """Returns (query, key), or (None, None) when the call can't be cached"""
+    query = None
+    if 'query' in kwargs:
+        query = kwargs['query']
+        params = args
+    elif len(args) > 0 and isinstance(args[0], str): # Check if query is the first of *args (i.e., second overall argument)
+        query = args[0]
+        params = args[1:]
+
+    if not query:
+        print(f"Warning: Could not find query string in arguments for {func.__name__}. Skipping cache.")
+        return None, None
+
+    extra = tuple(sorted((name, value) for name, value in kwargs.items() if name != 'query'))
+    try:
+        key = store.make_key(query, (params, extra))
+        hash(key)
+    except TypeError:
+        print(f"Warning: Unhashable arguments for {func.__name__}. Skipping cache.")
+        return None, None
+    return query, key
 
-# --- db_connection decorator ---
-def with_db_connection(func):
-
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        conn = None
-        try:
-            conn = sqlite3.connect('users.db')
+# --- New cache_query decorator ---
+def cache_query(func=None, *, ttl=None, cache=None):
+    """Caches results keyed on the normalized SQL plus every other argument
+
+    Use as @cache_query or @cache_query(ttl=30, cache=QueryCache(...)).
+    """
+    if func is None:
+        return functools.partial(cache_query, ttl=ttl, cache=cache)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(conn, *args, **kwargs):
+            store = cache if cache is not None else get_cache()
+            query, key = _cache_key(store, func, args, kwargs)
+            if key is None:
+                return await func(conn, *args, **kwargs)
+
+            # Shared backends do blocking I/O, so keep them off the event loop
+            local = isinstance(store, QueryCache)
+            result = store.get(key, _MISSING) if local else await asyncio.to_thread(store.get, key, _MISSING)
+            if result is not _MISSING:
+                print(f"Retrieving result for '{query}' from cache.")
+                return result
 
-            result = func(conn, *args, **kwargs)
-            return result
-        except sqlite3.Error as e:
-            print(f"Database connection or operation error in with_db_connection: {e}")
-            raise
-        finally:
-            if conn:
-                conn.close()
-    return wrapper
+            print(f"Executing query '{query}' and caching result.")
+            tables = tables_read(query)
+            if local:
+                return await store.load_async(key, lambda: func(conn, *args, **kwargs), tables, ttl=ttl)
 
-# --- Global cache dictionary ---
-query_cache = {}
+            async def load():
+                generation = await asyncio.to_thread(store.generation, tables)
+                value = await func(conn, *args, **kwargs)
+                await asyncio.to_thread(store.put, key, value, tables, ttl=ttl, generation=generation)
+                return value
 
-# --- New cache_query decorator ---
-def cache_query(func):
+            return await _async_flights.run((id(store), key), load)
+        return async_wrapper
 
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
-        query = None
-        if 'query' in kwargs:
-            query = kwargs['query']
-        elif len(args) > 0 and isinstance(args[0], str): # Check if query is the first of *args (i.e., second overall argument)
-             query = args[0]
-
-        if not query:
-            print(f"Warning: Could not find query string in arguments for {func.__name__}. Skipping cache.")
+        if current_batch(conn) is not None:
+            # A read inside a write batch sees its uncommitted writes: don't cache it
+            return func(conn, *args, **kwargs)
+        store = cache if cache is not None else get_cache()
+        query, key = _cache_key(store, func, args, kwargs)
+        if key is None:
             return func(conn, *args, **kwargs) # Execute without caching if query not found
 
-        if query in query_cache:
+        result = store.get(key, _MISSING)
+        if result is not _MISSING:
             print(f"Retrieving result for '{query}' from cache.")
-            return query_cache[query]
-        else:
-            print(f"Executing query '{query}' and caching result.")
-            result = func(conn, *args, **kwargs)
-            query_cache[query] = result
             return result
+
+        print(f"Executing query '{query}' and caching result.")
+        # Only one caller per key runs the query at a time; threads or
+        # processes missing it meanwhile wait and share its result
+        return store.load(key, lambda: func(conn, *args, **kwargs), tables_read(query), ttl=ttl)
     return wrapper
 
 # --- Database Setup  ---
@@ -75,6 +128,15 @@ def fetch_users_with_cache(conn, query):
     cursor.execute(query)
     return cursor.fetchall()
 
+# --- Slow query for the concurrency demo ---
+@with_db_connection
+@cache_query
+def fetch_users_slowly(conn, query):
+
+    print("--- Executing slow database query ---")
+    time.sleep(0.2)
+    return conn.execute(query).fetchall()
+
 #### Main execution ####
 if __name__ == "__main__":
     setup_database()
@@ -82,19 +144,27 @@ if __name__ == "__main__":
     print("--- First call: Should execute query and cache result ---")
     users = fetch_users_with_cache(query="SELECT * FROM users")
     print("Users from first call:", users)
-    print("Current cache:", query_cache)
+    print("Cache stats:", get_cache().stats())
 
     print("\n--- Second call (same query): Should use cached result ---")
     users_again = fetch_users_with_cache(query="SELECT * FROM users")
     print("Users from second call:", users_again)
-    print("Current cache:", query_cache)
+    print("Cache stats:", get_cache().stats())
 
     print("\n--- Third call (different query): Should execute query and cache new result ---")
     users_filtered = fetch_users_with_cache(query="SELECT name FROM users WHERE id = 1")
     print("Users (filtered) from third call:", users_filtered)
-    print("Current cache:", query_cache)
+    print("Cache stats:", get_cache().stats())
 
     print("\n--- Fourth call (different query, again): Should use cached result ---")
     users_filtered_again = fetch_users_with_cache(query="SELECT name FROM users WHERE id = 1")
     print("Users (filtered) from fourth call:", users_filtered_again)
-    print("Current cache:", query_cache)
\ No newline at end of file
+    print("Cache stats:", get_cache().stats())
+
+    print("\n--- Eight threads missing the same query at once: one should run it ---")
+    query = "SELECT name, email FROM users ORDER BY name"
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: fetch_users_slowly(query=query), range(8)))
+    print("All threads got the same rows:", all(rows == results[0] for rows in results))
+    print("Cache stats:", get_cache().stats())
+    print(prometheus_text(), end="")
@@ -0,0 +1,191 @@
+"""asyncio counterpart of connection_pool, for services running on aiosqlite.
+
+    async with async_connection() as conn:
+        async with transaction(conn):
+            await conn.execute("UPDATE users SET email = ? WHERE id = ?", (email, user_id))
+
+aiosqlite connections belong to the event loop that opened them, so there is
+one shared pool per running loop. Each aiosqlite connection runs its own
+thread; a pool closes its connections when its loop shuts down its async
+generators (asyncio.run() does), or earlier through close_async_pool().
+"""
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from connection_pool import (DB_PATH, DEFAULT_CHECKOUT_TIMEOUT, DEFAULT_POOL_SIZE, PoolTimeout,
+                             validate_pragmas)
+from sqlite_profile import apply_profile_async, connect_kwargs
+
+try:
+    import aiosqlite
+except ImportError:  # only needed once an async decorated function runs
+    aiosqlite = None
+
+
+class AsyncSQLiteConnectionPool:
+    """Pool of warm aiosqlite connections, opened lazily up to `size`"""
+
+    def __init__(self, path=DB_PATH, size=DEFAULT_POOL_SIZE,
+                 checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT, pragmas=None, profile=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.path = path
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.pragmas = validate_pragmas(pragmas)
+        self.profile = profile
+
+        self._slots = asyncio.Semaphore(size)
+        # Most recently released last; only touched from the loop's thread
+        self._idle = []
+        self.closed = False
+        self._shutdown_hook = None
+        self._metrics = {
+            'checkouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'waits': 0,
+            'in_use': 0,
+            'checkout_time_total': 0.0,
+            'checkout_time_max': 0.0,
+        }
+
+    async def _create(self):
+        if aiosqlite is None:
+            raise ImportError("Async decorated functions need aiosqlite (pip install aiosqlite)")
+        connection = await aiosqlite.connect(self.path, **connect_kwargs(self.profile))
+        await apply_profile_async(connection, self.profile)
+        for name, value in self.pragmas.items():
+            await connection.execute(f"PRAGMA {name} = {value}")
+        self._metrics['created'] += 1
+        return connection
+
+    async def _discard(self, connection):
+        self._metrics['discarded'] += 1
+        try:
+            await connection.close()
+        except Exception:
+            pass
+
+    async def acquire(self, timeout=None):
+        """Checks out a connection, waiting up to `timeout` seconds without blocking the loop"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.perf_counter()
+        if self._shutdown_hook is None:
+            # The loop only keeps weak references to its async generators
+            self._shutdown_hook = self._close_at_shutdown()
+            await self._shutdown_hook.asend(None)
+        if self._slots.locked():
+            self._metrics['waits'] += 1
+        # Acquired in this task rather than a wait_for() child task, whose
+        # result is lost if this task is cancelled just as the slot frees up
+        try:
+            async with asyncio.timeout(timeout):
+                await self._slots.acquire()
+        except TimeoutError:
+            raise PoolTimeout(f"No connection available after waiting {timeout}s "
+                              f"(pool size {self.size})") from None
+        try:
+            connection = self._idle.pop() if self._idle else await self._create()
+        except BaseException:
+            self._slots.release()
+            raise
+
+        elapsed = time.perf_counter() - started
+        self._metrics['checkouts'] += 1
+        self._metrics['in_use'] += 1
+        self._metrics['checkout_time_total'] += elapsed
+        self._metrics['checkout_time_max'] = max(self._metrics['checkout_time_max'], elapsed)
+        return connection
+
+    async def release(self, connection):
+        """Returns a connection to the pool, rolling back anything left uncommitted"""
+        try:
+            if self.closed:
+                await self._discard(connection)
+                return
+            if connection.in_transaction:
+                await connection.rollback()
+            self._idle.append(connection)
+        except Exception:
+            await self._discard(connection)
+        finally:
+            self._metrics['in_use'] -= 1
+            self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        connection = await self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            await self.release(connection)
+
+    def stats(self):
+        stats = dict(self._metrics)
+        stats['idle'] = len(self._idle)
+        stats['size'] = self.size
+        stats['checkout_time_avg'] = (stats['checkout_time_total'] / stats['checkouts']
+                                      if stats['checkouts'] else 0.0)
+        return stats
+
+    async def close(self):
+        """Closes every idle connection; checked-out ones are closed when released"""
+        self.closed = True
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await self._discard(connection)
+
+    async def _close_at_shutdown(self):
+        """Parked at its yield until the loop shuts down its async generators"""
+        try:
+            yield
+        finally:
+            loop = asyncio.get_running_loop()
+            if _pools.get(loop) is self:
+                del _pools[loop]
+            await self.close()
+
+
+_pools = weakref.WeakKeyDictionary()
+_pool_settings = {}
+
+
+def configure_async_pool(**kwargs):
+    """Settings for pools created from now on, e.g. configure_async_pool(size=10)"""
+    _pool_settings.clear()
+    _pool_settings.update(kwargs)
+
+
+def get_async_pool():
+    """The pool for the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None or pool.closed:
+        pool = _pools[loop] = AsyncSQLiteConnectionPool(**_pool_settings)
+    return pool
+
+
+async def close_async_pool():
+    """Closes the running loop's pool now, if it has one"""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+def async_connection(timeout=None):
+    """async with async_connection() as conn: borrows from the running loop's pool"""
+    return get_async_pool().connection(timeout)
+
+
+@asynccontextmanager
+async def transaction(conn):
+    """Commits when the block finishes, rolls back if it raises"""
+    try:
+        yield conn
+    except BaseException:
+        await conn.rollback()
+        raise
+    await conn.commit()
@@ -0,0 +1,104 @@
+"""Read/write throughput of each sqlite_profile profile (and VARIANTS) on a fresh users table.
+
+    python benchmark_sqlite_profile.py            # 20,000 users
+    python benchmark_sqlite_profile.py 100000     # custom table size
+
+Every profile gets its own database file in a temp directory, so the
+rollback-journal and WAL runs don't affect each other or users.db.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlite_profile import PROFILES, connect
+
+# Write transactions are slow under synchronous=FULL; keep that phase short
+SINGLE_WRITES = 500
+POINT_READS = 20000
+# More distinct statements than the default cache of 128 holds
+STATEMENT_SHAPES = 300
+
+# Extra pragmas tried on top of a profile, compared against that profile.
+# temp_store=MEMORY is what the note in sqlite_profile's tuned profile is about.
+VARIANTS = {
+    'tuned+memtemp': ('tuned', {'temp_store': 'MEMORY'}),
+}
+
+
+def _rate(count, started):
+    elapsed = time.perf_counter() - started
+    return count / elapsed if elapsed > 0 else float('inf')
+
+
+def run(name, profile, pragmas, rows, workdir):
+    path = os.path.join(workdir, f"{name}.db")
+    conn = connect(path, profile=profile)
+    for pragma, value in pragmas.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+                 "email TEXT UNIQUE NOT NULL, age INTEGER NOT NULL)")
+    results = {}
+
+    started = time.perf_counter()
+    with conn:
+        conn.executemany("INSERT INTO users (name, email, age) VALUES (?, ?, ?)",
+                         ((f"User {i}", f"user{i}@example.com", 18 + i % 60) for i in range(rows)))
+    results['bulk insert rows/s'] = _rate(rows, started)
+
+    # One commit per row, like update_user_email in a loop
+    started = time.perf_counter()
+    for i in range(SINGLE_WRITES):
+        with conn:
+            conn.execute("UPDATE users SET email = ? WHERE id = ?",
+                         (f"updated{i}@example.com", random.randint(1, rows)))
+    results['single-row commits/s'] = _rate(SINGLE_WRITES, started)
+
+    ids = [random.randint(1, rows) for _ in range(POINT_READS)]
+    started = time.perf_counter()
+    for user_id in ids:
+        conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+    results['point reads/s'] = _rate(POINT_READS, started)
+
+    # Rotating through many statement texts; each miss in the statement
+    # cache means parsing and planning the SQL again
+    started = time.perf_counter()
+    for i, user_id in enumerate(ids):
+        conn.execute(f"SELECT id, email FROM users WHERE id = ? AND age > {i % STATEMENT_SHAPES}",
+                     (user_id,)).fetchone()
+    results['mixed-statement reads/s'] = _rate(POINT_READS, started)
+
+    started = time.perf_counter()
+    scans = 20
+    for _ in range(scans):
+        conn.execute("SELECT age, COUNT(*) FROM users GROUP BY age ORDER BY 2 DESC").fetchall()
+    results['group-by scans/s'] = _rate(scans, started)
+
+    conn.close()
+    return results
+
+
+def main(rows):
+    workdir = tempfile.mkdtemp(prefix='sqlite-profile-')
+    runs = {profile: (profile, {}) for profile in PROFILES}
+    runs.update(VARIANTS)
+    table = {name: run(name, profile, pragmas, rows, workdir)
+             for name, (profile, pragmas) in runs.items()}
+    metrics = list(next(iter(table.values())))
+
+    print(f"{rows:,} users; higher is better")
+    print(f"{'':<26}" + ''.join(f"{profile:>14}" for profile in table))
+    for metric in metrics:
+        print(f"{metric:<26}" + ''.join(f"{table[profile][metric]:>14,.0f}" for profile in table))
+    for name, (profile, _) in runs.items():
+        if name == 'default':
+            continue
+        base = profile if name in VARIANTS else 'default'
+        speedups = ', '.join(f"{metric.split(' ')[0]} x{table[name][metric] / table[base][metric]:.1f}"
+                             for metric in metrics)
+        print(f"{name} vs {base}: {speedups}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
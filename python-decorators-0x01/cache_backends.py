@@ -0,0 +1,431 @@
+"""Query caches shared by every worker process, for cache_query.
+
+    configure_cache('sqlite:///tmp/query_cache.db')     # one file per host
+    configure_cache('redis://localhost:6379/0')         # shared across hosts
+    QUERY_CACHE_URL=redis://cache:6379/0 gunicorn app:app
+
+Both backends expose the same get/load/put/invalidate_tables interface as
+cache_store.QueryCache. A missed key is computed by exactly one worker at a
+time: the first one takes a short lease on the key, the others poll until
+its result lands (or the lease times out) instead of running the same query.
+Results are pickled, so only point these at stores you trust.
+"""
+import datetime
+import decimal
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from cache_store import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, QueryCache, normalize_sql
+
+try:
+    import redis
+except ImportError:  # only needed for RedisCacheBackend without a client
+    redis = None
+
+# Pickled results at least this big are zlib-compressed before storing
+COMPRESS_THRESHOLD = 512
+# How long a worker may run a missed query before the others stop waiting on it
+DEFAULT_LEASE_TIMEOUT = float(os.environ.get('QUERY_CACHE_LEASE_TIMEOUT', 30))
+# Run the max_entries sweep on every Nth put rather than counting rows each time
+EVICT_EVERY = 64
+
+_RAW = b'\x00'
+_ZLIB = b'\x01'
+_MISSING = object()
+# Generation row bumped by clear(); part of every generation, even for tables
+# that have never been invalidated and so have no row of their own
+_EPOCH = '*'
+
+
+def dumps(value):
+    """Compact serialized form of a result: pickle, compressed when it pays off"""
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(data, 1)
+        if len(compressed) < len(data):
+            return _ZLIB + compressed
+    return _RAW + data
+
+
+def loads(blob):
+    data = bytes(blob[1:])
+    if blob[:1] == _ZLIB:
+        data = zlib.decompress(data)
+    return pickle.loads(data)
+
+
+def _canonical(value):
+    """JSON-ready form of a key part: equal values always get the same form
+
+    repr() can't be used: set order and default object reprs (with their
+    addresses) differ between processes. Anything that isn't a plain value
+    or container of them raises TypeError.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (tuple, list)):
+        return [_canonical(item) for item in value]
+    # Everything else becomes a one-key object, which a list or scalar can't collide with
+    if isinstance(value, dict):
+        items = [[_canonical(k), _canonical(v)] for k, v in value.items()]
+        return {'dict': sorted(items, key=json.dumps)}
+    if isinstance(value, (set, frozenset)):
+        return {'set': sorted((_canonical(item) for item in value), key=json.dumps)}
+    if isinstance(value, (bytes, bytearray)):
+        return {'bytes': value.hex()}
+    if isinstance(value, decimal.Decimal):
+        return {'decimal': str(value)}
+    if isinstance(value, (datetime.date, datetime.time)):
+        return {type(value).__name__: value.isoformat()}
+    raise TypeError(f"Can't build a shared cache key from {type(value).__name__} values")
+
+
+class SharedCache:
+    """Single-flight load() and counters shared by the cross-process backends"""
+
+    def __init__(self, default_ttl=DEFAULT_TTL, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        self.default_ttl = default_ttl
+        self.lease_timeout = lease_timeout
+        self._lock = threading.Lock()
+        # Counters are per process; the entries themselves are shared
+        self._metrics = {
+            'hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'loads': 0,
+            'stale_puts': 0,
+            'invalidations': 0,
+        }
+
+    def _record(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                self._metrics[name] += value
+
+    @staticmethod
+    def make_key(query, params=()):
+        """Digest of the normalized query and params, identical in every process
+
+        Raises TypeError for params with no canonical form.
+        """
+        canonical = json.dumps([normalize_sql(query), _canonical(params)], separators=(',', ':'))
+        return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+    def get(self, key, default=None):
+        value = self._fetch(key)
+        if value is _MISSING:
+            self._record(misses=1)
+            return default
+        self._record(hits=1)
+        return value
+
+    def load(self, key, compute, tables=(), ttl=None):
+        """Runs compute() for a missed key unless another worker already is
+
+        Waiters poll with backoff and return the other worker's result. If
+        that worker fails or stalls past lease_timeout, a waiter takes over.
+        """
+        token = uuid.uuid4().hex
+        delay = 0.005
+        while not self._try_lease(key, token):
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+            value = self._fetch(key)
+            if value is not _MISSING:
+                self._record(coalesced=1)
+                return value
+        try:
+            # The previous lease holder may have stored it just before we got in
+            value = self._fetch(key)
+            if value is not _MISSING:
+                self._record(coalesced=1)
+                return value
+            generation = self.generation(tables)
+            value = compute()
+            self._record(loads=1)
+            self.put(key, value, tables, ttl=ttl, generation=generation)
+            return value
+        finally:
+            self._release_lease(key, token)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._metrics)
+
+
+@contextmanager
+def _immediate(conn):
+    # Take the write lock up front so concurrent writers queue on busy_timeout
+    # instead of failing to upgrade a read transaction
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+class SQLiteCacheBackend(SharedCache):
+    """Cache in a local SQLite file (WAL mode), shared by all processes on a host
+
+    Eviction past max_entries drops the oldest inserted entries first: reads
+    do not write, so recency of use is not tracked across processes.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires_at REAL NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_entries_created ON entries (created_at);
+    CREATE TABLE IF NOT EXISTS entry_tables (
+        table_name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        PRIMARY KEY (table_name, key)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_entry_tables_key ON entry_tables (key);
+    CREATE TRIGGER IF NOT EXISTS entries_untag AFTER DELETE ON entries BEGIN
+        DELETE FROM entry_tables WHERE key = OLD.key;
+    END;
+    CREATE TABLE IF NOT EXISTS generations (
+        table_name TEXT PRIMARY KEY,
+        generation INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS leases (
+        key TEXT PRIMARY KEY,
+        token TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, default_ttl=DEFAULT_TTL,
+                 lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        super().__init__(default_ttl, lease_timeout)
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._puts = 0
+        self._connect().executescript(self._SCHEMA)
+
+    def _connect(self):
+        # One connection per thread, reopened in forked children
+        pid, conn = getattr(self._local, 'connection', (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = (os.getpid(), conn)
+        return conn
+
+    def _fetch(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at FROM entries WHERE key = ?",
+                           (key,)).fetchone()
+        if row is None:
+            return _MISSING
+        value, expires_at = row
+        if expires_at and expires_at <= time.time():
+            conn.execute("DELETE FROM entries WHERE key = ? AND expires_at = ?", (key, expires_at))
+            return _MISSING
+        return loads(value)
+
+    def _generation(self, conn, tables):
+        generations = []
+        for table in [_EPOCH] + sorted(tables):
+            row = conn.execute("SELECT generation FROM generations WHERE table_name = ?",
+                               (table,)).fetchone()
+            generations.append(row[0] if row else 0)
+        return tuple(generations)
+
+    def generation(self, tables):
+        return self._generation(self._connect(), tables)
+
+    def put(self, key, value, tables=(), ttl=None, generation=None):
+        blob = dumps(value)
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        conn = self._connect()
+        with _immediate(conn):
+            if generation is not None and generation != self._generation(conn, tables):
+                self._record(stale_puts=1)
+                return False
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            conn.execute("INSERT INTO entries VALUES (?, ?, ?, ?)",
+                         (key, blob, now + ttl if ttl else 0, now))
+            conn.executemany("INSERT OR IGNORE INTO entry_tables VALUES (?, ?)",
+                             [(table, key) for table in tables])
+            self._puts += 1
+            if self._puts % EVICT_EVERY == 0:
+                self._evict(conn, now)
+        return True
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM entries WHERE expires_at > 0 AND expires_at <= ?", (now,))
+        excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute("DELETE FROM entries WHERE key IN "
+                         "(SELECT key FROM entries ORDER BY created_at LIMIT ?)", (excess,))
+
+    def invalidate_tables(self, tables):
+        removed = 0
+        conn = self._connect()
+        with _immediate(conn):
+            for table in tables:
+                conn.execute("INSERT INTO generations VALUES (?, 1) ON CONFLICT (table_name) "
+                             "DO UPDATE SET generation = generation + 1", (table,))
+                removed += conn.execute(
+                    "DELETE FROM entries WHERE key IN "
+                    "(SELECT key FROM entry_tables WHERE table_name = ?)", (table,)).rowcount
+        self._record(invalidations=removed)
+        return removed
+
+    def clear(self):
+        conn = self._connect()
+        with _immediate(conn):
+            conn.execute("INSERT INTO generations VALUES (?, 1) ON CONFLICT (table_name) "
+                         "DO UPDATE SET generation = generation + 1", (_EPOCH,))
+            removed = conn.execute("DELETE FROM entries").rowcount
+        self._record(invalidations=removed)
+
+    def _try_lease(self, key, token):
+        now = time.time()
+        conn = self._connect()
+        with _immediate(conn):
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            return conn.execute("INSERT OR IGNORE INTO leases VALUES (?, ?, ?)",
+                                (key, token, now + self.lease_timeout)).rowcount == 1
+
+    def _release_lease(self, key, token):
+        self._connect().execute("DELETE FROM leases WHERE key = ? AND token = ?", (key, token))
+
+    def stats(self):
+        stats = super().stats()
+        entries, size = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()
+        stats.update(entries=entries, bytes=size, max_entries=self.max_entries)
+        return stats
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+# Deletes KEYS[1] only while it still holds our token ARGV[1]
+_RELEASE_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisCacheBackend(SharedCache):
+    """Cache in any Redis-protocol server, shared by all processes and hosts
+
+    `client` can be anything with the redis-py get/set/mget/delete/incr/
+    sadd/smembers/scan_iter/eval methods, so tests and local runs can pass a stub.
+    Redis expires entries itself; bound memory with maxmemory and an
+    allkeys-lru policy on the server rather than max_entries here.
+    """
+
+    def __init__(self, client=None, url='redis://localhost:6379/0', prefix='qc:',
+                 default_ttl=DEFAULT_TTL, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        super().__init__(default_ttl, lease_timeout)
+        if client is None:
+            if redis is None:
+                raise ImportError("RedisCacheBackend needs the redis package (pip install redis) "
+                                  "or an explicit client")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _entry(self, key):
+        return f"{self.prefix}e:{key}"
+
+    def _tag(self, table):
+        return f"{self.prefix}t:{table}"
+
+    def _generation_key(self, table):
+        return f"{self.prefix}g:{table}"
+
+    def _fetch(self, key):
+        blob = self.client.get(self._entry(key))
+        return _MISSING if blob is None else loads(blob)
+
+    def generation(self, tables):
+        keys = [self._generation_key(table) for table in [_EPOCH] + sorted(tables)]
+        return tuple(int(value or 0) for value in self.client.mget(keys))
+
+    def put(self, key, value, tables=(), ttl=None, generation=None):
+        if generation is not None and generation != self.generation(tables):
+            self._record(stale_puts=1)
+            return False
+        ttl = self.default_ttl if ttl is None else ttl
+        self.client.set(self._entry(key), dumps(value), px=int(ttl * 1000) if ttl else None)
+        for table in tables:
+            self.client.sadd(self._tag(table), key)
+        # An invalidation that ran between the check and the set missed this
+        # entry (it wasn't tagged yet), so drop it ourselves
+        if generation is not None and generation != self.generation(tables):
+            self.client.delete(self._entry(key))
+            self._record(stale_puts=1)
+            return False
+        return True
+
+    def invalidate_tables(self, tables):
+        removed = 0
+        for table in tables:
+            self.client.incr(self._generation_key(table))
+            keys = [self._entry(_text(member)) for member in self.client.smembers(self._tag(table))]
+            if keys:
+                removed += self.client.delete(*keys)
+            self.client.delete(self._tag(table))
+        self._record(invalidations=removed)
+        return removed
+
+    def clear(self):
+        # One INCR covers every table, including ones with no g: key yet
+        self.client.incr(self._generation_key(_EPOCH))
+        removed = self._delete_matching(f"{self.prefix}e:*")
+        self._delete_matching(f"{self.prefix}t:*")
+        self._record(invalidations=removed)
+
+    def _delete_matching(self, pattern):
+        keys = list(self.client.scan_iter(match=pattern))
+        return self.client.delete(*keys) if keys else 0
+
+    def _try_lease(self, key, token):
+        return bool(self.client.set(f"{self.prefix}l:{key}", token, nx=True,
+                                    px=int(self.lease_timeout * 1000)))
+
+    def _release_lease(self, key, token):
+        # Compare and delete in one step: between a GET and a DEL our lease
+        # could expire and the key be leased to another worker
+        self.client.eval(_RELEASE_LEASE, 1, f"{self.prefix}l:{key}", token)
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def cache_from_url(url):
+    """Builds a cache from 'memory://', 'sqlite:///path/to/file.db' or 'redis://host:port/db'"""
+    parsed = urlparse(url)
+    if parsed.scheme in ('', 'memory'):
+        return QueryCache()
+    if parsed.scheme == 'sqlite':
+        return SQLiteCacheBackend(parsed.netloc + parsed.path)
+    if parsed.scheme in ('redis', 'rediss'):
+        return RedisCacheBackend(url=url)
+    raise ValueError(f"Unsupported query cache URL: {url!r}")
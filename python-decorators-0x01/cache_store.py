@@ -0,0 +1,567 @@
+import asyncio
+import contextvars
+import os
+import pickle
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+
+# Cache limits, overridable from the environment
+DEFAULT_MAX_ENTRIES = int(os.environ.get('QUERY_CACHE_MAX_ENTRIES', 1024))
+DEFAULT_MAX_BYTES = int(os.environ.get('QUERY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Seconds; 0 keeps entries until they are evicted or invalidated
+DEFAULT_TTL = float(os.environ.get('QUERY_CACHE_TTL', 300))
+# Lock shards per cache; small caches get fewer so each shard keeps this many
+# entries and its eviction order stays close to LRU
+DEFAULT_SHARDS = int(os.environ.get('QUERY_CACHE_SHARDS', 16))
+MIN_SHARD_ENTRIES = 64
+
+# String literals, quoted identifiers, whitespace runs, everything else
+_SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+|[^'\"\s]+")
+_NAME = r'((?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)'
+_READ_TABLES = re.compile(r'\b(?:from|join)\s+' + _NAME)
+_WRITE_TABLES = re.compile(
+    r'\b(?:insert(?:\s+or\s+\w+)?\s+into|replace\s+into|update(?:\s+or\s+\w+)?'
+    r'|delete\s+from|(?:drop|alter)\s+table(?:\s+if\s+exists)?)\s+' + _NAME)
+_WRITE_VERBS = ('insert', 'replace', 'update', 'delete', 'drop', 'alter', 'create')
+
+
+def normalize_sql(query):
+    """Canonical form of a statement for cache keys
+
+    Whitespace is collapsed and everything outside quotes lower-cased (SQL
+    keywords and identifiers are case-insensitive), so formatting differences
+    share one entry while string literals stay exact.
+    """
+    parts = []
+    for token in _SQL_TOKEN.findall(query.strip().rstrip(';').strip()):
+        if token[0] in '\'"':
+            parts.append(token)
+        elif token.isspace():
+            parts.append(' ')
+        else:
+            parts.append(token.lower())
+    return ''.join(parts)
+
+
+def _table_names(pattern, sql):
+    return {match.split('.')[-1].strip('"') for match in pattern.findall(sql)}
+
+
+def tables_read(query):
+    """Tables a SELECT reads from, used to tag its cache entry"""
+    return frozenset(_table_names(_READ_TABLES, normalize_sql(query)))
+
+
+def tables_written(query):
+    """Tables a statement modifies; None if it writes to something unrecognised"""
+    sql = normalize_sql(query)
+    tables = _table_names(_WRITE_TABLES, sql)
+    if not tables and sql.startswith(_WRITE_VERBS):
+        return None
+    return tables
+
+
+def _estimate_size(value):
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class AsyncSingleFlight:
+    """Runs one coroutine per key at a time; concurrent callers await its result
+
+    In-flight calls are tracked per event loop. If the running call is
+    cancelled, one of the waiters starts over instead of failing with it.
+    """
+
+    def __init__(self):
+        self._inflight = weakref.WeakKeyDictionary()
+        self.coalesced = 0
+
+    async def run(self, key, factory):
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.setdefault(loop, {})
+        while key in inflight:
+            future = inflight[key]
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled, not us: take over
+
+        future = inflight[key] = loop.create_future()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved so an unawaited failure isn't logged
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del inflight[key]
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expires_at', 'tables', 'referenced')
+
+    def __init__(self, value, size, expires_at, tables):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.tables = tables
+        # Set on every hit, cleared when the eviction sweep spares the entry
+        self.referenced = False
+
+
+class _Shard:
+    """The entries behind one lock of a QueryCache"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # key -> _Entry; next in line for eviction first
+        self.entries = OrderedDict()
+        self.by_table = {}
+        # key -> Future of the load() computing it
+        self.inflight = {}
+        self.bytes = 0
+        self.metrics = {
+            'evictions': 0,
+            'invalidations': 0,
+            'stale_puts': 0,
+        }
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+        for table in entry.tables:
+            keys = self.by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_table[table]
+
+    def evict(self, keep=None, max_bytes=None):
+        """Second-chance sweep: an entry read since the last pass goes to the back once
+
+        `keep`, the entry just stored, is never the one evicted; if it alone
+        is over the byte limit, the sweep stops once it is all that is left.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        while len(self.entries) > self.max_entries or self.bytes > max_bytes:
+            key, entry = next(iter(self.entries.items()))
+            if key == keep:
+                if len(self.entries) == 1:
+                    break
+                self.entries.move_to_end(key)
+                continue
+            if entry.referenced:
+                entry.referenced = False
+                self.entries.move_to_end(key)
+                continue
+            self.remove(key)
+            self.metrics['evictions'] += 1
+
+
+_COUNTERS = ('hits', 'misses', 'expired', 'coalesced', 'loads')
+
+
+class _ThreadCounts:
+    """One thread's hit/miss counters, held in the cache's threading.local"""
+
+    __slots__ = ('values', '__weakref__')
+
+    def __init__(self):
+        self.values = dict.fromkeys(_COUNTERS, 0)
+
+
+def _retire_counts(lock, live, retired, key):
+    # Finalizer of a _ThreadCounts: its thread has exited, so fold its counts
+    # into the running total and forget it
+    with lock:
+        for name, value in live.pop(key).items():
+            retired[name] += value
+
+# (cache, key) pairs whose compute() is running in this thread or task
+_computing = contextvars.ContextVar('query_cache_computing', default=frozenset())
+
+
+def _reject_reentry(cache, key):
+    if (id(cache), key) in _computing.get():
+        # Waiting for our own in-flight load would never return
+        raise RuntimeError(f"compute() for cache key {key!r} loads that same key")
+
+
+@contextmanager
+def _computing_key(cache, key):
+    """Marks key as being computed for the code running inside the block"""
+    token = _computing.set(_computing.get() | {(id(cache), key)})
+    try:
+        yield
+    finally:
+        _computing.reset(token)
+
+
+class QueryCache:
+    """Thread-safe cache of query results, bounded by entry count and bytes
+
+    Entries expire after their TTL and are tagged with the tables their query
+    reads, so invalidate_tables() drops exactly the results a write may have
+    changed. Each table has a generation counter: a result computed while the
+    table was being written is not stored, so a slow reader cannot re-cache
+    data that was already stale.
+
+    Keys are spread over `shards` independently locked shards, each holding
+    its share of the limits. Hits take no lock at all: the dict lookup is
+    atomic under the GIL, and instead of reordering an LRU list a hit only
+    marks its entry, which the eviction sweep then spares once (CLOCK, an
+    LRU approximation). load() runs one compute() per key no matter how many
+    threads miss it together; the rest wait for that result.
+
+    A value may be bigger than its shard's share of max_bytes (up to
+    max_bytes itself): the shard then keeps only that entry, and the other
+    shards evict until the total is back under max_bytes.
+
+    load() and load_async() coalesce separately: a thread and a coroutine
+    missing the same key at the same time each run compute(). A compute()
+    that loads its own key raises RuntimeError rather than deadlocking.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 default_ttl=DEFAULT_TTL, shards=DEFAULT_SHARDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        shards = max(1, min(shards, max_entries // MIN_SHARD_ENTRIES))
+        self._shards = [_Shard(max(1, max_entries // shards), max_bytes // shards) for _ in range(shards)]
+        # Bumped under this lock, read without it
+        self._generation_lock = threading.Lock()
+        self._generations = {}
+        # clear() invalidates every table at once
+        self._epoch = 0
+        # Hit/miss counters, one dict per thread so hits stay lock-free;
+        # stats() sums them. An exited thread's dict is folded into
+        # _retired_counts, so thread-pool churn doesn't grow _thread_counts.
+        self._local = threading.local()
+        self._counts_lock = threading.Lock()
+        self._thread_counts = {}
+        self._retired_counts = dict.fromkeys(_COUNTERS, 0)
+        self._async_flights = AsyncSingleFlight()
+
+    @staticmethod
+    def make_key(query, params=()):
+        return normalize_sql(query), params
+
+    def _count(self, name):
+        counts = getattr(self._local, 'counts', None)
+        if counts is None:
+            counts = self._local.counts = _ThreadCounts()
+            key = id(counts.values)
+            with self._counts_lock:
+                self._thread_counts[key] = counts.values
+            # The thread-local drops `counts` when the thread exits
+            weakref.finalize(counts, _retire_counts, self._counts_lock,
+                             self._thread_counts, self._retired_counts, key)
+        counts.values[name] += 1
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def generation(self, tables):
+        """Snapshot to pass to put(); taken before running the query"""
+        return (self._epoch,) + tuple(self._generations.get(table, 0) for table in sorted(tables))
+
+    def _live(self, shard, key):
+        """The unexpired entry for key, or None; counts nothing but expiry"""
+        entry = shard.entries.get(key)
+        if entry is not None and entry.expires_at and entry.expires_at <= time.monotonic():
+            with shard.lock:
+                if shard.entries.get(key) is entry:
+                    shard.remove(key)
+                    self._count('expired')
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        entry = self._live(self._shard(key), key)
+        if entry is None:
+            self._count('misses')
+            return default
+        entry.referenced = True
+        self._count('hits')
+        return entry.value
+
+    def load(self, key, compute, tables=(), ttl=None):
+        """Runs compute() for a missed key and stores its result
+
+        Threads loading a key that is already being computed wait for that
+        computation and get its result, or its exception, instead of
+        running the query again.
+        """
+        _reject_reentry(self, key)
+        shard = self._shard(key)
+        with shard.lock:
+            future = shard.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = shard.inflight[key] = Future()
+        if not leader:
+            self._count('coalesced')
+            return future.result()
+
+        try:
+            # A load that finished between our miss and now has stored it already
+            entry = self._live(shard, key)
+            if entry is not None:
+                self._count('coalesced')
+                value = entry.value
+            else:
+                generation = self.generation(tables)
+                with _computing_key(self, key):
+                    value = compute()
+                self._count('loads')
+                self.put(key, value, tables, ttl=ttl, generation=generation)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with shard.lock:
+                del shard.inflight[key]
+
+    async def load_async(self, key, compute, tables=(), ttl=None):
+        """load() for a coroutine function; concurrent awaits of a key share one call"""
+        async def load():
+            generation = self.generation(tables)
+            with _computing_key(self, key):
+                value = await compute()
+            self._count('loads')
+            self.put(key, value, tables, ttl=ttl, generation=generation)
+            return value
+        _reject_reentry(self, key)
+        return await self._async_flights.run(key, load)
+
+    def put(self, key, value, tables=(), ttl=None, generation=None):
+        """Stores a result; returns False if it was too big or already stale"""
+        tables = frozenset(tables)
+        shard = self._shard(key)
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return False
+        ttl = self.default_ttl if ttl is None else ttl
+        entry = _Entry(value, size, time.monotonic() + ttl if ttl else 0, tables)
+        with shard.lock:
+            # Invalidation bumps generations before it sweeps the shards, so a
+            # check made under the shard lock can't slip between the two
+            if generation is not None and generation != self.generation(tables):
+                shard.metrics['stale_puts'] += 1
+                return False
+            if key in shard.entries:
+                shard.remove(key)
+            shard.entries[key] = entry
+            shard.bytes += size
+            for table in tables:
+                shard.by_table.setdefault(table, set()).add(key)
+            shard.evict(key)
+        if size > shard.max_bytes:
+            self._reclaim(shard)
+        return True
+
+    def _reclaim(self, borrower):
+        """Evicts from the other shards until the total is back within max_bytes"""
+        excess = sum(shard.bytes for shard in self._shards) - self.max_bytes
+        for shard in self._shards:
+            if excess <= 0:
+                break
+            if shard is borrower:
+                continue
+            with shard.lock:
+                before = shard.bytes
+                shard.evict(max_bytes=max(0, before - excess))
+                excess -= before - shard.bytes
+
+    def invalidate_tables(self, tables):
+        """Drops every entry reading any of `tables`; returns how many went"""
+        tables = list(tables)
+        with self._generation_lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                for table in tables:
+                    for key in list(shard.by_table.get(table, ())):
+                        shard.remove(key)
+                        shard.metrics['invalidations'] += 1
+                        removed += 1
+        return removed
+
+    def clear(self):
+        with self._generation_lock:
+            self._epoch += 1
+        for shard in self._shards:
+            with shard.lock:
+                shard.metrics['invalidations'] += len(shard.entries)
+                shard.entries.clear()
+                shard.by_table.clear()
+                shard.bytes = 0
+
+    def stats(self):
+        with self._counts_lock:
+            stats = dict(self._retired_counts)
+            for counts in self._thread_counts.values():
+                for name, value in counts.items():
+                    stats[name] += value
+        # Callers served by another caller's in-flight load
+        stats['coalesced'] += self._async_flights.coalesced
+        stats.update(evictions=0, invalidations=0, stale_puts=0, entries=0, bytes=0)
+        for shard in self._shards:
+            with shard.lock:
+                for name, value in shard.metrics.items():
+                    stats[name] += value
+                stats['entries'] += len(shard.entries)
+                stats['bytes'] += shard.bytes
+        stats['max_entries'] = self.max_entries
+        stats['max_bytes'] = self.max_bytes
+        stats['shards'] = len(self._shards)
+        return stats
+
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def __contains__(self, key):
+        return key in self._shard(key).entries
+
+
+# In-process cache used unless configure_cache() or QUERY_CACHE_URL picks another
+default_cache = QueryCache()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure_cache(cache):
+    """Sets the cache shared by cache_query and the invalidation in transactional
+
+    Accepts a QueryCache, a backend from cache_backends, or a URL such as
+    'sqlite:///tmp/query_cache.db' or 'redis://localhost:6379/0'.
+    """
+    global _cache
+    if isinstance(cache, str):
+        from cache_backends import cache_from_url
+        cache = cache_from_url(cache)
+    with _cache_lock:
+        _cache = cache
+    return cache
+
+
+def get_cache():
+    """Returns the shared cache, built from QUERY_CACHE_URL on first use if set"""
+    global _cache
+    if _cache is None:
+        url = os.environ.get('QUERY_CACHE_URL')
+        if not url:
+            return default_cache
+        with _cache_lock:
+            if _cache is None:
+                from cache_backends import cache_from_url
+                _cache = cache_from_url(url)
+    return _cache
+
+
+_PROMETHEUS_COUNTERS = {
+    'hits': 'Lookups answered from the cache.',
+    'misses': 'Lookups that found nothing.',
+    'coalesced': 'Misses served by a load another caller already had in flight.',
+    'loads': 'Queries run to fill the cache.',
+    'stale_puts': 'Results dropped because a write raced the query.',
+    'invalidations': 'Entries dropped by writes.',
+    'evictions': 'Entries dropped to stay within the size limits.',
+}
+
+
+def prometheus_text(cache=None):
+    """Counters and size of the shared cache in the Prometheus text exposition format"""
+    stats = (cache if cache is not None else get_cache()).stats()
+    lines = []
+    for name, help_text in _PROMETHEUS_COUNTERS.items():
+        if name in stats:
+            lines += [f'# HELP query_cache_{name}_total {help_text}',
+                      f'# TYPE query_cache_{name}_total counter',
+                      f'query_cache_{name}_total {stats[name]}']
+    for name in ('entries', 'bytes'):
+        if name in stats:
+            lines += [f'# TYPE query_cache_{name} gauge', f'query_cache_{name} {stats[name]}']
+    return '\n'.join(lines) + '\n'
+
+
+class _WriteTracker:
+    """sqlite3 trace callback collecting the tables a transaction writes"""
+
+    def __init__(self):
+        self.written = set()
+        self.unknown = False
+
+    def __call__(self, statement):
+        tables = tables_written(statement)
+        if tables is None:
+            self.unknown = True
+        else:
+            self.written.update(tables)
+
+    def invalidate(self, cache):
+        if self.unknown:
+            cache.clear()
+        elif self.written:
+            cache.invalidate_tables(self.written)
+
+
+@contextmanager
+def track_writes(conn, cache=None):
+    """Invalidates the tables written on `conn` once the block exits cleanly
+
+    Statements are observed through sqlite3's trace callback, so writes made
+    by helpers deep inside the block are seen too. Call it around the commit:
+    entries go only after the data is durable, and nothing is dropped for a
+    transaction that rolls back.
+    """
+    tracker = _WriteTracker()
+    conn.set_trace_callback(tracker)
+    try:
+        yield tracker.written
+    finally:
+        conn.set_trace_callback(None)
+    tracker.invalidate(cache if cache is not None else get_cache())
+
+
+@asynccontextmanager
+async def track_writes_async(conn, cache=None):
+    """track_writes for aiosqlite connections"""
+    tracker = _WriteTracker()
+    await conn.set_trace_callback(tracker)
+    try:
+        yield tracker.written
+    finally:
+        await conn.set_trace_callback(None)
+    cache = cache if cache is not None else get_cache()
+    if isinstance(cache, QueryCache):
+        tracker.invalidate(cache)
+    else:
+        await asyncio.to_thread(tracker.invalidate, cache)
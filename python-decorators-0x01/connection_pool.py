@@ -0,0 +1,304 @@
+import functools
+import inspect
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlite_profile import connect
+from write_batch import current_batch
+
+# Pool settings, overridable from the environment
+DB_PATH = os.environ.get('SQLITE_DB_PATH', 'users.db')
+DEFAULT_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 5))
+DEFAULT_CHECKOUT_TIMEOUT = float(os.environ.get('SQLITE_POOL_TIMEOUT', 30))
+DEFAULT_THREAD_AFFINITY = os.environ.get('SQLITE_POOL_AFFINITY', '0') == '1'
+
+# Applied once to every new connection, e.g. {'foreign_keys': 'ON'}
+DEFAULT_PRAGMAS = {}
+
+_ON_OFF = re.compile(r'(?i)ON|OFF|TRUE|FALSE|YES|NO|[01]')
+_INTEGER = re.compile(r'-?[0-9]+')
+
+# Pragmas a pool may set on its connections, and the values each one accepts.
+# Both end up in an f-string PRAGMA statement, so nothing else gets through.
+ALLOWED_PRAGMAS = {
+    'busy_timeout': _INTEGER,
+    'cache_size': _INTEGER,
+    'foreign_keys': _ON_OFF,
+    'journal_mode': re.compile(r'(?i)DELETE|TRUNCATE|PERSIST|MEMORY|WAL|OFF'),
+    'journal_size_limit': _INTEGER,
+    'locking_mode': re.compile(r'(?i)NORMAL|EXCLUSIVE'),
+    'mmap_size': _INTEGER,
+    'query_only': _ON_OFF,
+    'recursive_triggers': _ON_OFF,
+    'synchronous': re.compile(r'(?i)OFF|NORMAL|FULL|EXTRA|[0-3]'),
+    'temp_store': re.compile(r'(?i)DEFAULT|FILE|MEMORY|[0-2]'),
+    'wal_autocheckpoint': _INTEGER,
+}
+
+
+def validate_pragmas(pragmas=None):
+    """Copy of `pragmas` (DEFAULT_PRAGMAS if None), checked against ALLOWED_PRAGMAS"""
+    pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+    for name, value in pragmas.items():
+        allowed = ALLOWED_PRAGMAS.get(name)
+        if allowed is None:
+            raise ValueError(f"Unsupported pragma {name!r}; choose from {sorted(ALLOWED_PRAGMAS)}")
+        if not allowed.fullmatch(str(value)):
+            raise ValueError(f"Invalid value for pragma {name}: {value!r}")
+    return pragmas
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection frees up within the checkout timeout"""
+
+
+class SQLiteConnectionPool:
+    """Thread-safe pool of warm sqlite3 connections, opened lazily up to `size`
+
+    thread_affinity=True hands a thread the same connection it used last time
+    whenever that connection is idle, so its page cache and prepared
+    statements stay warm for that thread's queries.
+    """
+
+    def __init__(self, path=DB_PATH, size=DEFAULT_POOL_SIZE,
+                 checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT,
+                 thread_affinity=DEFAULT_THREAD_AFFINITY, pragmas=None, profile=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.path = path
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.thread_affinity = thread_affinity
+        self.pragmas = validate_pragmas(pragmas)
+        # sqlite_profile name; None means SQLITE_PROFILE
+        self.profile = profile
+
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # Most recently released last, so pop() returns the warmest connection
+        self._idle = []
+        self._local = threading.local()
+        self._closed = False
+        self._metrics = {
+            'checkouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'affinity_hits': 0,
+            'waits': 0,
+            'in_use': 0,
+            'checkout_time_total': 0.0,
+            'checkout_time_max': 0.0,
+        }
+
+    def _record(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                self._metrics[name] += value
+
+    def _create(self):
+        # Connections move between threads, one holder at a time
+        connection = connect(self.path, profile=self.profile, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        self._record(created=1)
+        return connection
+
+    def _discard(self, connection):
+        self._record(discarded=1)
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+    def _take_idle(self):
+        with self._lock:
+            if not self._idle:
+                return None
+            preferred = getattr(self._local, 'connection', None)
+            if self.thread_affinity and preferred is not None:
+                for index, candidate in enumerate(self._idle):
+                    if candidate is preferred:
+                        self._metrics['affinity_hits'] += 1
+                        return self._idle.pop(index)
+            return self._idle.pop()
+
+    def acquire(self, timeout=None):
+        """Checks out a connection, waiting up to `timeout` seconds for a free slot"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.perf_counter()
+        waited = 0
+        if not self._slots.acquire(blocking=False):
+            waited = 1
+            if not self._slots.acquire(timeout=timeout):
+                raise PoolTimeout(f"No connection available after waiting {timeout}s "
+                                  f"(pool size {self.size})")
+        try:
+            connection = self._take_idle() or self._create()
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._local.connection = connection
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._metrics['checkouts'] += 1
+            self._metrics['waits'] += waited
+            self._metrics['in_use'] += 1
+            self._metrics['checkout_time_total'] += elapsed
+            self._metrics['checkout_time_max'] = max(self._metrics['checkout_time_max'], elapsed)
+        return connection
+
+    def release(self, connection):
+        """Returns a connection to the pool, rolling back anything left uncommitted
+
+        After close() the connection is closed instead of pooled.
+        """
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+            # Checked under the lock so close() can't empty the idle list
+            # between the check and the append
+            with self._lock:
+                pooled = not self._closed
+                if pooled:
+                    self._idle.append(connection)
+            if not pooled:
+                self._discard(connection)
+        except sqlite3.Error:
+            self._discard(connection)
+        finally:
+            self._record(in_use=-1)
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def stats(self):
+        """Returns a snapshot of the checkout counters and latencies (seconds)"""
+        with self._lock:
+            stats = dict(self._metrics)
+            stats['idle'] = len(self._idle)
+        stats['size'] = self.size
+        stats['checkout_time_avg'] = (stats['checkout_time_total'] / stats['checkouts']
+                                      if stats['checkouts'] else 0.0)
+        return stats
+
+    def close(self):
+        """Closes every idle connection; checked-out ones close when released"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._discard(connection)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure_pool(path=DB_PATH, size=DEFAULT_POOL_SIZE, **kwargs):
+    """Replaces the shared pool, e.g. configure_pool('users.db', size=8, thread_affinity=True)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = SQLiteConnectionPool(path=path, size=size, **kwargs)
+        return _pool
+
+
+def get_pool():
+    """Returns the shared pool, creating it with the default settings on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SQLiteConnectionPool()
+    return _pool
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def with_pooled_connection(func):
+    """Passes func a warm connection from the shared pool as its first argument
+
+    This is the with_db_connection of the numbered scripts. Calls made inside
+    write_batch() get the batch's connection instead, and coroutine functions
+    get an aiosqlite connection from async_pool.
+    """
+    if inspect.iscoroutinefunction(func):
+        from async_pool import async_connection
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with async_connection() as conn:
+                return await func(conn, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        batch = current_batch()
+        if batch is not None:
+            # Calls inside write_batch() share its connection and transaction
+            return func(batch.conn, *args, **kwargs)
+        try:
+            with get_pool().connection() as conn:
+                return func(conn, *args, **kwargs)
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            raise
+    return wrapper
+
+
+@with_pooled_connection
+def get_user_by_id(conn, user_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+    return cursor.fetchone()
+
+
+def _get_user_by_id_unpooled(user_id):
+    conn = connect(DB_PATH)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        return cursor.fetchone()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    calls = 5000
+
+    started = time.perf_counter()
+    for i in range(calls):
+        _get_user_by_id_unpooled(i % 3 + 1)
+    unpooled = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(calls):
+        get_user_by_id(i % 3 + 1)
+    pooled = time.perf_counter() - started
+
+    print(f"User 1: {get_user_by_id(1)}")
+    print(f"{calls} lookups, new connection per call: {unpooled:.3f}s "
+          f"({calls / unpooled:,.0f} calls/sec)")
+    print(f"{calls} lookups, pooled connection:       {pooled:.3f}s "
+          f"({calls / pooled:,.0f} calls/sec)")
+
+    stats = pool_stats()
+    print(f"Pool: {stats['created']} connections created for {stats['checkouts']} checkouts, "
+          f"avg checkout {stats['checkout_time_avg'] * 1e6:.1f}us, "
+          f"max {stats['checkout_time_max'] * 1e6:.1f}us")
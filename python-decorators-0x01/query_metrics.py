@@ -0,0 +1,297 @@
+"""Per-query latency and row-count metrics for the decorated query functions.
+
+    from query_metrics import instrument, prometheus_text
+
+    @instrument                      # or @instrument(sample_rate=0.01)
+    def fetch_all_users(query): ...
+
+    print(prometheus_text())         # or metrics_snapshot() for a dict
+
+Queries are grouped by fingerprint: the SQL with literals replaced by ?, so
+"WHERE id = 1" and "WHERE id = 2" share one latency histogram.
+"""
+import functools
+import inspect
+import os
+import re
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from cache_store import normalize_sql
+
+# Fraction of calls that are timed; 1 in round(1 / rate) calls is measured
+DEFAULT_SAMPLE_RATE = float(os.environ.get('QUERY_METRICS_SAMPLE_RATE', 1.0))
+
+# Histogram bucket upper bounds in nanoseconds, 50us to 10s
+BUCKET_BOUNDS_NS = tuple(int(ms * 1_000_000) for ms in (
+    0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?(?:0x[0-9a-f]+|\d+(?:\.\d+)?(?:e[+-]?\d+)?)\b")
+_PLACEHOLDER = re.compile(r"(?<!\w)(?:[:@$]\w+|\?\d*)")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(query):
+    """SQL with literals and placeholders replaced by ?; IN lists collapse to (?+)"""
+    sql = _STRING.sub('?', normalize_sql(query))
+    # Placeholders first, or the digits of $1 and ?2 would be taken for numbers
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _VALUE_LIST.sub('(?+)', sql)
+
+
+def find_query(args, kwargs):
+    """The SQL a decorated function was called with: query= or the first str argument"""
+    query = kwargs.get('query')
+    if query is None:
+        query = next((arg for arg in args if isinstance(arg, str)), None)
+    return query
+
+
+class QueryStats:
+    """Latency histogram and counters for one fingerprint"""
+
+    __slots__ = ('count', 'errors', 'rows', 'total_ns', 'max_ns', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        # One slot per bound plus +Inf; not cumulative
+        self.buckets = [0] * (len(BUCKET_BOUNDS_NS) + 1)
+
+    def percentile(self, fraction):
+        """Upper bound (ns) of the bucket holding the given fraction of calls"""
+        if not self.count:
+            return 0
+        target = fraction * self.count
+        seen = 0
+        for index, hits in enumerate(self.buckets):
+            seen += hits
+            if seen >= target:
+                if index < len(BUCKET_BOUNDS_NS):
+                    return min(BUCKET_BOUNDS_NS[index], self.max_ns)
+                return self.max_ns
+        return self.max_ns
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_ms': self.total_ns / 1e6,
+            'avg_ms': self.total_ns / self.count / 1e6 if self.count else 0.0,
+            'max_ms': self.max_ns / 1e6,
+            'p50_ms': self.percentile(0.50) / 1e6,
+            'p95_ms': self.percentile(0.95) / 1e6,
+            'p99_ms': self.percentile(0.99) / 1e6,
+        }
+
+
+class _ThreadCell:
+    """One thread's call count, held in a CallCounter's threading.local"""
+
+    __slots__ = ('cell', '__weakref__')
+
+    def __init__(self):
+        self.cell = [0]
+
+
+def _retire_cell(lock, cells, retired, key):
+    # Finalizer of a _ThreadCell: its thread has exited, so fold its count
+    # into the running total and forget it
+    with lock:
+        retired[0] += cells.pop(key)[0]
+
+
+class CallCounter:
+    """Call count for one decorated function: a plain int per thread, summed on read
+
+    Counting stays lock-free on the hot path; only a thread's first call
+    takes the lock, to register its cell. When a thread exits, its cell is
+    folded into a retired total, so thread-pool churn doesn't grow _cells.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cells = {}
+        self._retired = [0]
+
+    def increment(self):
+        """Counts one call; returns this thread's running count"""
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = self._local.holder = _ThreadCell()
+            key = id(holder.cell)
+            with self._lock:
+                self._cells[key] = holder.cell
+            # The thread-local drops `holder` when the thread exits
+            weakref.finalize(holder, _retire_cell, self._lock, self._cells, self._retired, key)
+        cell = holder.cell
+        cell[0] += 1
+        return cell[0]
+
+    def total(self):
+        with self._lock:
+            return self._retired[0] + sum(cell[0] for cell in self._cells.values())
+
+
+class QueryMetrics:
+    """Thread-safe registry of QueryStats keyed by fingerprint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        # function name -> CallCounter per decorated copy, sampled or not
+        self._calls = {}
+
+    def register(self, name):
+        counter = CallCounter()
+        with self._lock:
+            self._calls.setdefault(name, []).append(counter)
+        return counter
+
+    def record(self, query, elapsed_ns, rows=None, error=False):
+        key = fingerprint(query)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats()
+            stats.count += 1
+            stats.total_ns += elapsed_ns
+            if elapsed_ns > stats.max_ns:
+                stats.max_ns = elapsed_ns
+            stats.buckets[bisect_left(BUCKET_BOUNDS_NS, elapsed_ns)] += 1
+            if error:
+                stats.errors += 1
+            if rows:
+                stats.rows += rows
+
+    def calls(self):
+        """Total calls per decorated function, including unsampled ones"""
+        with self._lock:
+            counters = {name: list(copies) for name, copies in self._calls.items()}
+        return {name: sum(counter.total() for counter in copies)
+                for name, copies in counters.items()}
+
+    def snapshot(self):
+        """{fingerprint: {count, errors, rows, avg/max/p50/p95/p99 in ms}}"""
+        with self._lock:
+            return {key: stats.as_dict() for key, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def prometheus_text(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = [
+            '# HELP sql_query_duration_seconds Query wall time by fingerprint (sampled calls).',
+            '# TYPE sql_query_duration_seconds histogram',
+        ]
+        with self._lock:
+            items = [(key, stats.count, stats.errors, stats.rows, stats.total_ns, list(stats.buckets))
+                     for key, stats in self._stats.items()]
+        for key, count, _, _, total_ns, buckets in items:
+            label = f'fingerprint="{_escape(key)}"'
+            cumulative = 0
+            for bound, hits in zip(BUCKET_BOUNDS_NS + (None,), buckets):
+                cumulative += hits
+                le = '+Inf' if bound is None else repr(bound / 1e9)
+                lines.append(f'sql_query_duration_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f'sql_query_duration_seconds_sum{{{label}}} {total_ns / 1e9}')
+            lines.append(f'sql_query_duration_seconds_count{{{label}}} {count}')
+
+        lines += ['# HELP sql_query_rows_total Rows returned (sampled calls).',
+                  '# TYPE sql_query_rows_total counter']
+        lines += [f'sql_query_rows_total{{fingerprint="{_escape(key)}"}} {rows}'
+                  for key, _, _, rows, _, _ in items]
+        lines += ['# HELP sql_query_errors_total Queries that raised (sampled calls).',
+                  '# TYPE sql_query_errors_total counter']
+        lines += [f'sql_query_errors_total{{fingerprint="{_escape(key)}"}} {errors}'
+                  for key, _, errors, _, _, _ in items]
+        lines += ['# HELP sql_function_calls_total Calls per instrumented function, sampled or not.',
+                  '# TYPE sql_function_calls_total counter']
+        lines += [f'sql_function_calls_total{{function="{_escape(name)}"}} {calls}'
+                  for name, calls in self.calls().items()]
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _row_count(result):
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+registry = QueryMetrics()
+
+
+def instrument(func=None, *, sample_rate=None, metrics=None):
+    """Times the decorated query function and records it under its SQL fingerprint
+
+    Only 1 in round(1 / sample_rate) calls is timed; the rest pay for one
+    counter increment and a modulo, so hot paths can run with a low rate.
+    """
+    if func is None:
+        return functools.partial(instrument, sample_rate=sample_rate, metrics=metrics)
+    metrics = metrics or registry
+    rate = DEFAULT_SAMPLE_RATE if sample_rate is None else sample_rate
+    every = max(1, round(1 / rate)) if rate > 0 else 0
+    calls = metrics.register(func.__qualname__)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            call = calls.increment()
+            if not every or call % every:
+                return await func(*args, **kwargs)
+            query = find_query(args, kwargs)
+            if query is None:
+                return await func(*args, **kwargs)
+            started = time.perf_counter_ns()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                metrics.record(query, time.perf_counter_ns() - started, error=True)
+                raise
+            metrics.record(query, time.perf_counter_ns() - started, _row_count(result))
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        call = calls.increment()
+        if not every or call % every:
+            return func(*args, **kwargs)
+        query = find_query(args, kwargs)
+        if query is None:
+            return func(*args, **kwargs)
+        started = time.perf_counter_ns()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            metrics.record(query, time.perf_counter_ns() - started, error=True)
+            raise
+        metrics.record(query, time.perf_counter_ns() - started, _row_count(result))
+        return result
+    return wrapper
+
+
+def metrics_snapshot():
+    return registry.snapshot()
+
+
+def prometheus_text():
+    return registry.prometheus_text()
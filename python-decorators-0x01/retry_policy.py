@@ -0,0 +1,162 @@
+"""Retry policy pieces used by retry_on_failure.
+
+RetryPolicy     exponential backoff with full jitter, retrying only transient errors
+CircuitBreaker  fails fast once a target keeps failing, probing it again after a pause
+RetryBudget     caps retries to a fraction of calls, so a storm can't multiply load
+"""
+import random
+import sqlite3
+import threading
+import time
+
+# Substrings of sqlite3.OperationalError messages worth retrying
+TRANSIENT_MESSAGES = ('database is locked', 'database table is locked', 'busy',
+                      'temporarily unavailable')
+# MySQL: lock wait timeout, deadlock, server gone away, lost connection, can't connect
+TRANSIENT_MYSQL_ERRNOS = {1205, 1213, 2003, 2006, 2013}
+
+
+def is_transient(error):
+    """True for errors a retry can fix: lock contention and dropped connections"""
+    if isinstance(error, sqlite3.OperationalError):
+        message = str(error).lower()
+        return any(text in message for text in TRANSIENT_MESSAGES)
+    return getattr(error, 'errno', None) in TRANSIENT_MYSQL_ERRNOS
+
+
+class RetryPolicy:
+    """How many times to retry, which errors qualify and how long to wait
+
+    Waits are drawn uniformly from [0, min(max_delay, base_delay * 2**attempt)]
+    ("full jitter"), so workers that failed together retry at different times
+    instead of colliding on the lock again.
+    """
+
+    def __init__(self, retries=3, base_delay=0.05, max_delay=2.0, classifier=is_transient):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.classifier = classifier
+
+    def should_retry(self, error, attempt):
+        return attempt < self.retries and self.classifier(error)
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a target whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive transient failures
+
+    While open every call fails fast with CircuitOpenError. After
+    `reset_timeout` seconds it goes half-open and lets `half_open_probes`
+    calls through: a success closes it, a failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=10.0, half_open_probes=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def before_call(self):
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"Circuit for {self.name} is open")
+                self._state = self.HALF_OPEN
+                self._probes = 0
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    raise CircuitOpenError(f"Circuit for {self.name} is half-open, probe in flight")
+                self._probes += 1
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def record_ignored(self):
+        """Releases a half-open probe slot after an error that says nothing about health"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes:
+                self._probes -= 1
+
+
+class RetryBudget:
+    """Token bucket allowing retries up to `ratio` of calls, plus a small floor
+
+    Every call deposits `ratio` tokens and every retry spends one, so under a
+    full outage retries add at most ratio x the normal load instead of
+    multiplying it by the retry count.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1.0, max_tokens=10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._refilled_at = time.monotonic()
+
+    def _refill(self, amount):
+        self._tokens = min(self.max_tokens, self._tokens + amount)
+
+    def record_call(self):
+        with self._lock:
+            self._refill(self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill((now - self._refilled_at) * self.min_per_second)
+            self._refilled_at = now
+            # Tolerance for deposits like 0.1 * 10 summing to 0.9999...
+            if self._tokens >= 1 - 1e-9:
+                self._tokens = max(0.0, self._tokens - 1)
+                return True
+            return False
+
+
+_breakers = {}
+_budgets = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name, **kwargs):
+    """The shared circuit breaker for a target, created on first use"""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, **kwargs)
+        return _breakers[name]
+
+
+def get_budget(name, **kwargs):
+    """The shared retry budget for a target, created on first use"""
+    with _registry_lock:
+        if name not in _budgets:
+            _budgets[name] = RetryBudget(**kwargs)
+        return _budgets[name]
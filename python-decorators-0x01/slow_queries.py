@@ -0,0 +1,266 @@
+"""Slow-query log with automatic plan capture.
+
+    from slow_queries import slow_query_log
+
+    @with_db_connection
+    @slow_query_log(threshold_ms=50)
+    def get_user_by_email(conn, query, params): ...
+
+A call that runs past the threshold has its plan captured on the same
+connection (EXPLAIN QUERY PLAN for sqlite, EXPLAIN for MySQL) and written to a
+rotating report. Plans are deduplicated by SQL fingerprint, so a hot slow
+query is explained once. After SlowQueryLog.replan() (e.g. once an index is
+added) it is explained again and reported only if the plan changed.
+
+Coroutine functions on an aiosqlite connection (async_pool) are timed and
+explained the same way, without blocking the event loop on the EXPLAIN.
+"""
+import functools
+import inspect
+import logging
+import os
+import sqlite3
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+from query_metrics import find_query, fingerprint
+
+DEFAULT_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+DEFAULT_REPORT_PATH = os.environ.get('SLOW_QUERY_LOG', 'slow_queries.log')
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+_EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete', 'replace')
+
+
+def find_params(args, kwargs):
+    """Bound parameters of a decorated call: params= or the first tuple/list/dict argument"""
+    params = kwargs.get('params')
+    if params is None:
+        params = next((arg for arg in args if isinstance(arg, (tuple, list, dict))), ())
+    return params
+
+
+def _sqlite_plan(rows):
+    # Rows are (id, parent, notused, detail); indent by nesting depth
+    depth = {0: -1}
+    lines, scans = [], []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+        words = detail.split()
+        if words[:1] == ['SCAN'] and 'INDEX' not in words and len(words) > 1:
+            scans.append(words[1])
+    return lines, scans
+
+
+def explain(conn, query, params=()):
+    """Returns (plan lines, tables read by full scan) for a statement"""
+    if isinstance(conn, sqlite3.Connection):
+        return _sqlite_plan(conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall())
+
+    # MySQL (mysql-connector): one row per table in the join
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"EXPLAIN {query}", params)
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    lines = [', '.join(f"{name}={value}" for name, value in row.items() if value is not None)
+             for row in rows]
+    scans = [row['table'] for row in rows if row.get('type') == 'ALL']
+    return lines, scans
+
+
+async def explain_async(conn, query, params=()):
+    """explain() for an aiosqlite connection"""
+    async with conn.execute(f"EXPLAIN QUERY PLAN {query}", params) as cursor:
+        return _sqlite_plan(await cursor.fetchall())
+
+
+class SlowQueryLog:
+    """Collects slow queries by fingerprint and writes each new plan to a rotating file"""
+
+    def __init__(self, path=DEFAULT_REPORT_PATH, threshold_ms=DEFAULT_THRESHOLD_MS,
+                 max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self._handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                            backupCount=backup_count, delay=True)
+        self._handler.setFormatter(logging.Formatter('%(message)s'))
+        self._lock = threading.Lock()
+        # fingerprint -> {'count', 'total_ms', 'max_ms', 'explained', 'plan', 'full_scans'}
+        self._seen = {}
+
+    def _claim(self, key, elapsed_ms):
+        """Counts one slow run; returns its entry if this caller should EXPLAIN it"""
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None:
+                entry = self._seen[key] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                           'explained': False, 'plan': [], 'full_scans': []}
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            needs_plan = not entry['explained']
+            # Claimed here so concurrent slow runs don't all EXPLAIN
+            entry['explained'] = True
+        if not needs_plan or not key.startswith(_EXPLAINABLE):
+            return None
+        return entry
+
+    def _report(self, entry, key, query, params, elapsed_ms, plan, scans):
+        """Stores a fresh plan and writes it out unless it is the one already reported"""
+        with self._lock:
+            if entry['plan'] == plan:
+                return
+            entry.update(plan=plan, full_scans=scans)
+        self._write(key, query, params, elapsed_ms, plan, scans)
+
+    def observe(self, conn, query, params, elapsed_ms):
+        """Records one slow execution, explaining it if its fingerprint is new"""
+        key = fingerprint(query)
+        entry = self._claim(key, elapsed_ms)
+        if entry is None:
+            return
+        try:
+            plan, scans = explain(conn, query, params)
+        except Exception as e:
+            plan, scans = [f"(plan unavailable: {e})"], []
+        self._report(entry, key, query, params, elapsed_ms, plan, scans)
+
+    async def observe_async(self, conn, query, params, elapsed_ms):
+        """observe() for coroutine callers on an aiosqlite connection"""
+        key = fingerprint(query)
+        entry = self._claim(key, elapsed_ms)
+        if entry is None:
+            return
+        try:
+            plan, scans = await explain_async(conn, query, params)
+        except Exception as e:
+            plan, scans = [f"(plan unavailable: {e})"], []
+        self._report(entry, key, query, params, elapsed_ms, plan, scans)
+
+    def replan(self):
+        """Explains every fingerprint again on its next slow run, e.g. after adding an index"""
+        with self._lock:
+            for entry in self._seen.values():
+                entry['explained'] = False
+
+    def _write(self, key, query, params, elapsed_ms, plan, scans):
+        lines = [
+            f"{time.strftime('%Y-%m-%d %H:%M:%S')} slow query {elapsed_ms:.1f} ms "
+            f"(threshold {self.threshold_ms:g} ms)",
+            f"fingerprint: {key}",
+            f"example: {' '.join(query.split())} params={params!r}",
+            "plan:",
+        ]
+        lines += [f"  {line}" for line in plan]
+        for table in scans:
+            lines.append(f"hint: full scan of {table}; index the columns this query filters on")
+        record = logging.makeLogRecord({'msg': '\n'.join(lines) + '\n', 'levelno': logging.WARNING})
+        self._handler.handle(record)
+        self._handler.flush()
+
+    def summary(self):
+        """Slow fingerprints, worst total time first"""
+        with self._lock:
+            items = [(key, dict(entry)) for key, entry in self._seen.items()]
+        items.sort(key=lambda item: item[1]['total_ms'], reverse=True)
+        return [{'fingerprint': key, 'count': entry['count'], 'total_ms': entry['total_ms'],
+                 'avg_ms': entry['total_ms'] / entry['count'], 'max_ms': entry['max_ms'],
+                 'plan': entry['plan'], 'full_scans': entry['full_scans']}
+                for key, entry in items]
+
+    def close(self):
+        self._handler.close()
+
+
+_default_log = None
+_default_lock = threading.Lock()
+
+
+def get_slow_query_log():
+    """The log used by slow_query_log() unless one is passed in"""
+    global _default_log
+    if _default_log is None:
+        with _default_lock:
+            if _default_log is None:
+                _default_log = SlowQueryLog()
+    return _default_log
+
+
+def slow_query_log(func=None, *, threshold_ms=None, log=None):
+    """Captures the plan of calls slower than threshold_ms
+
+    Goes inside with_db_connection, so the decorated function receives the
+    connection first and the plan can be read on the same database.
+    Coroutine functions must receive an aiosqlite connection.
+    """
+    if func is None:
+        return functools.partial(slow_query_log, threshold_ms=threshold_ms, log=log)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(conn, *args, **kwargs):
+            started = time.perf_counter_ns()
+            result = await func(conn, *args, **kwargs)
+            elapsed_ms = (time.perf_counter_ns() - started) / 1e6
+            target = log or get_slow_query_log()
+            limit = target.threshold_ms if threshold_ms is None else threshold_ms
+            if elapsed_ms >= limit:
+                query = find_query(args, kwargs)
+                if query is not None:
+                    await target.observe_async(conn, query, find_params(args, kwargs), elapsed_ms)
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(conn, *args, **kwargs):
+        started = time.perf_counter_ns()
+        result = func(conn, *args, **kwargs)
+        elapsed_ms = (time.perf_counter_ns() - started) / 1e6
+        target = log or get_slow_query_log()
+        limit = target.threshold_ms if threshold_ms is None else threshold_ms
+        if elapsed_ms >= limit:
+            query = find_query(args, kwargs)
+            if query is not None:
+                target.observe(conn, query, find_params(args, kwargs), elapsed_ms)
+        return result
+    return wrapper
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    workdir = tempfile.mkdtemp()
+    database = os.path.join(workdir, 'users.db')
+    conn = sqlite3.connect(database)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT NOT NULL, email TEXT NOT NULL)")
+    conn.executemany("INSERT INTO users (name, email) VALUES (?, ?)",
+                     ((f"User {i}", f"user{i}@example.com") for i in range(200000)))
+    conn.commit()
+
+    demo_log = SlowQueryLog(os.path.join(workdir, 'slow_queries.log'), threshold_ms=1)
+
+    @slow_query_log(log=demo_log)
+    def get_user_by_email(conn, query, params):
+        return conn.execute(query, params).fetchone()
+
+    lookup = "SELECT * FROM users WHERE email = ?"
+    for i in range(0, 200000, 20000):
+        get_user_by_email(conn, lookup, (f"user{i}@example.com",))
+    print(open(demo_log.path).read())
+
+    conn.execute("CREATE INDEX idx_users_email ON users (email)")
+    demo_log.replan()
+    started = time.perf_counter()
+    get_user_by_email(conn, lookup, ("user150000@example.com",))
+    print(f"With idx_users_email: {(time.perf_counter() - started) * 1000:.2f} ms")
+    print(explain(conn, lookup, ("user150000@example.com",))[0])
+    for entry in demo_log.summary():
+        print(entry)
+    demo_log.close()
+    conn.close()
@@ -0,0 +1,77 @@
+"""Connection factory applying a named SQLite performance profile.
+
+    conn = connect('users.db')                   # profile from SQLITE_PROFILE
+    conn = connect('users.db', profile='tuned')
+
+Profiles:
+    default   sqlite3's own settings: rollback journal, synchronous=FULL
+    tuned     WAL, synchronous=NORMAL, 64 MiB page cache, 256 MiB mmap and a
+              512-statement cache
+    durable   tuned, but synchronous=FULL so every commit survives power loss
+
+WAL is a property of the database file: once any connection switches to it,
+the file stays in WAL mode (with -wal and -shm files beside it).
+"""
+import os
+import sqlite3
+
+PROFILES = {
+    'default': {
+        'pragmas': {},
+        'cached_statements': 128,
+    },
+    'tuned': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            # In WAL mode a crash can lose the last commits but never corrupts
+            'synchronous': 'NORMAL',
+            'cache_size': -65536,  # negative = KiB, so 64 MiB
+            'mmap_size': 268435456,
+            # temp_store=MEMORY is left at its default on purpose: it made
+            # GROUP BY/ORDER BY sorts 1.5-4x slower in benchmark_sqlite_profile,
+            # because the default external sorter already works in memory
+            # until it outgrows the cache
+        },
+        'cached_statements': 512,
+    },
+}
+PROFILES['durable'] = {
+    'pragmas': dict(PROFILES['tuned']['pragmas'], synchronous='FULL'),
+    'cached_statements': PROFILES['tuned']['cached_statements'],
+}
+
+# Per environment, e.g. SQLITE_PROFILE=tuned in production
+DEFAULT_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+
+
+def get_profile(name=None):
+    name = name or DEFAULT_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown SQLite profile {name!r}; choose from {sorted(PROFILES)}") from None
+
+
+def connect_kwargs(profile=None):
+    """Keyword arguments for sqlite3.connect / aiosqlite.connect under a profile"""
+    return {'cached_statements': get_profile(profile)['cached_statements']}
+
+
+def apply_profile(conn, profile=None):
+    for name, value in get_profile(profile)['pragmas'].items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+async def apply_profile_async(conn, profile=None):
+    """apply_profile for aiosqlite connections"""
+    for name, value in get_profile(profile)['pragmas'].items():
+        await conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def connect(database, profile=None, **kwargs):
+    """sqlite3.connect with the profile's statement cache size and pragmas applied"""
+    for name, value in connect_kwargs(profile).items():
+        kwargs.setdefault(name, value)
+    return apply_profile(sqlite3.connect(database, **kwargs), profile)
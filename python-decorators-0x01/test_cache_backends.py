@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Unit tests for cache_backends.py
+"""
+import datetime
+import fnmatch
+import os
+import tempfile
+import threading
+import time
+import unittest
+from decimal import Decimal
+
+from parameterized import parameterized
+
+from cache_backends import (_RELEASE_LEASE, RedisCacheBackend, SharedCache,
+                            SQLiteCacheBackend, dumps, loads)
+
+
+class FakeRedis:
+    """In-memory stand-in for the redis-py client methods RedisCacheBackend uses"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value.encode() if isinstance(value, str) else value
+            return True
+
+    def mget(self, keys):
+        with self.lock:
+            return [self.data.get(key) for key in keys]
+
+    def delete(self, *keys):
+        with self.lock:
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key):
+        with self.lock:
+            value = int(self.data.get(key, 0)) + 1
+            self.data[key] = str(value).encode()
+            return value
+
+    def sadd(self, key, member):
+        with self.lock:
+            self.data.setdefault(key, set()).add(member.encode())
+
+    def smembers(self, key):
+        with self.lock:
+            return set(self.data.get(key, set()))
+
+    def scan_iter(self, match):
+        with self.lock:
+            return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+    def eval(self, script, numkeys, key, token):
+        assert script == _RELEASE_LEASE
+        with self.lock:
+            if self.data.get(key) == token.encode():
+                del self.data[key]
+                return 1
+            return 0
+
+
+class TestMakeKey(unittest.TestCase):
+    """
+    Tests the process-independent cache keys.
+    """
+    def test_equal_params_share_a_key(self):
+        """
+        Test that dict and set ordering and SQL whitespace don't change the key.
+        """
+        self.assertEqual(
+            SharedCache.make_key("SELECT * FROM users WHERE id = ?", ({'a': 1, 'b': {2, 3}},)),
+            SharedCache.make_key("select *  from users\nwhere id = ?", ({'b': {3, 2}, 'a': 1},)))
+
+    @parameterized.expand([
+        ((['a'],), ({'a'},)),
+        (('1',), (1,)),
+        ((b'ab',), ('6162',)),
+        ((Decimal('1.5'),), (1.5,)),
+        ((datetime.date(2024, 1, 2),), ('2024-01-02',)),
+    ])
+    def test_different_types_differ(self, first, second):
+        """
+        Test that values of different types never share a key.
+        """
+        self.assertNotEqual(SharedCache.make_key("SELECT ?", first),
+                            SharedCache.make_key("SELECT ?", second))
+
+    def test_unsupported_params(self):
+        """
+        Test that params with no canonical form are refused.
+        """
+        with self.assertRaises(TypeError):
+            SharedCache.make_key("SELECT ?", (object(),))
+
+
+class TestSerialization(unittest.TestCase):
+    """
+    Tests the stored value format.
+    """
+    @parameterized.expand([
+        ([(1, 'Alice')],),
+        ([(i, 'x' * 20) for i in range(200)],),
+    ])
+    def test_round_trip(self, value):
+        """
+        Test that small raw and large compressed values read back unchanged.
+        """
+        self.assertEqual(loads(dumps(value)), value)
+
+
+class BackendTests:
+    """
+    Tests shared by both backends; subclasses provide make_backend().
+    """
+    def setUp(self):
+        """
+        Builds the backend under test.
+        """
+        self.cache = self.make_backend()
+
+    def test_put_and_get(self):
+        """
+        Test that a stored value is returned and counted as a hit.
+        """
+        self.assertIsNone(self.cache.get('k'))
+        self.assertTrue(self.cache.put('k', [(1, 'Alice')], tables=('users',)))
+        self.assertEqual(self.cache.get('k'), [(1, 'Alice')])
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_invalidate_tables(self):
+        """
+        Test that invalidating a table drops only the entries that read it.
+        """
+        self.cache.put('users', 1, tables=('users',))
+        self.cache.put('orders', 2, tables=('orders',))
+        self.assertEqual(self.cache.invalidate_tables(['users']), 1)
+        self.assertIsNone(self.cache.get('users'))
+        self.assertEqual(self.cache.get('orders'), 2)
+
+    def test_stale_put_after_invalidate(self):
+        """
+        Test that a result computed before an invalidation is not stored.
+        """
+        generation = self.cache.generation(('users',))
+        self.cache.invalidate_tables(['users'])
+        self.assertFalse(self.cache.put('k', 1, tables=('users',), generation=generation))
+        self.assertIsNone(self.cache.get('k'))
+        self.assertEqual(self.cache.stats()['stale_puts'], 1)
+
+    def test_stale_put_after_clear(self):
+        """
+        Test that clear() also rejects results for tables never invalidated before.
+        """
+        generation = self.cache.generation(('users',))
+        self.cache.clear()
+        self.assertFalse(self.cache.put('k', 1, tables=('users',), generation=generation))
+        self.assertIsNone(self.cache.get('k'))
+
+    def test_clear(self):
+        """
+        Test that clear() empties the cache.
+        """
+        self.cache.put('a', 1, tables=('users',))
+        self.cache.put('b', 2)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+
+    def test_load_is_single_flight(self):
+        """
+        Test that concurrent loads of a missed key run compute() once.
+        """
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'rows'
+
+        barrier = threading.Barrier(4)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(self.cache.load('k', compute, tables=('users',)))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['rows'] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.stats()['coalesced'], 3)
+
+    def test_failed_load_releases_the_lease(self):
+        """
+        Test that the next caller can compute after compute() raised.
+        """
+        def fail():
+            raise RuntimeError("query failed")
+
+        with self.assertRaises(RuntimeError):
+            self.cache.load('k', fail)
+        self.assertEqual(self.cache.load('k', lambda: 'rows'), 'rows')
+
+    def test_lease_release_needs_the_token(self):
+        """
+        Test that a worker can't release a lease it doesn't hold.
+        """
+        self.assertTrue(self.cache._try_lease('k', 'mine'))
+        self.cache._release_lease('k', 'theirs')
+        self.assertFalse(self.cache._try_lease('k', 'theirs'))
+        self.cache._release_lease('k', 'mine')
+        self.assertTrue(self.cache._try_lease('k', 'theirs'))
+
+
+class TestSQLiteCacheBackend(BackendTests, unittest.TestCase):
+    """
+    Tests SQLiteCacheBackend on a throwaway file.
+    """
+    def make_backend(self, **kwargs):
+        """
+        Creates a backend whose files are removed when the test ends.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.db')
+        return SQLiteCacheBackend(self.path, **kwargs)
+
+    def test_shared_between_instances(self):
+        """
+        Test that a second backend on the same file (another process) sees entries.
+        """
+        self.cache.put('k', 1, tables=('users',))
+        other = SQLiteCacheBackend(self.path)
+        self.assertEqual(other.get('k'), 1)
+        other.invalidate_tables(['users'])
+        self.assertIsNone(self.cache.get('k'))
+
+    def test_expired_entries(self):
+        """
+        Test that an entry past its TTL is a miss.
+        """
+        self.cache.put('k', 1, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('k'))
+
+
+class TestRedisCacheBackend(BackendTests, unittest.TestCase):
+    """
+    Tests RedisCacheBackend against FakeRedis.
+    """
+    def make_backend(self):
+        """
+        Creates a backend on a fresh fake client.
+        """
+        self.client = FakeRedis()
+        return RedisCacheBackend(client=self.client)
+
+    def test_entries_use_the_prefix(self):
+        """
+        Test that every key the backend writes carries its prefix.
+        """
+        self.cache.put('k', 1, tables=('users',))
+        self.cache.clear()
+        self.cache.put('k', 1, tables=('users',))
+        self.assertTrue(all(key.startswith('qc:') for key in self.client.data))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Unit tests for cache_store.py
+"""
+import asyncio
+import threading
+import time
+import unittest
+
+from parameterized import parameterized
+
+from cache_store import QueryCache, normalize_sql, tables_read, tables_written
+
+
+class TestSQLHelpers(unittest.TestCase):
+    """
+    Tests the SQL normalization and table extraction helpers.
+    """
+    def test_normalize_sql(self):
+        """
+        Test that whitespace and case outside literals don't change the key.
+        """
+        self.assertEqual(normalize_sql("SELECT *\n  FROM Users WHERE name = 'Bob';"),
+                         "select * from users where name = 'Bob'")
+
+    @parameterized.expand([
+        ("SELECT * FROM users", {"users"}),
+        ("SELECT * FROM users u JOIN orders o ON o.user_id = u.id", {"users", "orders"}),
+        ("SELECT * FROM main.users", {"users"}),
+    ])
+    def test_tables_read(self, query, expected):
+        """
+        Test that tables_read finds every table a query reads.
+        """
+        self.assertEqual(tables_read(query), expected)
+
+    @parameterized.expand([
+        ("UPDATE users SET email = ?", {"users"}),
+        ("INSERT OR IGNORE INTO users VALUES (?)", {"users"}),
+        ("DELETE FROM orders WHERE id = ?", {"orders"}),
+        ("SELECT * FROM users", set()),
+        ("CREATE VIEW v AS SELECT 1", None),
+    ])
+    def test_tables_written(self, query, expected):
+        """
+        Test that tables_written returns the written tables, or None when unsure.
+        """
+        self.assertEqual(tables_written(query), expected)
+
+
+class TestQueryCache(unittest.TestCase):
+    """
+    Tests QueryCache storage, eviction and invalidation.
+    """
+    def test_get_and_put(self):
+        """
+        Test that a stored value is returned and hits/misses are counted.
+        """
+        cache = QueryCache()
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_counts_are_summed_across_threads(self):
+        """
+        Test that hits recorded on several threads all reach stats().
+        """
+        cache = QueryCache()
+        cache.put("a", 1)
+        threads = [threading.Thread(target=lambda: [cache.get("a") for _ in range(100)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.stats()["hits"], 400)
+
+    def test_exited_threads_are_folded_in(self):
+        """
+        Test that a finished thread's counts are kept but its per-thread
+        entry is dropped, so thread churn doesn't grow the cache.
+        """
+        cache = QueryCache()
+        cache.put("a", 1)
+        for _ in range(20):
+            thread = threading.Thread(target=cache.get, args=("a",))
+            thread.start()
+            thread.join()
+        cache.get("a")
+        self.assertEqual(cache.stats()["hits"], 21)
+        self.assertEqual(len(cache._thread_counts), 1)
+
+    def test_evicts_unreferenced_entries_first(self):
+        """
+        Test that an entry read since the last sweep survives the next eviction.
+        """
+        cache = QueryCache(max_entries=3, shards=1)
+        for key in "abc":
+            cache.put(key, key)
+        cache.get("a")
+        cache.put("d", "d")
+        self.assertEqual(sorted(k for k in "abcd" if k in cache), ["a", "c", "d"])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_value_larger_than_a_shard_is_stored(self):
+        """
+        Test that a value over one shard's byte share but under max_bytes is kept
+        and the total stays within max_bytes.
+        """
+        cache = QueryCache(max_entries=1024, max_bytes=20000, shards=4)
+        for i in range(40):
+            cache.put(i, "x" * 400)
+        self.assertTrue(cache.put("big", "y" * 12000))
+        self.assertEqual(cache.get("big"), "y" * 12000)
+        self.assertLessEqual(cache.stats()["bytes"], 20000)
+
+    def test_value_larger_than_the_cache_is_rejected(self):
+        """
+        Test that put refuses a value bigger than max_bytes.
+        """
+        cache = QueryCache(max_bytes=1000)
+        self.assertFalse(cache.put("big", "x" * 2000))
+        self.assertNotIn("big", cache)
+
+    def test_ttl_expiry(self):
+        """
+        Test that an entry past its TTL reads as a miss.
+        """
+        cache = QueryCache()
+        cache.put("a", 1, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expired"], 1)
+
+    def test_invalidate_tables(self):
+        """
+        Test that only the entries tagged with an invalidated table are dropped.
+        """
+        cache = QueryCache()
+        cache.put("users", 1, tables={"users"})
+        cache.put("orders", 2, tables={"orders"})
+        self.assertEqual(cache.invalidate_tables(["users"]), 1)
+        self.assertNotIn("users", cache)
+        self.assertIn("orders", cache)
+
+    def test_stale_put_is_dropped(self):
+        """
+        Test that a result computed before an invalidation is not stored.
+        """
+        cache = QueryCache()
+        generation = cache.generation({"users"})
+        cache.invalidate_tables(["users"])
+        self.assertFalse(cache.put("a", 1, {"users"}, generation=generation))
+        self.assertEqual(cache.stats()["stale_puts"], 1)
+
+    def test_clear(self):
+        """
+        Test that clear() drops everything and makes older generations stale.
+        """
+        cache = QueryCache()
+        generation = cache.generation(())
+        cache.put("a", 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertFalse(cache.put("b", 2, generation=generation))
+
+
+class TestQueryCacheLoad(unittest.TestCase):
+    """
+    Tests the single-flight load() and load_async().
+    """
+    def test_concurrent_loads_share_one_compute(self):
+        """
+        Test that threads missing the same key together run compute() once.
+        """
+        cache = QueryCache()
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return "value"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.load("k", compute)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while not cache._shard("k").inflight:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(cache.stats()["coalesced"], 4)
+
+    def test_load_failure_reaches_every_waiter(self):
+        """
+        Test that a failing compute() raises in the caller and stores nothing.
+        """
+        cache = QueryCache()
+
+        def compute():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            cache.load("k", compute)
+        self.assertNotIn("k", cache)
+        self.assertEqual(cache.load("k", lambda: 1), 1)
+
+    def test_reentrant_load_raises(self):
+        """
+        Test that a compute() loading its own key fails instead of deadlocking.
+        """
+        cache = QueryCache()
+        with self.assertRaises(RuntimeError):
+            cache.load("k", lambda: cache.load("k", lambda: 1))
+        self.assertEqual(cache.load("k", lambda: 2), 2)
+
+    def test_nested_load_of_another_key(self):
+        """
+        Test that a compute() may load a different key.
+        """
+        cache = QueryCache()
+        value = cache.load("outer", lambda: cache.load("inner", lambda: 1) + 1)
+        self.assertEqual((value, cache.get("inner")), (2, 1))
+
+    def test_concurrent_async_loads_share_one_compute(self):
+        """
+        Test that concurrent awaits of the same key run the coroutine once.
+        """
+        cache = QueryCache()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "value"
+
+        async def main():
+            return await asyncio.gather(*(cache.load_async("k", compute) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), ["value"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_reentrant_async_load_raises(self):
+        """
+        Test that a coroutine loading its own key fails instead of deadlocking.
+        """
+        cache = QueryCache()
+
+        async def inner():
+            return 1
+
+        async def outer():
+            return await cache.load_async("k", inner)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(cache.load_async("k", outer))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Unit tests for connection_pool.py
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from parameterized import parameterized
+
+from connection_pool import (PoolTimeout, SQLiteConnectionPool, validate_pragmas,
+                             with_pooled_connection)
+from write_batch import WriteBatch
+
+
+class TestValidatePragmas(unittest.TestCase):
+    """
+    Tests the pragma whitelist.
+    """
+    def test_allowed_pragmas(self):
+        """
+        Test that whitelisted names with valid values pass through unchanged.
+        """
+        pragmas = {'foreign_keys': 'ON', 'cache_size': -2000, 'journal_mode': 'wal'}
+        self.assertEqual(validate_pragmas(pragmas), pragmas)
+
+    @parameterized.expand([
+        ({'user_version': 1},),
+        ({'cache_size': '1; DROP TABLE users'},),
+        ({'journal_mode': 'WAL OFF'},),
+        ({'foreign_keys': 'maybe'},),
+    ])
+    def test_rejected_pragmas(self, pragmas):
+        """
+        Test that unknown names and malformed values raise ValueError.
+        """
+        with self.assertRaises(ValueError):
+            validate_pragmas(pragmas)
+
+
+class TestSQLiteConnectionPool(unittest.TestCase):
+    """
+    Tests SQLiteConnectionPool checkouts.
+    """
+    def setUp(self):
+        """
+        Creates a pool on a throwaway database.
+        """
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def make_pool(self, **kwargs):
+        """
+        Builds a pool that is closed when the test ends.
+        """
+        pool = SQLiteConnectionPool(self.path, profile='default', **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_connections_are_reused(self):
+        """
+        Test that a released connection is handed out again.
+        """
+        pool = self.make_pool(size=2)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            self.assertIs(first, second)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['checkouts'], stats['in_use']), (1, 2, 0))
+
+    def test_checkout_timeout(self):
+        """
+        Test that acquire raises PoolTimeout when every connection is out.
+        """
+        pool = self.make_pool(size=1)
+        with pool.connection():
+            with self.assertRaises(PoolTimeout):
+                pool.acquire(timeout=0.01)
+        self.assertEqual(pool.stats()['in_use'], 0)
+
+    def test_release_rolls_back(self):
+        """
+        Test that uncommitted writes are discarded when a connection is released.
+        """
+        pool = self.make_pool(size=1)
+        with pool.connection() as conn:
+            conn.execute("CREATE TABLE t (x INTEGER)")
+            conn.commit()
+            conn.execute("INSERT INTO t VALUES (1)")
+        with pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+
+    def test_pragmas_are_applied(self):
+        """
+        Test that configured pragmas are set on new connections.
+        """
+        pool = self.make_pool(pragmas={'foreign_keys': 'ON'})
+        with pool.connection() as conn:
+            self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+
+    def test_thread_affinity(self):
+        """
+        Test that a thread gets back the connection it used last, not the
+        most recently released one.
+        """
+        pool = self.make_pool(size=2, thread_affinity=True)
+        mine = pool.acquire()
+        theirs = []
+        worker = threading.Thread(target=lambda: theirs.append(pool.acquire()))
+        worker.start()
+        worker.join()
+        pool.release(mine)
+        # The worker's connection is now the warmest idle one
+        pool.release(theirs[0])
+        with pool.connection() as conn:
+            self.assertIs(conn, mine)
+        self.assertEqual(pool.stats()['affinity_hits'], 1)
+
+    def test_release_after_close(self):
+        """
+        Test that a connection returned to a closed pool is closed, not pooled.
+        """
+        pool = self.make_pool(size=1)
+        conn = pool.acquire()
+        pool.close()
+        pool.release(conn)
+        self.assertEqual(pool.stats()['idle'], 0)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+    def test_acquire_after_close(self):
+        """
+        Test that a closed pool hands out no more connections.
+        """
+        pool = self.make_pool()
+        pool.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            pool.acquire()
+
+    def test_size_must_be_positive(self):
+        """
+        Test that an empty pool is refused.
+        """
+        with self.assertRaises(ValueError):
+            SQLiteConnectionPool(self.path, size=0)
+
+
+class TestWithPooledConnection(unittest.TestCase):
+    """
+    Tests the with_pooled_connection decorator.
+    """
+    def setUp(self):
+        """
+        Points the shared pool at a throwaway database.
+        """
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        self.pool = SQLiteConnectionPool(path, size=1, profile='default')
+        self.addCleanup(self.pool.close)
+        patcher = patch('connection_pool.get_pool', return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_passes_a_pooled_connection(self):
+        """
+        Test that every call borrows, and returns, the shared pool's connection.
+        """
+        seen = []
+        with_pooled_connection(seen.append)()
+        with_pooled_connection(seen.append)()
+        self.assertIs(seen[0], seen[1])
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+
+    def test_uses_the_batch_connection(self):
+        """
+        Test that calls inside a WriteBatch get the batch's connection.
+        """
+        seen = []
+        conn = sqlite3.connect(':memory:')
+        self.addCleanup(conn.close)
+        with WriteBatch(conn, max_delay=60):
+            with_pooled_connection(seen.append)()
+        self.assertIs(seen[0], conn)
+        self.assertEqual(self.pool.stats()['checkouts'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Unit tests for query_metrics.py
+"""
+import asyncio
+import threading
+import unittest
+
+from parameterized import parameterized
+
+from query_metrics import (BUCKET_BOUNDS_NS, CallCounter, QueryMetrics, QueryStats, find_query,
+                           fingerprint, instrument)
+
+
+class TestFingerprint(unittest.TestCase):
+    """
+    Tests how queries are grouped.
+    """
+    @parameterized.expand([
+        ("SELECT * FROM users WHERE id = 1", "select * from users where id = ?"),
+        ("select *\n  from USERS where ID = 42", "select * from users where id = ?"),
+        ("SELECT name FROM users WHERE email = 'o''brien@example.com'",
+         "select name from users where email = ?"),
+        ("SELECT * FROM t2 WHERE b = -4.5e3 OR c = 0x1F", "select * from t2 where b = ? or c = ?"),
+        ("SELECT col_1 FROM users2", "select col_1 from users2"),
+        ("SELECT * FROM users WHERE id = :id OR id = $1 OR id = ?2 OR id = @x",
+         "select * from users where id = ? or id = ? or id = ? or id = ?"),
+        ("SELECT * FROM users WHERE id IN (1, 2, 3)", "select * from users where id in (?+)"),
+        ("SELECT * FROM users WHERE id IN (?, ?)", "select * from users where id in (?+)"),
+    ])
+    def test_fingerprint(self, query, expected):
+        """
+        Test that literals, placeholders and IN lists are replaced.
+        """
+        self.assertEqual(fingerprint(query), expected)
+
+    @parameterized.expand([
+        ((), {'query': "SELECT 1"}, "SELECT 1"),
+        ((object(), "SELECT 2"), {}, "SELECT 2"),
+        ((object(),), {}, None),
+    ])
+    def test_find_query(self, args, kwargs, expected):
+        """
+        Test that the SQL is taken from query= or the first string argument.
+        """
+        self.assertEqual(find_query(args, kwargs), expected)
+
+
+class TestQueryStats(unittest.TestCase):
+    """
+    Tests the latency histogram of one fingerprint.
+    """
+    def test_percentiles(self):
+        """
+        Test that percentiles report the bucket bound, capped by the maximum.
+        """
+        metrics = QueryMetrics()
+        for elapsed_ns in [40_000] * 90 + [3_000_000] * 10:
+            metrics.record("SELECT 1", elapsed_ns)
+        stats = metrics.snapshot()["select ?"]
+        self.assertEqual(stats['count'], 100)
+        self.assertEqual(stats['p50_ms'], 0.05)
+        self.assertEqual(stats['p99_ms'], 3.0)
+
+    def test_empty(self):
+        """
+        Test that stats with no calls report zeros.
+        """
+        self.assertEqual(QueryStats().as_dict()['p95_ms'], 0)
+
+
+class TestInstrument(unittest.TestCase):
+    """
+    Tests the instrument decorator.
+    """
+    def setUp(self):
+        """
+        Uses a private registry so tests don't see each other's calls.
+        """
+        self.metrics = QueryMetrics()
+
+    def test_records_rows_and_errors(self):
+        """
+        Test that results are counted as rows and exceptions as errors.
+        """
+        @instrument(metrics=self.metrics)
+        def run(query, fail=False):
+            if fail:
+                raise ValueError("boom")
+            return [(1,), (2,)]
+
+        run("SELECT * FROM users WHERE id = 1")
+        with self.assertRaises(ValueError):
+            run("SELECT * FROM users WHERE id = 2", fail=True)
+        stats = self.metrics.snapshot()["select * from users where id = ?"]
+        self.assertEqual((stats['count'], stats['rows'], stats['errors']), (2, 2, 1))
+
+    @parameterized.expand([
+        (1.0, 8),
+        (0.25, 2),
+        (0, 0),
+    ])
+    def test_sampling(self, sample_rate, timed):
+        """
+        Test that only 1 in round(1 / sample_rate) calls is timed, but every
+        call is counted.
+        """
+        @instrument(sample_rate=sample_rate, metrics=self.metrics)
+        def run(query):
+            return []
+
+        for _ in range(8):
+            run("SELECT 1")
+        timed_calls = sum(stats['count'] for stats in self.metrics.snapshot().values())
+        self.assertEqual(timed_calls, timed)
+        self.assertEqual(self.metrics.calls(), {run.__qualname__: 8})
+
+    def test_coroutine(self):
+        """
+        Test that coroutine functions are timed when they finish.
+        """
+        @instrument(metrics=self.metrics)
+        async def run(query):
+            await asyncio.sleep(0)
+            return [(1,)]
+
+        self.assertEqual(asyncio.run(run("SELECT 1")), [(1,)])
+        self.assertEqual(self.metrics.snapshot()["select ?"]['rows'], 1)
+
+
+class TestPrometheusText(unittest.TestCase):
+    """
+    Tests the Prometheus exposition output.
+    """
+    def setUp(self):
+        """
+        Records a few calls to render.
+        """
+        self.metrics = QueryMetrics()
+        self.metrics.record("SELECT 1", 40_000, rows=3)
+        self.metrics.record("SELECT 1", 2_000_000_000, error=True)
+        self.metrics.record('SELECT "a\\b"', 1_000)
+        self.metrics.register('fetch').increment()
+        self.samples = {}
+        for line in self.metrics.prometheus_text().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                self.samples[name] = float(value)
+
+    def test_histogram_is_cumulative(self):
+        """
+        Test that bucket counts accumulate up to +Inf, which equals _count.
+        """
+        label = 'fingerprint="select ?"'
+        buckets = [self.samples[f'sql_query_duration_seconds_bucket{{{label},le="{le}"}}']
+                   for le in [repr(bound / 1e9) for bound in BUCKET_BOUNDS_NS] + ['+Inf']]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(buckets[0], 1)
+        self.assertEqual(buckets[-1], self.samples[f'sql_query_duration_seconds_count{{{label}}}'])
+        self.assertAlmostEqual(self.samples[f'sql_query_duration_seconds_sum{{{label}}}'], 2.00004)
+
+    def test_counters(self):
+        """
+        Test the rows, errors and function call counters.
+        """
+        self.assertEqual(self.samples['sql_query_rows_total{fingerprint="select ?"}'], 3)
+        self.assertEqual(self.samples['sql_query_errors_total{fingerprint="select ?"}'], 1)
+        self.assertEqual(self.samples['sql_function_calls_total{function="fetch"}'], 1)
+
+    def test_labels_are_escaped(self):
+        """
+        Test that quotes and backslashes in a fingerprint are escaped.
+        """
+        self.assertIn('sql_query_rows_total{fingerprint="select \\"a\\\\b\\""}', self.samples)
+
+
+class TestCallCounter(unittest.TestCase):
+    """
+    Tests the per-thread call counter.
+    """
+    def test_exited_threads_are_folded_in(self):
+        """
+        Test that finished threads' counts are kept but their cells dropped.
+        """
+        counter = CallCounter()
+        for _ in range(10):
+            thread = threading.Thread(target=lambda: [counter.increment() for _ in range(5)])
+            thread.start()
+            thread.join()
+        self.assertEqual(counter.increment(), 1)
+        self.assertEqual(counter.total(), 51)
+        self.assertEqual(len(counter._cells), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
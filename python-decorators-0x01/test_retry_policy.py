@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Unit tests for retry_policy.py
+"""
+import asyncio
+import sqlite3
+import unittest
+from unittest.mock import patch
+
+from parameterized import parameterized
+
+from retry_policy import (CircuitBreaker, CircuitOpenError, RetryBudget, RetryPolicy,
+                          is_transient)
+
+retry_on_failure = __import__('3-retry_on_failure').retry_on_failure
+
+
+class MySQLError(Exception):
+    """Stand-in for a mysql.connector error carrying an errno"""
+    def __init__(self, errno):
+        super().__init__(errno)
+        self.errno = errno
+
+
+class TestIsTransient(unittest.TestCase):
+    """
+    Tests the transient error classifier.
+    """
+    @parameterized.expand([
+        (sqlite3.OperationalError("database is locked"), True),
+        (sqlite3.OperationalError("no such table: users"), False),
+        (sqlite3.IntegrityError("UNIQUE constraint failed"), False),
+        (MySQLError(1213), True),
+        (MySQLError(1062), False),
+        (ValueError("bad"), False),
+    ])
+    def test_is_transient(self, error, expected):
+        """
+        Test that only lock contention and dropped connections are retried.
+        """
+        self.assertEqual(is_transient(error), expected)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """
+    Tests RetryPolicy.
+    """
+    def test_should_retry_stops_after_retries(self):
+        """
+        Test that a transient error is retried only `retries` times.
+        """
+        policy = RetryPolicy(retries=2)
+        error = sqlite3.OperationalError("database is locked")
+        self.assertEqual([policy.should_retry(error, attempt) for attempt in range(3)],
+                         [True, True, False])
+
+    def test_backoff_is_capped(self):
+        """
+        Test that every wait lies within [0, min(max_delay, base * 2**attempt)].
+        """
+        policy = RetryPolicy(base_delay=0.1, max_delay=0.3)
+        for attempt in range(6):
+            wait = policy.backoff(attempt)
+            self.assertGreaterEqual(wait, 0)
+            self.assertLessEqual(wait, min(0.3, 0.1 * 2 ** attempt))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """
+    Tests the closed/open/half-open transitions of CircuitBreaker.
+    """
+    def setUp(self):
+        """
+        Builds a breaker on a controllable clock.
+        """
+        patcher = patch('retry_policy.time.monotonic', return_value=100.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("db", failure_threshold=2, reset_timeout=10)
+
+    def test_opens_after_threshold(self):
+        """
+        Test that consecutive failures open the circuit and calls then fail fast.
+        """
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_success_resets_the_count(self):
+        """
+        Test that a success in between keeps the circuit closed.
+        """
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_probe(self):
+        """
+        Test that one probe is let through after reset_timeout, and its
+        success closes the circuit.
+        """
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.return_value = 111.0
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        """
+        Test that a failing probe opens the circuit again.
+        """
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.return_value = 111.0
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_ignored_error_frees_the_probe(self):
+        """
+        Test that a non-transient error lets another probe through.
+        """
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.return_value = 111.0
+        self.breaker.before_call()
+        self.breaker.record_ignored()
+        self.breaker.before_call()
+
+
+class TestRetryOnFailureProbe(unittest.TestCase):
+    """
+    Tests that retry_on_failure always hands back a half-open probe slot.
+    """
+    def setUp(self):
+        """
+        Opens a breaker on a controllable clock and moves past reset_timeout.
+        """
+        patcher = patch('retry_policy.time.monotonic', return_value=100.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("db", failure_threshold=1, reset_timeout=10)
+        self.breaker.record_failure()
+        self.clock.return_value = 111.0
+
+    def test_interrupted_probe_is_released(self):
+        """
+        Test that a probe ended by KeyboardInterrupt doesn't block later probes.
+        """
+        calls = []
+
+        @retry_on_failure(retries=0, breaker=self.breaker, budget=RetryBudget())
+        def probe(interrupt):
+            calls.append(interrupt)
+            if interrupt:
+                raise KeyboardInterrupt
+            return 'ok'
+
+        with self.assertRaises(KeyboardInterrupt):
+            probe(True)
+        self.assertEqual(probe(False), 'ok')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_cancelled_async_probe_is_released(self):
+        """
+        Test that a coroutine probe cancelled mid-call (as a wait_for timeout
+        does) doesn't block later probes.
+        """
+        @retry_on_failure(retries=0, breaker=self.breaker, budget=RetryBudget())
+        async def probe(hang):
+            if hang:
+                await asyncio.Event().wait()
+            return 'ok'
+
+        async def scenario():
+            task = asyncio.create_task(probe(True))
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return await probe(False)
+
+        self.assertEqual(asyncio.run(scenario()), 'ok')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestRetryBudget(unittest.TestCase):
+    """
+    Tests RetryBudget.
+    """
+    def setUp(self):
+        """
+        Freezes the clock so the per-second floor adds nothing.
+        """
+        patcher = patch('retry_policy.time.monotonic', return_value=100.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_budget_runs_out(self):
+        """
+        Test that only max_tokens retries are allowed without new calls.
+        """
+        budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=3)
+        self.assertEqual([budget.try_spend() for _ in range(4)], [True, True, True, False])
+
+    def test_calls_deposit_tokens(self):
+        """
+        Test that every call earns back `ratio` of a retry.
+        """
+        budget = RetryBudget(ratio=0.1, min_per_second=0, max_tokens=1)
+        budget.try_spend()
+        for _ in range(10):
+            budget.record_call()
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+
+    def test_floor_refills_over_time(self):
+        """
+        Test that min_per_second tokens come back as time passes.
+        """
+        budget = RetryBudget(ratio=0, min_per_second=1, max_tokens=1)
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+        self.clock.return_value = 101.0
+        self.assertTrue(budget.try_spend())
+
+
+if __name__ == "__main__":
+    unittest.main()
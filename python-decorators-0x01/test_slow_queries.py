@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Unit tests for slow_queries.py
+"""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import aiosqlite
+from parameterized import parameterized
+
+from slow_queries import SlowQueryLog, explain, find_params, slow_query_log
+
+LOOKUP = "SELECT * FROM users WHERE email = ?"
+
+
+class TestHelpers(unittest.TestCase):
+    """
+    Tests find_params and explain.
+    """
+    @parameterized.expand([
+        ((LOOKUP, ('a@example.com',)), {}, ('a@example.com',)),
+        ((LOOKUP,), {'params': {'email': 'a'}}, {'email': 'a'}),
+        ((LOOKUP,), {}, ()),
+    ])
+    def test_find_params(self, args, kwargs, expected):
+        """
+        Test that params come from params= or the first tuple/list/dict argument.
+        """
+        self.assertEqual(find_params(args, kwargs), expected)
+
+    def test_explain_reports_full_scans(self):
+        """
+        Test that a lookup on an unindexed column is flagged as a full scan,
+        and stops being one once the column is indexed.
+        """
+        conn = sqlite3.connect(':memory:')
+        self.addCleanup(conn.close)
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT)")
+        lines, scans = explain(conn, LOOKUP, ('a@example.com',))
+        self.assertTrue(lines)
+        self.assertEqual(scans, ['users'])
+        conn.execute("CREATE INDEX idx_users_email ON users (email)")
+        self.assertEqual(explain(conn, LOOKUP, ('a@example.com',))[1], [])
+
+
+class TestSlowQueryLog(unittest.TestCase):
+    """
+    Tests the slow_query_log decorator and SlowQueryLog.
+    """
+    def setUp(self):
+        """
+        Opens an in-memory users table and a log in a temporary directory.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        self.conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT)")
+        self.log = SlowQueryLog(os.path.join(directory.name, 'slow.log'), threshold_ms=0)
+        self.addCleanup(self.log.close)
+
+    def report(self):
+        """
+        Text written to the report so far.
+        """
+        if not os.path.exists(self.log.path):
+            return ''
+        with open(self.log.path) as report:
+            return report.read()
+
+    def lookup(self, threshold_ms=None):
+        """
+        A decorated email lookup.
+        """
+        @slow_query_log(log=self.log, threshold_ms=threshold_ms)
+        def get_user_by_email(conn, query, params):
+            return conn.execute(query, params).fetchone()
+        return get_user_by_email
+
+    def test_fast_calls_are_ignored(self):
+        """
+        Test that calls under the threshold record nothing.
+        """
+        self.lookup(threshold_ms=60_000)(self.conn, LOOKUP, ('a@example.com',))
+        self.assertEqual(self.log.summary(), [])
+        self.assertEqual(self.report(), '')
+
+    def test_slow_call_is_explained(self):
+        """
+        Test that a slow call writes its plan and a full-scan hint.
+        """
+        self.lookup()(self.conn, LOOKUP, ('a@example.com',))
+        report = self.report()
+        self.assertIn("fingerprint: select * from users where email = ?", report)
+        self.assertIn("hint: full scan of users", report)
+        self.assertEqual(self.log.summary()[0]['full_scans'], ['users'])
+
+    def test_plans_are_deduplicated(self):
+        """
+        Test that repeated slow runs are counted but explained once.
+        """
+        lookup = self.lookup()
+        for i in range(3):
+            lookup(self.conn, LOOKUP, (f'user{i}@example.com',))
+        self.assertEqual(self.report().count("slow query"), 1)
+        self.assertEqual(self.log.summary()[0]['count'], 3)
+
+    def test_replan_reports_a_changed_plan(self):
+        """
+        Test that after replan() a new plan is written, and an unchanged one isn't.
+        """
+        lookup = self.lookup()
+        lookup(self.conn, LOOKUP, ('a@example.com',))
+        self.log.replan()
+        lookup(self.conn, LOOKUP, ('a@example.com',))
+        self.assertEqual(self.report().count("slow query"), 1)
+
+        self.conn.execute("CREATE INDEX idx_users_email ON users (email)")
+        self.log.replan()
+        lookup(self.conn, LOOKUP, ('a@example.com',))
+        self.assertEqual(self.report().count("slow query"), 2)
+        self.assertEqual(self.log.summary()[0]['full_scans'], [])
+
+    def test_unexplainable_statements(self):
+        """
+        Test that statements EXPLAIN doesn't apply to are counted only.
+        """
+        @slow_query_log(log=self.log)
+        def pragma(conn, query):
+            return conn.execute(query).fetchall()
+
+        pragma(self.conn, "PRAGMA table_info(users)")
+        self.assertEqual(self.log.summary()[0]['count'], 1)
+        self.assertEqual(self.report(), '')
+
+    def test_failed_explain(self):
+        """
+        Test that a plan that can't be read is reported as unavailable.
+        """
+        @slow_query_log(log=self.log)
+        def run(conn, query):
+            return None
+
+        run(self.conn, "SELECT * FROM missing_table")
+        self.assertIn("(plan unavailable: no such table: missing_table)", self.report())
+
+    def test_coroutine(self):
+        """
+        Test that coroutine functions on aiosqlite are timed and explained.
+        """
+        @slow_query_log(log=self.log)
+        async def get_user_by_email(conn, query, params):
+            async with conn.execute(query, params) as cursor:
+                return await cursor.fetchone()
+
+        async def scenario():
+            async with aiosqlite.connect(':memory:') as conn:
+                await conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT)")
+                await conn.execute("INSERT INTO users (email) VALUES ('a@example.com')")
+                return await get_user_by_email(conn, LOOKUP, ('a@example.com',))
+
+        self.assertEqual(asyncio.run(scenario()), (1, 'a@example.com'))
+        self.assertIn("hint: full scan of users", self.report())
+        self.assertEqual(self.log.summary()[0]['count'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Unit tests for write_batch.py
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from write_batch import WriteBatch, current_batch
+
+
+class TestWriteBatch(unittest.TestCase):
+    """
+    Tests WriteBatch commits and its failure paths.
+    """
+    def setUp(self):
+        """
+        Opens a fresh database with a UNIQUE column to violate.
+        """
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.conn = sqlite3.connect(self.path)
+        self.addCleanup(self.conn.close)
+        self.conn.execute("CREATE TABLE t (x INTEGER UNIQUE)")
+        self.conn.commit()
+
+    def insert(self, value):
+        """
+        Inserts one row on the batch connection.
+        """
+        self.conn.execute("INSERT INTO t VALUES (?)", (value,))
+
+    def committed(self):
+        """
+        Rows visible to another connection, i.e. committed ones.
+        """
+        other = sqlite3.connect(self.path)
+        try:
+            return [row[0] for row in other.execute("SELECT x FROM t ORDER BY x")]
+        finally:
+            other.close()
+
+    def test_commits_when_block_ends(self):
+        """
+        Test that calls are committed together at the end of the block.
+        """
+        with WriteBatch(self.conn, max_delay=60) as batch:
+            for value in range(3):
+                batch.run(self.insert, value)
+            self.assertEqual(self.committed(), [])
+        self.assertEqual(self.committed(), [0, 1, 2])
+        self.assertEqual(batch.stats()['batches'], 1)
+
+    def test_commits_at_max_items(self):
+        """
+        Test that a batch commits as soon as max_items calls are pending.
+        """
+        with WriteBatch(self.conn, max_items=2, max_delay=60) as batch:
+            batch.run(self.insert, 1)
+            batch.run(self.insert, 2)
+            self.assertEqual(self.committed(), [1, 2])
+
+    def test_failed_call_only_undoes_itself(self):
+        """
+        Test that a call that raises rolls back to its own savepoint only.
+        """
+        with WriteBatch(self.conn, max_delay=60) as batch:
+            batch.run(self.insert, 1)
+            with self.assertRaises(sqlite3.IntegrityError):
+                batch.run(self.insert, 1)
+            batch.run(self.insert, 2)
+        self.assertEqual(self.committed(), [1, 2])
+        self.assertEqual(batch.reports[-1]['failed'], 1)
+
+    def test_exception_in_block_rolls_back(self):
+        """
+        Test that an exception escaping the block discards the open batch.
+        """
+        with self.assertRaises(KeyError):
+            with WriteBatch(self.conn, max_delay=60) as batch:
+                batch.run(self.insert, 1)
+                raise KeyError("stop")
+        self.assertEqual(self.committed(), [])
+        self.assertEqual(batch.stats()['rolled_back'], 1)
+        self.assertIsNone(current_batch())
+
+    def test_lost_savepoint_fails_the_batch(self):
+        """
+        Test that a call committing underneath the batch rolls it back and
+        leaves it usable instead of stuck inside a call.
+        """
+        def commit_midway():
+            self.insert(2)
+            self.conn.commit()
+
+        with WriteBatch(self.conn, max_delay=60) as batch:
+            batch.run(self.insert, 1)
+            with self.assertRaises(sqlite3.OperationalError):
+                batch.run(commit_midway)
+            self.assertEqual(batch.stats()['rolled_back'], 1)
+            batch.run(self.insert, 3)
+        self.assertEqual(self.committed(), [1, 2, 3])
+
+    def test_commit_failure_rolls_back(self):
+        """
+        Test that a failed COMMIT rolls the batch back and is raised.
+        """
+        class FailingCommit:
+            """Connection proxy whose commit() fails"""
+            def __init__(self, conn):
+                self._conn = conn
+
+            def __getattr__(self, name):
+                return getattr(self._conn, name)
+
+            def commit(self):
+                raise sqlite3.OperationalError("disk I/O error")
+
+        batch = WriteBatch(FailingCommit(self.conn), max_delay=60)
+        with self.assertRaises(sqlite3.OperationalError):
+            with batch:
+                batch.run(self.insert, 1)
+        self.assertEqual(self.committed(), [])
+        self.assertEqual(batch.stats()['rolled_back'], 1)
+
+    def test_flush_inside_a_call_is_refused(self):
+        """
+        Test that a call can't commit its own batch.
+        """
+        with WriteBatch(self.conn, max_delay=60) as batch:
+            with self.assertRaises(RuntimeError):
+                batch.run(batch.flush)
+            batch.run(self.insert, 1)
+        self.assertEqual(self.committed(), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+"""Unit-of-work batching for @transactional writes.
+
+    with WriteBatch(conn, max_items=500, max_delay=0.2) as batch:
+        for user_id, email in changes:
+            update_user_email(conn, user_id, email)   # a @transactional function
+    print(batch.stats())
+
+Inside the block, @transactional calls on `conn` don't each commit. Each one
+runs in a savepoint of a shared transaction, and a call that raises rolls
+back to its own savepoint only, so the rest of the batch survives. The
+transaction commits (group commit) once `max_items` calls are pending or the
+batch has been open `max_delay` seconds. It also commits when the block ends.
+If an exception escapes the block, the batch still open is rolled back.
+
+Thresholds are checked between calls, because a sqlite3 connection can't be
+committed from a background thread. A batch that goes quiet stays open until
+the next call, flush() or the end of the block.
+"""
+import collections
+import threading
+import time
+
+from cache_store import track_writes
+
+DEFAULT_MAX_ITEMS = 500
+DEFAULT_MAX_DELAY = 0.2
+# Latest per-batch reports kept on each WriteBatch
+REPORT_HISTORY = 100
+
+_local = threading.local()
+
+
+def current_batch(conn=None):
+    """The innermost batch open on this thread (for `conn`, if given), or None"""
+    for batch in reversed(getattr(_local, 'stack', ())):
+        if conn is None or batch.conn is conn:
+            return batch
+    return None
+
+
+class WriteBatch:
+    """Groups many write calls on one connection into few commits"""
+
+    def __init__(self, conn, max_items=DEFAULT_MAX_ITEMS, max_delay=DEFAULT_MAX_DELAY, on_commit=None):
+        if max_items < 1:
+            raise ValueError("max_items must be at least 1")
+        self.conn = conn
+        self.max_items = max_items
+        self.max_delay = max_delay
+        # Called with each batch's report after it commits
+        self.on_commit = on_commit
+        self.reports = collections.deque(maxlen=REPORT_HISTORY)
+
+        self._opened = None
+        self._tracking = None
+        self._pending = 0
+        self._pending_failed = 0
+        self._depth = 0
+        self._metrics = {
+            'batches': 0,
+            'items': 0,
+            'failed': 0,
+            'rolled_back': 0,
+            'batch_latency_total': 0.0,
+            'batch_latency_max': 0.0,
+            'commit_time_total': 0.0,
+        }
+
+    def _begin(self):
+        self._tracking = track_writes(self.conn)
+        self._tracking.__enter__()
+        # Without an explicit BEGIN the first SAVEPOINT would open the
+        # transaction itself, and releasing it would commit
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        self._opened = time.perf_counter()
+
+    def _end(self, error=None):
+        tracking, self._tracking = self._tracking, None
+        self._opened = None
+        self._pending = self._pending_failed = 0
+        # Cached results are dropped only for the tables of a committed batch
+        if error is None:
+            tracking.__exit__(None, None, None)
+        else:
+            tracking.__exit__(type(error), error, error.__traceback__)
+
+    def run(self, func, *args, **kwargs):
+        """Calls func in its own savepoint; if it raises, only its writes are undone
+
+        If the savepoint itself is lost (func committed or rolled back the
+        connection, or SQLite couldn't roll back to it) the whole open batch
+        is rolled back and the error raised.
+        """
+        if self._opened is None:
+            self._begin()
+        self.conn.execute("SAVEPOINT batch_item")
+        self._depth += 1
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            try:
+                self._close_savepoint(undo=True)
+            finally:
+                self._depth -= 1
+            if self._depth == 0:
+                self._pending_failed += 1
+                self._maybe_commit()
+            raise
+        try:
+            self._close_savepoint(undo=False)
+        finally:
+            self._depth -= 1
+        if self._depth == 0:
+            self._pending += 1
+            self._maybe_commit()
+        return result
+
+    def _close_savepoint(self, undo):
+        if self._opened is None:
+            # A nested call already lost its savepoint and rolled the batch back
+            if undo:
+                return
+            raise RuntimeError("Write batch was rolled back during one of its calls")
+        try:
+            if undo:
+                self.conn.execute("ROLLBACK TO batch_item")
+            self.conn.execute("RELEASE batch_item")
+        except BaseException as e:
+            self._abort(e)
+            raise
+
+    def _abort(self, error):
+        try:
+            self.conn.rollback()
+        finally:
+            self._metrics['rolled_back'] += 1
+            self._end(error)
+
+    def _maybe_commit(self):
+        if (self._pending + self._pending_failed >= self.max_items
+                or time.perf_counter() - self._opened >= self.max_delay):
+            self.flush()
+
+    def flush(self):
+        """Commits the open batch now; returns its report, or None if nothing was open"""
+        if self._opened is None:
+            return None
+        if self._depth:
+            raise RuntimeError("Can't commit a batch from inside one of its calls")
+        commit_started = time.perf_counter()
+        try:
+            self.conn.commit()
+        except BaseException as e:
+            self._abort(e)
+            raise
+        finished = time.perf_counter()
+
+        report = {
+            'items': self._pending,
+            'failed': self._pending_failed,
+            'latency': finished - self._opened,
+            'commit_time': finished - commit_started,
+        }
+        self._end()
+        self._metrics['batches'] += 1
+        self._metrics['items'] += report['items']
+        self._metrics['failed'] += report['failed']
+        self._metrics['batch_latency_total'] += report['latency']
+        self._metrics['batch_latency_max'] = max(self._metrics['batch_latency_max'], report['latency'])
+        self._metrics['commit_time_total'] += report['commit_time']
+        self.reports.append(report)
+        if self.on_commit is not None:
+            self.on_commit(report)
+        return report
+
+    def rollback(self):
+        """Discards every call made since the last commit"""
+        if self._opened is None:
+            return
+        self._abort(RuntimeError("Write batch rolled back"))
+
+    def stats(self):
+        stats = dict(self._metrics)
+        stats['pending'] = self._pending + self._pending_failed
+        stats['batch_latency_avg'] = (stats['batch_latency_total'] / stats['batches']
+                                      if stats['batches'] else 0.0)
+        return stats
+
+    def __enter__(self):
+        if not hasattr(_local, 'stack'):
+            _local.stack = []
+        _local.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.stack.remove(self)
+        if exc_type is None:
+            self.flush()
+        else:
+            self.rollback()
+        return False
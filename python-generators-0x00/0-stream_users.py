@@ -1,32 +1,41 @@
-import mysql.connector
 from mysql.connector import Error
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',      
-    'password': 'Pesem1000',
-    'database': 'ALX_prodev',
-    'port': 3306
-}
+from db_pool import DEFAULT_PREFETCH_SIZE, get_pool
+from row_types import make_user_row
 
-def stream_users():
+def stream_users(prefetch_size=DEFAULT_PREFETCH_SIZE, buffered=False, row_format='dict'):
+    """Streams users one by one through a server-side (unbuffered) cursor
+
+    Rows are pulled from the server prefetch_size at a time, so memory stays
+    flat however large user_data is. buffered=True loads the whole result
+    set client-side first and is only kept for comparison benchmarks.
+    row_format='record' yields compact UserRow tuples instead of dicts.
+    """
+    if row_format not in ('dict', 'record'):
+        raise ValueError(f"row_format must be 'dict' or 'record', not {row_format!r}")
 
     connection = None
     cursor = None
+    finished = False
+    pool = get_pool()
     
     try:
-        # Establish database connection
-        connection = mysql.connector.connect(**DB_CONFIG)
-        cursor = connection.cursor(dictionary=True)
+        # Check out a pooled connection instead of opening a new one
+        connection = pool.acquire()
+        cursor = connection.cursor(dictionary=(row_format == 'dict'), buffered=buffered)
         
         # Execute query to fetch all users
         query = "SELECT user_id, name, email, age FROM user_data"
         cursor.execute(query)
         
-        # Stream results one row at a time using a single loop
-        for row in cursor:
-            yield row
+        # Stream results one row at a time using a single loop, refilling
+        # from the server one fetchmany block at a time
+        while True:
+            rows = cursor.fetchmany(prefetch_size)
+            if not rows:
+                break
+            yield from (rows if row_format == 'dict' else map(make_user_row, rows))
+        finished = True
             
     except Error as e:
         print(f"Database error: {e}")
@@ -35,11 +44,12 @@ def stream_users():
         print(f"Error streaming users: {e}")
         raise
     finally:
-        # Clean up resources
-        if cursor:
+        # Clean up resources. Closing an unbuffered cursor reads every row
+        # left on the server, so a stream stopped early drops its connection.
+        if cursor and finished:
             cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
+        if connection:
+            pool.release(connection, discard=not finished)
 
 
 if __name__ == "__main__":
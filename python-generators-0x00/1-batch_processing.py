@@ -1,29 +1,37 @@
-import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, PoolError
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': 'Pesem1000',
-    'database': 'ALX_prodev',
-    'port': 3306
-}
+from db_pool import get_pool
+from predicates import OVER_25, compile_predicate
+from row_types import ROW_FORMATS, convert_rows
 
 
-def stream_users_in_batches(batch_size):
+def stream_users_in_batches(batch_size, predicate=None, row_format='dict'):
+    """Yields lists of up to batch_size users matching predicate
+
+    The SQL-expressible part of the predicate becomes the query's WHERE
+    clause so non-matching rows never leave the database; only terms that
+    cannot be expressed in SQL are filtered client-side.
+
+    row_format picks the batch shape: 'dict' (list of dicts), 'record'
+    (list of compact UserRow tuples) or 'columns' (one UserColumns object).
+    """
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"row_format must be one of {ROW_FORMATS}, not {row_format!r}")
+    compiled = compile_predicate(predicate)
+    as_dicts = row_format == 'dict'
 
     connection = None
     cursor = None
+    pool = get_pool()
 
     try:
-        # Establish database connection
-        connection = mysql.connector.connect(**DB_CONFIG)
-        cursor = connection.cursor(dictionary=True)
+        # Check out a pooled connection instead of opening a new one
+        connection = pool.acquire()
+        cursor = connection.cursor(dictionary=as_dicts)
         
-        # Execute query to fetch all users
-        query = "SELECT user_id, name, email, age FROM user_data"
-        cursor.execute(query)
+        # Execute query to fetch the matching users
+        query = "SELECT user_id, name, email, age FROM user_data" + compiled.where_clause()
+        cursor.execute(query, compiled.params)
         
         # Loop 1: Fetch and yield batches
         while True:
@@ -34,41 +42,34 @@ def stream_users_in_batches(batch_size):
             if not batch:
                 break
                 
-            # Yield the current batch
-            yield batch
+            # Yield the current batch, minus rows rejected client-side
+            if as_dicts:
+                yield compiled.filter_rows(batch)
+            else:
+                yield convert_rows(batch, row_format, compiled.residual)
             
+    except PoolError:
+        # A checkout timeout is not the end of the data: let the caller see it
+        raise
     except Error as e:
         print(f"Database error: {e}")
     finally:
         # Clean up resources
         if cursor:
             cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
+        if connection:
+            pool.release(connection)
 
-def batch_processing(batch_size):
+def batch_processing(batch_size, predicate=OVER_25):
     try:
-        # Loop 2: Process each batch from the stream
-        for batch in stream_users_in_batches(batch_size):
-            # Filter users over 25 in the current batch
-            filtered_batch = []
-
-            # Loop 3: Filter users in current batch
-            for user in batch:
-                if user['age'] > 25:
-                    filtered_batch.append(user)
-
-            
-            yield filtered_batch
+        # Loop 2: Process each batch from the stream. The age filter is
+        # pushed down into the query, so batches only hold users over 25.
+        for batch in stream_users_in_batches(batch_size, predicate):
+            yield batch
 
     except Exception as e:
         print(f"Error in batch processing: {e}")
-    finally:
-        
-        return 
-        
-
-
+        raise
 
 
 if __name__ == "__main__":
@@ -1,35 +1,38 @@
-import mysql.connector
-from mysql.connector import Error
+import base64
+import json
+import queue
+import threading
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': 'Pesem1000',
-    'database': 'ALX_prodev',
-    'port': 3306
-}
+from mysql.connector import Error, PoolError
 
+from db_pool import get_pool, pool_stats
+from predicates import OVER_25, compile_predicate
 
-def paginate_users(page_size, offset):
-    
+
+def paginate_users(page_size, offset, predicate=None):
+    """Fetches one page of users; the SQL part of predicate is pushed down"""
+    compiled = compile_predicate(predicate)
     connection = None
     cursor = None
+    pool = get_pool()
     
     try:
-        # Establish database connection
-        connection = mysql.connector.connect(**DB_CONFIG)
+        # Check out a pooled connection instead of opening a new one
+        connection = pool.acquire()
         cursor = connection.cursor(dictionary=True)
         
         # Execute query with LIMIT and OFFSET for pagination
-        query = "SELECT * FROM user_data LIMIT %s OFFSET %s"
-        cursor.execute(query, (page_size, offset))
+        query = "SELECT * FROM user_data" + compiled.where_clause() + " LIMIT %s OFFSET %s"
+        cursor.execute(query, compiled.params + (page_size, offset))
         
         # Fetch all rows for this page
         users = cursor.fetchall()
         
         return users
         
+    except PoolError:
+        # A checkout timeout is not the end of the data: let the caller see it
+        raise
     except Error as e:
         print(f"Database error: {e}")
         return []
@@ -37,50 +40,189 @@ def paginate_users(page_size, offset):
         # Clean up resources
         if cursor:
             cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
+        if connection:
+            pool.release(connection)
+
+
+# End-of-stream marker passed through the prefetch queue
+_DONE = object()
+
+
+def _prefetched(pages, depth):
+    """Iterates `pages` on a background thread, staying up to `depth` pages ahead
+
+    The caller processes page k while pages k+1..k+depth are fetched, so a
+    walk takes roughly max(DB time, consumer time) instead of their sum.
+    Errors raised while fetching are re-raised in the caller.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # Bounded put that gives up once the consumer has gone away
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
+    def produce():
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(e)
+        finally:
+            pages.close()
 
-def lazy_paginate(page_size):
+    producer = threading.Thread(target=produce, name='lazy-paginate-prefetch', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Also runs when the caller stops early: release the producer and
+        # wait for its in-flight fetch to hand its connection back
+        stop.set()
+        producer.join()
+
+
+def lazy_paginate(page_size, predicate=None, prefetch=0):
+    """Lazily yields pages of users; prefetch=N fetches N pages ahead in the background"""
+    if prefetch > 0:
+        yield from _prefetched(lazy_paginate(page_size, predicate), prefetch)
+        return
     
     offset = 0
+    compiled = compile_predicate(predicate)
     
     # Single loop as required
     while True:
         # Fetch the next page of users
-        users_page = paginate_users(page_size, offset)
+        users_page = paginate_users(page_size, offset, predicate)
         
-        # If no more users, stop the generator
+        # If no more users, stop the generator. Checked before the
+        # client-side residual filter, which may legitimately empty a page.
         if not users_page:
             break
             
         # Yield the current page
-        yield users_page
+        yield compiled.filter_rows(users_page)
         
         # Move to the next page
         offset += page_size
 
 
-def process_paginated_users(page_size):
+def encode_cursor(last_user_id):
+    """Builds an opaque, URL-safe resume token from the last user_id seen"""
+    payload = json.dumps({'after': last_user_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_cursor(token):
+    """Returns the user_id stored in a resume token (None for a fresh walk)"""
+    if not token:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode('ascii')))['after']
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid pagination cursor: {token!r}") from e
+
+
+def paginate_users_after(page_size, last_user_id=None, predicate=None):
+    """Fetches the page of users whose user_id sorts after last_user_id
+
+    Seeks straight to the position in the primary key index, so every page
+    costs the same no matter how deep into the table it is.
+    """
+    compiled = compile_predicate(predicate)
+    connection = None
+    cursor = None
+    pool = get_pool()
+
+    try:
+        connection = pool.acquire()
+        cursor = connection.cursor(dictionary=True)
+
+        if last_user_id is None:
+            query = ("SELECT * FROM user_data" + compiled.where_clause()
+                     + " ORDER BY user_id LIMIT %s")
+            cursor.execute(query, compiled.params + (page_size,))
+        else:
+            query = ("SELECT * FROM user_data WHERE user_id > %s"
+                     + compiled.where_clause(" AND ") + " ORDER BY user_id LIMIT %s")
+            cursor.execute(query, (last_user_id,) + compiled.params + (page_size,))
+
+        return cursor.fetchall()
+
+    except Error as e:
+        # Unlike paginate_users, don't turn a failure into an empty page: that
+        # would look like the end of the table to a resumable export.
+        print(f"Database error: {e}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            pool.release(connection)
+
+
+def lazy_paginate_keyset(page_size, cursor=None, predicate=None, prefetch=0):
+    """Lazily yields (users_page, next_cursor) pairs ordered by user_id
+
+    Persist next_cursor after handling a page; passing it back in resumes
+    the walk right after that page. prefetch works as in lazy_paginate.
+    """
+    if prefetch > 0:
+        yield from _prefetched(lazy_paginate_keyset(page_size, cursor, predicate), prefetch)
+        return
+
+    last_user_id = decode_cursor(cursor)
+    compiled = compile_predicate(predicate)
+
+    while True:
+        users_page = paginate_users_after(page_size, last_user_id, predicate)
+
+        if not users_page:
+            break
+
+        last_user_id = users_page[-1]['user_id']
+        yield compiled.filter_rows(users_page), encode_cursor(last_user_id)
+
+
+def count_users(predicate=None):
+    """Number of users matching the SQL part of predicate"""
+    compiled = compile_predicate(predicate)
+    with get_pool().connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM user_data" + compiled.where_clause(),
+                           compiled.params)
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+
+def process_paginated_users(page_size, predicate=OVER_25):
     
     try:
-        # Process each page from the lazy paginator
-        for users_page in lazy_paginate(page_size):
-            # Filter users over 25 in the current page
-            filtered_page = []
-            
-            # Filter users in current page
-            for user in users_page:
-                if user['age'] > 25:
-                    filtered_page.append(user)
-            
-           
-            yield filtered_page
+        # Process each page from the lazy paginator; the age filter runs in
+        # the database, so pages only carry users over 25
+        for users_page in lazy_paginate(page_size, predicate):
+            yield users_page
             
     except Exception as e:
         print(f"Error in paginated processing: {e}")
-    finally:
-        return 
+        raise
 
 
 if __name__ == "__main__":
@@ -93,16 +235,11 @@ if __name__ == "__main__":
         
         page_number = 1
         total_users_over_25 = 0
-        total_users_processed = 0
         
         # Process pages and filter users over 25
         for filtered_page in process_paginated_users(page_size):
             print(f"\nPage {page_number}:")
             
-            # Count total users in this page (before filtering)
-            original_page = paginate_users(page_size, (page_number - 1) * page_size)
-            total_users_processed += len(original_page)
-            
             if filtered_page:
                 for user in filtered_page:
                     print(f"  User ID: {user['user_id']}, Name: {user['name']}, Email: {user['email']}, Age: {user['age']}")
@@ -114,8 +251,12 @@ if __name__ == "__main__":
         
         print("-" * 50)
         print(f"Total pages processed: {page_number - 1}")
-        print(f"Total users processed: {total_users_processed}")
+        # The filter ran in the database, so count what it looked at there
+        print(f"Total users processed: {count_users()}")
         print(f"Total users over 25: {total_users_over_25}")
+
+        stats = pool_stats()
+        print(f"Connections created: {stats['created']} for {stats['checkouts']} page fetches")
         
         print("\n" + "=" * 50)
         print("Direct lazy_paginate usage example:")
@@ -132,6 +273,21 @@ if __name__ == "__main__":
             # Stop after 3 pages for demo
             if page_num >= 3:
                 break
+
+        print("\n" + "=" * 50)
+        print("Keyset pagination with a resumable cursor:")
+        print("=" * 50)
+
+        resume_token = None
+        for page_num, (users_page, resume_token) in enumerate(lazy_paginate_keyset(3), 1):
+            print(f"\nKeyset Page {page_num} ({len(users_page)} users), cursor={resume_token}")
+            if page_num >= 2:
+                break
+
+        # Picking the walk back up from the saved token
+        for users_page, _ in lazy_paginate_keyset(3, cursor=resume_token):
+            print(f"\nResumed after cursor, next page starts at {users_page[0]['user_id']}")
+            break
         
     except Exception as e:
         print(f"An error occurred: {e}")
\ No newline at end of file
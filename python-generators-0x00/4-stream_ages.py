@@ -1,50 +1,113 @@
-import mysql.connector
-from mysql.connector import Error
+from array import array
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': 'Pesem1000',
-    'database': 'ALX_prodev',
-    'port': 3306
-}
+from mysql.connector import Error, PoolError
 
+from aggregates import AgeHistogram, RunningStats, read_age_stats, sql_age_stats
+from db_pool import DEFAULT_PREFETCH_SIZE, get_pool
 
-def stream_user_ages():
-    
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Ages per block in the columnar mode
+DEFAULT_BLOCK_SIZE = 65536
+
+
+def stream_user_ages(prefetch_size=DEFAULT_PREFETCH_SIZE, buffered=False):
+    """Yields ages one by one from a server-side (unbuffered) cursor
+
+    Rows arrive in fetchmany blocks of prefetch_size rather than one
+    fetchone() call per row.
+    """
     connection = None
     cursor = None
+    finished = False
+    pool = get_pool()
     
     try:
-        # Establish database connection
-        connection = mysql.connector.connect(**DB_CONFIG)
-        cursor = connection.cursor()
+        # Check out a pooled connection instead of opening a new one
+        connection = pool.acquire()
+        cursor = connection.cursor(buffered=buffered)
         
         # Execute query to fetch only ages
         query = "SELECT age FROM user_data"
         cursor.execute(query)
         
-        # Loop 1: Fetch and yield ages one by one
+        # Loop 1: Fetch a block of rows, then yield its ages one by one
         while True:
-            # Fetch one row at a time
-            row = cursor.fetchone()
+            rows = cursor.fetchmany(prefetch_size)
             
             # If no more rows, break the loop
-            if row is None:
+            if not rows:
                 break
             
+            yield from (row[0] for row in rows)
+        finished = True
             
-            yield row[0]
-            
+    except PoolError:
+        # A checkout timeout is not the end of the data: let the caller see it
+        raise
     except Error as e:
         print(f"Database error: {e}")
     finally:
-        # Clean up resources
-        if cursor:
+        # Clean up resources. Closing an unbuffered cursor reads every row
+        # left on the server, so a stream stopped early drops its connection.
+        if cursor and finished:
             cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
+        if connection:
+            pool.release(connection, discard=not finished)
+
+
+def stream_user_age_blocks(block_size=DEFAULT_BLOCK_SIZE):
+    """Yields ages in float64 blocks: numpy arrays, or array('d') without numpy
+
+    The query casts the DECIMAL column to DOUBLE server-side so the driver
+    never builds a Decimal per row.
+    """
+    connection = None
+    cursor = None
+    finished = False
+    pool = get_pool()
+
+    try:
+        connection = pool.acquire()
+        cursor = connection.cursor(buffered=False)
+
+        # age + 0E0 is DOUBLE arithmetic, i.e. a cast that works on MySQL 5.7
+        cursor.execute("SELECT age + 0E0 FROM user_data")
+
+        while True:
+            rows = cursor.fetchmany(block_size)
+            if not rows:
+                break
+            if np is not None:
+                yield np.fromiter((row[0] for row in rows), dtype=np.float64, count=len(rows))
+            else:
+                yield array('d', (row[0] for row in rows))
+        finished = True
+
+    except PoolError:
+        # A checkout timeout is not the end of the data: let the caller see it
+        raise
+    except Error as e:
+        print(f"Database error: {e}")
+    finally:
+        # As in stream_user_ages: don't drain the rest of an abandoned stream
+        if cursor and finished:
+            cursor.close()
+        if connection:
+            pool.release(connection, discard=not finished)
+
+
+def calculate_age_distribution(block_size=DEFAULT_BLOCK_SIZE):
+    """Vectorized stats plus an exact histogram of all ages in one pass"""
+    stats = RunningStats()
+    histogram = AgeHistogram()
+    for block in stream_user_age_blocks(block_size):
+        stats.merge(RunningStats.from_block(block))
+        histogram.add_block(block)
+    return stats, histogram
 
 
 def calculate_average_age():
@@ -64,6 +127,11 @@ def calculate_average_age():
         return None
 
 
+def calculate_age_stats():
+    """Count, sum, min, max, mean and variance of all ages in a single pass"""
+    return RunningStats().update(stream_user_ages()).as_dict()
+
+
 def demonstrate_memory_efficiency():
     
     print("=== Memory Efficiency Demonstration ===")
@@ -101,27 +169,32 @@ if __name__ == "__main__":
         demonstrate_memory_efficiency()
         
        
-        print("\n=== Multiple Iterations Example ===")
-        print("Each iteration opens a fresh database connection...")
-        
-        # First iteration - count users
-        user_count = 0
-        for age in stream_user_ages():
-            user_count += 1
-        print(f"Total users processed: {user_count}")
+        print("\n=== Single Pass Statistics ===")
+        print("Count, range and variance from one walk of the table...")
         
-        # Second iteration - find min/max age
-        min_age = float('inf')
-        max_age = float('-inf')
+        stats = calculate_age_stats()
+        print(f"Total users processed: {stats['count']}")
+        if stats['count'] > 0:
+            print(f"Age range: {stats['min']} to {stats['max']}")
+            print(f"Age variance: {stats['variance']:.2f}")
         
-        for age in stream_user_ages():
-            if age < min_age:
-                min_age = age
-            if age > max_age:
-                max_age = age
+        print("\n=== Columnar Block Mode ===")
+        block_stats, age_histogram = calculate_age_distribution()
+        if block_stats.count > 0:
+            p50, p90, p99 = age_histogram.percentiles([50, 90, 99])
+            print(f"Mean {block_stats.mean:.2f}, stddev {block_stats.stddev:.2f}")
+            print(f"Median {p50}, p90 {p90}, p99 {p99}")
+            counts, edges = age_histogram.histogram(bins=5)
+            for count, low, high in zip(counts, edges, edges[1:]):
+                print(f"  {low:6.2f} - {high:6.2f}: {count}")
         
-        if user_count > 0:
-            print(f"Age range: {min_age} to {max_age}")
+        print("\n=== Without Streaming ===")
+        pushed_down = sql_age_stats()
+        print(f"Single SQL aggregate: {pushed_down['count']} users, mean {pushed_down['mean']}")
+        materialized = read_age_stats()
+        if materialized is not None:
+            print(f"Materialized user_age_stats: {materialized['count']} users, "
+                  f"mean {materialized['mean']:.2f}")
         
         print("-" * 50)
         print("Memory usage: Only a few variables stored at any time!")
@@ -0,0 +1,405 @@
+import math
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from decimal import Decimal
+from itertools import accumulate
+
+from mysql.connector import Error
+
+from db_pool import pooled_connection
+
+try:
+    import numpy as np
+except ImportError:  # the block helpers fall back to array('d')
+    np = None
+
+
+class RunningStats:
+    """One-pass count/sum/min/max/mean/variance (Welford's algorithm)
+
+    Feed values with add() or update(); partial results computed elsewhere
+    (another batch, another worker) can be combined with merge().
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    @classmethod
+    def from_block(cls, block):
+        """Builds the stats of a whole float block at once (vectorized under numpy)"""
+        stats = cls()
+        if len(block) == 0:
+            return stats
+        if np is None or not isinstance(block, np.ndarray):
+            return stats.update(block)
+        stats.count = int(block.size)
+        stats.total = float(block.sum())
+        stats.min = float(block.min())
+        stats.max = float(block.max())
+        stats._mean = stats.total / stats.count
+        deviations = block - stats._mean
+        stats._m2 = float(np.dot(deviations, deviations))
+        return stats
+
+    def merge(self, other):
+        """Folds another RunningStats into this one (Chan et al. combination)"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.total = other.count, other.total
+            self.min, self.max = other.min, other.max
+            self._mean, self._m2 = other._mean, other._m2
+            return self
+
+        count = self.count + other.count
+        delta = other._mean - self._mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self._mean += delta * other.count / count
+        self.count = count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def mean(self):
+        return self._mean if self.count else None
+
+    @property
+    def variance(self):
+        """Population variance (matches MySQL VAR_POP)"""
+        return self._m2 / self.count if self.count else None
+
+    @property
+    def stddev(self):
+        variance = self.variance
+        return math.sqrt(variance) if variance is not None else None
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'variance': self.variance,
+        }
+
+
+def block_age_stats(blocks):
+    """Merges per-block RunningStats over an iterable of float age blocks"""
+    stats = RunningStats()
+    for block in blocks:
+        stats.merge(RunningStats.from_block(block))
+    return stats
+
+
+# user_data.age is DECIMAL(5,2): every value is a whole number of cents in
+# [-99999, 99999], so a histogram with one bin per cent is exact.
+_CENT_OFFSET = 99999
+_CENT_BINS = 2 * _CENT_OFFSET + 1
+
+
+class AgeHistogram:
+    """Exact age distribution at DECIMAL(5,2) resolution
+
+    Holds one counter per possible age value (~1.6 MB) instead of the ages
+    themselves, so percentiles over tens of millions of rows are exact and
+    memory stays constant.
+    """
+
+    def __init__(self):
+        if np is not None:
+            self.counts = np.zeros(_CENT_BINS, dtype=np.int64)
+        else:
+            self.counts = array('q', bytes(8 * _CENT_BINS))
+        self.count = 0
+
+    def add_block(self, block):
+        if len(block) == 0:
+            return self
+        if np is not None and isinstance(block, np.ndarray):
+            cents = np.rint(block * 100).astype(np.int64) + _CENT_OFFSET
+            self.counts += np.bincount(cents, minlength=_CENT_BINS)
+        else:
+            for value in block:
+                self.counts[int(round(value * 100)) + _CENT_OFFSET] += 1
+        self.count += len(block)
+        return self
+
+    def merge(self, other):
+        if np is not None and isinstance(self.counts, np.ndarray):
+            self.counts += other.counts
+        else:
+            for index, value in enumerate(other.counts):
+                if value:
+                    self.counts[index] += value
+        self.count += other.count
+        return self
+
+    def percentiles(self, qs):
+        """Nearest-rank percentiles for each q in qs (0-100)"""
+        if self.count == 0:
+            return [None for _ in qs]
+        ranks = [max(1, math.ceil(q / 100 * self.count)) for q in qs]
+        if np is not None and isinstance(self.counts, np.ndarray):
+            cumulative = np.cumsum(self.counts)
+            indexes = np.searchsorted(cumulative, ranks)
+        else:
+            cumulative = list(accumulate(self.counts))
+            indexes = [bisect_left(cumulative, rank) for rank in ranks]
+        return [(int(index) - _CENT_OFFSET) / 100 for index in indexes]
+
+    def percentile(self, q):
+        return self.percentiles([q])[0]
+
+    def _occupied(self):
+        """Returns (age, count) pairs for every age value seen at least once"""
+        if np is not None and isinstance(self.counts, np.ndarray):
+            indexes = np.nonzero(self.counts)[0]
+        else:
+            indexes = [index for index, count in enumerate(self.counts) if count]
+        return [((int(index) - _CENT_OFFSET) / 100, int(self.counts[index])) for index in indexes]
+
+    def histogram(self, bins=10, value_range=None):
+        """Returns (counts, edges) re-binned to `bins` equal-width buckets"""
+        occupied = self._occupied()
+        if not occupied:
+            return [], []
+        low, high = value_range or (occupied[0][0], occupied[-1][0])
+        if high <= low:
+            high = low + 0.01
+
+        if np is not None:
+            values, weights = zip(*occupied)
+            counts, edges = np.histogram(values, bins=bins, range=(low, high), weights=weights)
+            return counts.astype(np.int64).tolist(), edges.tolist()
+
+        width = (high - low) / bins
+        counts = [0] * bins
+        for value, weight in occupied:
+            if low <= value <= high:
+                counts[min(int((value - low) / width), bins - 1)] += weight
+        return counts, [low + i * width for i in range(bins + 1)]
+
+
+@contextmanager
+def _connection_or_pooled(connection):
+    if connection is not None:
+        yield connection
+    else:
+        with pooled_connection() as pooled:
+            yield pooled
+
+
+def sql_age_stats(connection=None):
+    """Computes every age statistic in a single SQL aggregate query"""
+    query = """
+    SELECT COUNT(age), SUM(age), MIN(age), MAX(age), AVG(age), VAR_POP(age)
+    FROM user_data
+    """
+    with _connection_or_pooled(connection) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query)
+            count, total, minimum, maximum, mean, variance = cursor.fetchone()
+        finally:
+            cursor.close()
+    return _stats_dict(count, total, minimum, maximum, mean, variance)
+
+
+def _float_or_none(value):
+    return float(value) if value is not None else None
+
+
+def _stats_dict(count, total, minimum, maximum, mean, variance):
+    """Same keys and float types as RunningStats.as_dict(), from SQL's DECIMAL results"""
+    return {
+        'count': int(count),
+        'sum': float(total or 0),
+        'min': _float_or_none(minimum),
+        'max': _float_or_none(maximum),
+        'mean': _float_or_none(mean),
+        'variance': _float_or_none(variance),
+    }
+
+
+NO_SUCH_TABLE_ERRNO = 1146  # ER_NO_SUCH_TABLE
+
+# Single-row table kept current by triggers on user_data. Sums are DECIMAL so
+# the running totals stay exact no matter how many inserts/deletes they see.
+_CREATE_AGE_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS user_age_stats (
+    id TINYINT PRIMARY KEY,
+    user_count BIGINT NOT NULL,
+    age_sum DECIMAL(22,2) NOT NULL,
+    age_sum_sq DECIMAL(30,4) NOT NULL,
+    age_min DECIMAL(5,2) NULL,
+    age_max DECIMAL(5,2) NULL
+)
+"""
+
+_REFRESH_AGE_STATS = """
+REPLACE INTO user_age_stats (id, user_count, age_sum, age_sum_sq, age_min, age_max)
+SELECT 1, COUNT(age), COALESCE(SUM(age), 0), COALESCE(SUM(age * age), 0), MIN(age), MAX(age)
+FROM user_data
+"""
+
+_AGE_STATS_TRIGGERS = {
+    'trg_user_data_age_insert': """
+    CREATE TRIGGER trg_user_data_age_insert AFTER INSERT ON user_data
+    FOR EACH ROW
+    UPDATE user_age_stats SET
+        user_count = user_count + 1,
+        age_sum = age_sum + NEW.age,
+        age_sum_sq = age_sum_sq + NEW.age * NEW.age,
+        age_min = IF(age_min IS NULL OR NEW.age < age_min, NEW.age, age_min),
+        age_max = IF(age_max IS NULL OR NEW.age > age_max, NEW.age, age_max)
+    WHERE id = 1
+    """,
+    # Removing the current min/max can't be undone incrementally; re-read the
+    # extreme from idx_age, which is a single index lookup.
+    'trg_user_data_age_delete': """
+    CREATE TRIGGER trg_user_data_age_delete AFTER DELETE ON user_data
+    FOR EACH ROW
+    UPDATE user_age_stats SET
+        user_count = user_count - 1,
+        age_sum = age_sum - OLD.age,
+        age_sum_sq = age_sum_sq - OLD.age * OLD.age,
+        age_min = (SELECT MIN(age) FROM user_data),
+        age_max = (SELECT MAX(age) FROM user_data)
+    WHERE id = 1
+    """,
+    'trg_user_data_age_update': """
+    CREATE TRIGGER trg_user_data_age_update AFTER UPDATE ON user_data
+    FOR EACH ROW
+    UPDATE user_age_stats SET
+        age_sum = age_sum - OLD.age + NEW.age,
+        age_sum_sq = age_sum_sq - OLD.age * OLD.age + NEW.age * NEW.age,
+        age_min = (SELECT MIN(age) FROM user_data),
+        age_max = (SELECT MAX(age) FROM user_data)
+    WHERE id = 1 AND OLD.age <> NEW.age
+    """,
+}
+
+
+def create_age_stats_table(connection):
+    """Creates the materialized user_age_stats row and the triggers that maintain it
+
+    Every row a trigger sees updates the single stats row, which serializes
+    concurrent writers on it; bulk loads run inside age_stats_suspended().
+    """
+    try:
+        cursor = connection.cursor()
+        cursor.execute(_CREATE_AGE_STATS_TABLE)
+        for name, ddl in _AGE_STATS_TRIGGERS.items():
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(ddl)
+        # Backfill from the current table contents
+        cursor.execute(_REFRESH_AGE_STATS)
+        connection.commit()
+        cursor.close()
+        print("Table 'user_age_stats' and its triggers created successfully")
+        return True
+    except Error as e:
+        print(f"Error creating age stats table: {e}")
+        return False
+
+
+def drop_age_stats_triggers(connection):
+    """Drops the triggers maintaining user_age_stats; returns True if any existed"""
+    cursor = connection.cursor()
+    try:
+        placeholders = ", ".join(["%s"] * len(_AGE_STATS_TRIGGERS))
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.triggers "
+            f"WHERE trigger_schema = DATABASE() AND trigger_name IN ({placeholders})",
+            tuple(_AGE_STATS_TRIGGERS)
+        )
+        existed = cursor.fetchone()[0] > 0
+        for name in _AGE_STATS_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        return existed
+    finally:
+        cursor.close()
+
+
+@contextmanager
+def age_stats_suspended(connection):
+    """Runs a bulk load without the per-row user_age_stats triggers
+
+    The triggers are dropped for the duration of the block, then reinstalled
+    and the stats row recomputed in one scan. Tables that had no triggers
+    are left without them.
+    """
+    existed = drop_age_stats_triggers(connection)
+    try:
+        yield
+    finally:
+        if existed:
+            create_age_stats_table(connection)
+
+
+def refresh_age_stats(connection=None):
+    """Recomputes user_age_stats from scratch, e.g. after a bulk load with triggers off"""
+    with _connection_or_pooled(connection) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(_REFRESH_AGE_STATS)
+            conn.commit()
+        finally:
+            cursor.close()
+
+
+def read_age_stats(connection=None):
+    """Reads the materialized age statistics: one primary-key lookup, no scan"""
+    query = """
+    SELECT user_count, age_sum, age_sum_sq, age_min, age_max
+    FROM user_age_stats WHERE id = 1
+    """
+    with _connection_or_pooled(connection) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query)
+            row = cursor.fetchone()
+        except Error as e:
+            # Not created yet (create_age_stats_table never ran): no stats
+            if e.errno != NO_SUCH_TABLE_ERRNO:
+                raise
+            row = None
+        finally:
+            cursor.close()
+
+    if row is None:
+        return None
+    count, total, total_sq, minimum, maximum = row
+    mean = variance = None
+    if count:
+        # In Decimal first: sum_sq / n - mean^2 cancels badly in float
+        count_dec = Decimal(count)
+        mean = total / count_dec
+        variance = total_sq / count_dec - mean * mean
+    return _stats_dict(count, total, minimum, maximum, mean, variance)
@@ -0,0 +1,220 @@
+import asyncio
+import weakref
+
+import aiomysql
+
+from db_pool import DB_CONFIG, DEFAULT_POOL_SIZE, DEFAULT_PREFETCH_SIZE
+from predicates import compile_predicate
+
+lazy_paginate_sync = __import__('2-lazy_paginate')
+
+# aiomysql pools and asyncio.Lock belong to the loop they were first used on,
+# so each running loop gets its own pool and its own creation lock
+_pools = weakref.WeakKeyDictionary()
+_pool_locks = weakref.WeakKeyDictionary()
+_shutdown_hooks = weakref.WeakKeyDictionary()
+
+
+async def _close_at_shutdown(loop, pool):
+    """Parked at its yield until the loop shuts down its async generators
+
+    asyncio.run() does that before closing the loop, which closes the pool
+    even when nobody called close_async_pool().
+    """
+    try:
+        yield
+    finally:
+        if _pools.get(loop) is pool:
+            del _pools[loop]
+        pool.close()
+        await pool.wait_closed()
+
+
+async def get_async_pool(size=DEFAULT_POOL_SIZE):
+    """Returns the running loop's aiomysql pool, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    lock = _pool_locks.get(loop)
+    if lock is None:
+        lock = _pool_locks[loop] = asyncio.Lock()
+    async with lock:
+        pool = _pools.get(loop)
+        if pool is None or pool.closed:
+            pool = await aiomysql.create_pool(
+                host=DB_CONFIG['host'],
+                port=DB_CONFIG['port'],
+                user=DB_CONFIG['user'],
+                password=DB_CONFIG['password'],
+                db=DB_CONFIG['database'],
+                minsize=1,
+                maxsize=size,
+                autocommit=True,
+            )
+            _pools[loop] = pool
+            # The loop only keeps weak references to its async generators
+            hook = _shutdown_hooks[loop] = _close_at_shutdown(loop, pool)
+            await hook.asend(None)
+    return pool
+
+
+async def close_async_pool():
+    """Closes the running loop's pool now, if it has one"""
+    hook = _shutdown_hooks.pop(asyncio.get_running_loop(), None)
+    if hook is not None:
+        await hook.aclose()
+
+
+async def _stream_blocks(query, params=(), block_size=DEFAULT_PREFETCH_SIZE, dictionary=True):
+    """Yields fetchmany blocks from a server-side cursor on a pooled connection
+
+    The next block is only read when the consumer asks for it, and the
+    server-side cursor leaves unread rows in the socket, so a slow consumer
+    throttles the server through TCP flow control instead of buffering.
+    """
+    pool = await get_async_pool()
+    cursor_class = aiomysql.SSDictCursor if dictionary else aiomysql.SSCursor
+    connection = await pool.acquire()
+    finished = False
+    try:
+        cursor = await connection.cursor(cursor_class)
+        await cursor.execute(query, params)
+        while True:
+            rows = await cursor.fetchmany(block_size)
+            if not rows:
+                break
+            yield rows
+        await cursor.close()
+        finished = True
+    finally:
+        if not finished:
+            # Closing a server-side cursor drains every remaining row; when
+            # the consumer stopped early, drop the connection instead.
+            connection.close()
+        await pool.release(connection)
+
+
+async def stream_users(prefetch_size=DEFAULT_PREFETCH_SIZE):
+    """Async counterpart of 0-stream_users.stream_users"""
+    query = "SELECT user_id, name, email, age FROM user_data"
+    blocks = _stream_blocks(query, block_size=prefetch_size)
+    try:
+        async for rows in blocks:
+            for row in rows:
+                yield row
+    finally:
+        # Close the inner stream now rather than whenever it is collected,
+        # so an early exit hands the connection back straight away
+        await blocks.aclose()
+
+
+async def stream_users_in_batches(batch_size, predicate=None):
+    """Async counterpart of 1-batch_processing.stream_users_in_batches"""
+    compiled = compile_predicate(predicate)
+    query = "SELECT user_id, name, email, age FROM user_data" + compiled.where_clause()
+    blocks = _stream_blocks(query, compiled.params, block_size=batch_size)
+    try:
+        async for batch in blocks:
+            yield compiled.filter_rows(batch)
+    finally:
+        await blocks.aclose()
+
+
+async def paginate_users(page_size, offset, predicate=None):
+    """Async counterpart of 2-lazy_paginate.paginate_users"""
+    compiled = compile_predicate(predicate)
+    query = "SELECT * FROM user_data" + compiled.where_clause() + " LIMIT %s OFFSET %s"
+    pool = await get_async_pool()
+    async with pool.acquire() as connection:
+        async with connection.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(query, compiled.params + (page_size, offset))
+            return await cursor.fetchall()
+
+
+async def lazy_paginate(page_size, predicate=None):
+    """Async counterpart of 2-lazy_paginate.lazy_paginate"""
+    offset = 0
+    compiled = compile_predicate(predicate)
+    while True:
+        users_page = await paginate_users(page_size, offset, predicate)
+        if not users_page:
+            break
+        yield compiled.filter_rows(users_page)
+        offset += page_size
+
+
+async def lazy_paginate_keyset(page_size, cursor=None, predicate=None):
+    """Async counterpart of 2-lazy_paginate.lazy_paginate_keyset; same cursor tokens"""
+    last_user_id = lazy_paginate_sync.decode_cursor(cursor)
+    compiled = compile_predicate(predicate)
+    pool = await get_async_pool()
+    while True:
+        if last_user_id is None:
+            query = ("SELECT * FROM user_data" + compiled.where_clause()
+                     + " ORDER BY user_id LIMIT %s")
+            params = compiled.params + (page_size,)
+        else:
+            query = ("SELECT * FROM user_data WHERE user_id > %s"
+                     + compiled.where_clause(" AND ") + " ORDER BY user_id LIMIT %s")
+            params = (last_user_id,) + compiled.params + (page_size,)
+
+        async with pool.acquire() as connection:
+            async with connection.cursor(aiomysql.DictCursor) as db_cursor:
+                await db_cursor.execute(query, params)
+                users_page = await db_cursor.fetchall()
+
+        if not users_page:
+            break
+        last_user_id = users_page[-1]['user_id']
+        yield compiled.filter_rows(users_page), lazy_paginate_sync.encode_cursor(last_user_id)
+
+
+async def stream_user_ages(prefetch_size=DEFAULT_PREFETCH_SIZE):
+    """Async counterpart of 4-stream_ages.stream_user_ages"""
+    blocks = _stream_blocks("SELECT age FROM user_data", block_size=prefetch_size,
+                            dictionary=False)
+    try:
+        async for rows in blocks:
+            for row in rows:
+                yield row[0]
+    finally:
+        await blocks.aclose()
+
+
+async def _demo():
+    async def average_age():
+        total, count = 0, 0
+        async for age in stream_user_ages():
+            total += age
+            count += 1
+        return total / count if count else None
+
+    async def count_pages():
+        pages = 0
+        async for _ in lazy_paginate(100):
+            pages += 1
+        return pages
+
+    async def first_users(limit):
+        users = []
+        stream = stream_users()
+        try:
+            async for user in stream:
+                users.append(user)
+                if len(users) >= limit:
+                    break
+        finally:
+            await stream.aclose()
+        return users
+
+    try:
+        # Three independent streams interleave on one event loop thread
+        average, pages, users = await asyncio.gather(average_age(), count_pages(), first_users(3))
+        print(f"Average age of users: {average}")
+        print(f"Pages of 100 users: {pages}")
+        for user in users:
+            print(user)
+    finally:
+        await close_async_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
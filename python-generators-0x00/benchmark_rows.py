@@ -0,0 +1,92 @@
+"""Allocations and throughput of dict rows vs compact row formats.
+
+By default the rows are synthetic tuples shaped like user_data, which
+isolates the cost of the row objects from the network:
+
+    python benchmark_rows.py              # 1,000,000 synthetic rows
+    python benchmark_rows.py 200000       # custom row count
+    python benchmark_rows.py --db         # stream the real user_data table
+"""
+import sys
+import time
+import tracemalloc
+import uuid
+from decimal import Decimal
+
+from row_types import USER_FIELDS, UserColumns, make_user_row
+
+BATCH_SIZE = 10000
+
+
+def synthetic_batches(total, batch_size=BATCH_SIZE):
+    """Yields batches of driver-style tuples without touching the database"""
+    template = [
+        (str(uuid.uuid4()), f"User {i}", f"user{i}@example.com", Decimal(18 + i % 60))
+        for i in range(batch_size)
+    ]
+    produced = 0
+    while produced < total:
+        count = min(batch_size, total - produced)
+        # Fresh tuples per batch, like a cursor would hand back
+        yield [(user_id, name, email, age) for user_id, name, email, age in template[:count]]
+        produced += count
+
+
+def as_dicts(rows):
+    return [dict(zip(USER_FIELDS, row)) for row in rows]
+
+
+def as_records(rows):
+    return list(map(make_user_row, rows))
+
+
+def as_columns(rows):
+    return UserColumns.from_rows(rows)
+
+
+FORMATS = [('dict', as_dicts), ('record', as_records), ('columns', as_columns)]
+
+
+def bench_synthetic(total):
+    print(f"{'format':<10} {'rows/sec':>14} {'bytes/row (batch of ' + str(BATCH_SIZE) + ')':>32}")
+    for name, convert in FORMATS:
+        # Throughput, without tracemalloc overhead
+        started = time.perf_counter()
+        rows = 0
+        for batch in synthetic_batches(total):
+            rows += len(convert(batch))
+        elapsed = time.perf_counter() - started
+
+        # Memory held by one converted batch, on top of the raw tuples
+        batch = next(synthetic_batches(BATCH_SIZE))
+        tracemalloc.start()
+        converted = convert(batch)
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del converted
+
+        print(f"{name:<10} {rows / elapsed:>14,.0f} {held / BATCH_SIZE:>32.1f}")
+
+
+def bench_database():
+    processing = __import__('1-batch_processing')
+    print(f"{'format':<10} {'rows':>10} {'rows/sec':>14} {'peak MB':>10}")
+    for name, _ in FORMATS:
+        tracemalloc.start()
+        started = time.perf_counter()
+        rows = 0
+        for batch in processing.stream_users_in_batches(BATCH_SIZE, row_format=name):
+            rows += len(batch)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        print(f"{name:<10} {rows:>10} {rate:>14,.0f} {peak / (1024 * 1024):>10.1f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if '--db' in args:
+        bench_database()
+    else:
+        bench_synthetic(int(args[0]) if args else 1_000_000)
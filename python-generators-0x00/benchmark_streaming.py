@@ -0,0 +1,59 @@
+"""Rows/sec vs peak RSS for the user streaming generators.
+
+Each configuration runs in a fresh child process so its peak RSS is not
+polluted by the previous run:
+
+    python benchmark_streaming.py            # stream_users
+    python benchmark_streaming.py --ages     # stream_user_ages
+"""
+import multiprocessing
+import resource
+import sys
+import time
+
+CONFIGS = [
+    # (label, buffered, prefetch_size)
+    ('buffered', True, 1000),
+    ('server-side, prefetch 1', False, 1),
+    ('server-side, prefetch 100', False, 100),
+    ('server-side, prefetch 1000', False, 1000),
+    ('server-side, prefetch 10000', False, 10000),
+]
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _run(args):
+    module_name, function_name, buffered, prefetch_size = args
+    stream = getattr(__import__(module_name), function_name)
+
+    baseline = _peak_rss_mb()
+    rows = 0
+    started = time.perf_counter()
+    for _ in stream(prefetch_size=prefetch_size, buffered=buffered):
+        rows += 1
+    elapsed = time.perf_counter() - started
+    return rows, elapsed, _peak_rss_mb() - baseline
+
+
+def main():
+    if '--ages' in sys.argv[1:]:
+        target = ('4-stream_ages', 'stream_user_ages')
+    else:
+        target = ('0-stream_users', 'stream_users')
+
+    print(f"Benchmarking {target[1]}")
+    print(f"{'mode':<30} {'rows':>10} {'seconds':>9} {'rows/sec':>12} {'peak RSS +MB':>13}")
+    for label, buffered, prefetch_size in CONFIGS:
+        with multiprocessing.Pool(processes=1) as pool:
+            rows, elapsed, rss = pool.apply(_run, ((*target, buffered, prefetch_size),))
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        print(f"{label:<30} {rows:>10} {elapsed:>9.2f} {rate:>12,.0f} {rss:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+from mysql.connector import Error
+
+from db_pool import DEFAULT_PREFETCH_SIZE, get_pool
+
+# Rows younger than this are left for the next sync: a transaction that
+# committed late can carry an updated_at slightly older than rows already
+# visible, and reading right up to NOW() could skip it for good.
+DEFAULT_LAG_SECONDS = 2
+
+CHECKPOINT_FILE = 'user_data.checkpoint.json'
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    """Returns the saved (updated_at, user_id) high-water mark, or None"""
+    try:
+        with open(path, encoding='utf-8') as checkpoint_file:
+            state = json.load(checkpoint_file)
+    except FileNotFoundError:
+        return None
+    return datetime.fromisoformat(state['updated_at']), state['user_id']
+
+
+def save_checkpoint(updated_at, user_id, path=CHECKPOINT_FILE):
+    """Durably replaces the checkpoint: write a temp file, fsync, then rename over"""
+    directory = os.path.dirname(os.path.abspath(path))
+    state = {'updated_at': updated_at.isoformat(), 'user_id': user_id}
+    fd, temp_path = tempfile.mkstemp(prefix='.checkpoint-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as temp_file:
+            json.dump(state, temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    if sys.platform != 'win32':
+        # Persist the rename itself
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _fetch_changes(mark, upper_bound, page_size):
+    query_from_start = """
+    SELECT user_id, name, email, age, updated_at FROM user_data
+    WHERE updated_at < %s
+    ORDER BY updated_at, user_id LIMIT %s
+    """
+    # Keyset on (updated_at, user_id) so rows sharing a timestamp are neither
+    # skipped nor repeated across pages
+    query_after_mark = """
+    SELECT user_id, name, email, age, updated_at FROM user_data
+    WHERE (updated_at > %s OR (updated_at = %s AND user_id > %s))
+      AND updated_at < %s
+    ORDER BY updated_at, user_id LIMIT %s
+    """
+    pool = get_pool()
+    connection = pool.acquire()
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=True)
+        if mark is None:
+            cursor.execute(query_from_start, (upper_bound, page_size))
+        else:
+            updated_at, user_id = mark
+            cursor.execute(query_after_mark,
+                           (updated_at, updated_at, user_id, upper_bound, page_size))
+        return cursor.fetchall()
+    finally:
+        if cursor:
+            cursor.close()
+        pool.release(connection)
+
+
+def _sync_upper_bound(lag_seconds):
+    pool = get_pool()
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT NOW(6) - INTERVAL %s SECOND", (lag_seconds,))
+        upper_bound = cursor.fetchone()[0]
+        cursor.close()
+    return upper_bound
+
+
+def stream_user_changes(checkpoint_path=CHECKPOINT_FILE, page_size=DEFAULT_PREFETCH_SIZE,
+                        lag_seconds=DEFAULT_LAG_SECONDS):
+    """Yields users inserted or updated since the last checkpoint, oldest first
+
+    Each sync reads only the rows past the stored (updated_at, user_id) mark
+    through idx_updated_at, so it costs O(changes) rather than O(table). The
+    checkpoint is saved after the caller has consumed each page, so a crash
+    re-delivers at most one page (at-least-once). Deleted rows are not seen.
+    """
+    mark = load_checkpoint(checkpoint_path)
+    # Fixed upper bound so one sync always finishes, even under constant writes
+    upper_bound = _sync_upper_bound(lag_seconds)
+
+    while True:
+        changes = _fetch_changes(mark, upper_bound, page_size)
+        if not changes:
+            break
+
+        yield from changes
+
+        # Only reached once the caller asked for the row after this page
+        last = changes[-1]
+        mark = (last['updated_at'], last['user_id'])
+        save_checkpoint(*mark, path=checkpoint_path)
+
+
+if __name__ == "__main__":
+    try:
+        synced = 0
+        for user in stream_user_changes():
+            print(f"Changed: {user['user_id']} {user['email']} at {user['updated_at']}")
+            synced += 1
+        print(f"Synced {synced} changed users; checkpoint in {CHECKPOINT_FILE}")
+    except Error as e:
+        print(f"Database error: {e}")
@@ -0,0 +1,226 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+from mysql.connector.errors import PoolError
+
+# Database configuration shared by all the generator scripts
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': 'Pesem1000',
+    'database': 'ALX_prodev',
+    'port': 3306
+}
+
+# Pool tuning, overridable from the environment
+DEFAULT_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DEFAULT_CHECKOUT_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+# Idle connections older than this are pinged before being handed out
+DEFAULT_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK', 30))
+
+# Rows pulled per fetchmany() round by the streaming generators
+DEFAULT_PREFETCH_SIZE = int(os.environ.get('DB_PREFETCH_SIZE', 1000))
+
+
+class ConnectionPool:
+    """Thread-safe pool of MySQL connections created lazily up to `size`
+
+    Connections are checked out with acquire()/release() or the connection()
+    context manager. A connection that sat idle longer than
+    health_check_interval is pinged on checkout and transparently replaced if
+    the server dropped it.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT,
+                 health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL, **config):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.config = dict(DB_CONFIG, **config)
+        # Let cursors closed with rows unread discard them instead of
+        # poisoning the connection. Streams stopped early skip this drain by
+        # releasing with discard=True.
+        self.config.setdefault('consume_results', True)
+
+        self._slots = threading.BoundedSemaphore(size)
+        # LIFO keeps the most recently used (warmest) connections in rotation
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._metrics = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'created': 0,
+            'discarded': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'in_use': 0,
+        }
+
+    def _record(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                self._metrics[name] += value
+
+    def _create(self):
+        connection = mysql.connector.connect(**self.config)
+        self._record(created=1)
+        return connection
+
+    def _discard(self, connection):
+        self._record(discarded=1)
+        try:
+            if connection.unread_result:
+                # close() would read the rest of the result set off the wire
+                # first; drop the socket without a QUIT instead
+                connection.shutdown()
+            else:
+                connection.close()
+        except Error:
+            pass
+
+    def _is_healthy(self, connection, idle_since):
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        self._record(health_checks=1)
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Error:
+            self._record(health_check_failures=1)
+            return False
+
+    def acquire(self, timeout=None):
+        """Checks out a connection, waiting up to `timeout` seconds for a free slot"""
+        if self._closed:
+            raise PoolError("Connection pool is closed")
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            if not self._slots.acquire(timeout=timeout):
+                raise PoolError(f"No connection available after waiting {timeout}s "
+                                f"(pool size {self.size})")
+            waited = time.perf_counter() - started
+            with self._lock:
+                self._metrics['waits'] += 1
+                self._metrics['wait_time_total'] += waited
+                self._metrics['wait_time_max'] = max(self._metrics['wait_time_max'], waited)
+
+        try:
+            connection = None
+            while connection is None:
+                try:
+                    candidate, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    connection = self._create()
+                    break
+                if self._is_healthy(candidate, idle_since):
+                    connection = candidate
+                else:
+                    self._discard(candidate)
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._record(checkouts=1, in_use=1)
+        return connection
+
+    def release(self, connection, discard=False):
+        """Returns a connection to the pool, resetting any open transaction
+
+        After close(), or with discard=True for a connection left in a state
+        that can't be reset, the connection is closed instead of pooled. A
+        discarded connection with an unfinished result set is dropped without
+        reading the remaining rows, so streams stopped early pass discard=True.
+        """
+        try:
+            if discard:
+                self._discard(connection)
+                return
+            if connection.unread_result:
+                connection.consume_results()
+            if connection.in_transaction:
+                connection.rollback()
+            # Checked under the lock so close() can't drain the idle queue
+            # between the check and the put
+            with self._lock:
+                pooled = not self._closed
+                if pooled:
+                    self._idle.put((connection, time.monotonic()))
+            if not pooled:
+                self._discard(connection)
+        except Error:
+            self._discard(connection)
+        finally:
+            self._record(in_use=-1)
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def stats(self):
+        """Returns a snapshot of the checkout/wait/health-check counters"""
+        with self._lock:
+            stats = dict(self._metrics)
+        stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['waits'] if stats['waits'] else 0.0
+        return stats
+
+    def close(self):
+        """Closes every idle connection; checked-out ones close when released"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure_pool(size=DEFAULT_POOL_SIZE, **kwargs):
+    """Replaces the shared pool, e.g. configure_pool(size=10, health_check_interval=5)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(size=size, **kwargs)
+        return _pool
+
+
+def get_pool():
+    """Returns the shared pool, creating it with the default settings on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def pooled_connection(timeout=None):
+    """Context manager checking a connection out of the shared pool"""
+    return get_pool().connection(timeout)
+
+
+def pool_stats():
+    return get_pool().stats()
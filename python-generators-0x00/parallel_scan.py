@@ -0,0 +1,273 @@
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from aggregates import RunningStats
+from db_pool import DEFAULT_PREFETCH_SIZE, get_pool
+from predicates import compile_predicate
+
+USER_COLUMNS = "user_id, name, email, age"
+
+# End-of-partition marker passed through the result queues
+_DONE = object()
+
+
+def uuid_prefix_ranges(partitions):
+    """Splits the user_id space into equal UUID-prefix ranges
+
+    Returns (low, high) pairs where low is inclusive, high exclusive and None
+    means unbounded. Random (v4) and MySQL UUID() ids are spread evenly over
+    their leading hex digits, so the ranges hold roughly equal row counts.
+    """
+    partitions = max(1, partitions)
+    bounds = [format(i * 0x10000 // partitions, '04x') for i in range(1, partitions)]
+    lows = [None] + bounds
+    highs = bounds + [None]
+    return list(zip(lows, highs))
+
+
+def sampled_split_points(partitions, connection=None):
+    """Splits user_data into ranges holding equal row counts, read off the PK index
+
+    Slower to compute than uuid_prefix_ranges but exact for any key
+    distribution. OFFSET still steps over every skipped key, so each probe
+    starts from the previous split point: together they walk the primary key
+    once, instead of re-reading it from the start for every split point.
+    """
+    pool = get_pool()
+    owned = connection is None
+    connection = connection or pool.acquire()
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM user_data")
+        total = cursor.fetchone()[0]
+        bounds = []
+        position = 0
+        for i in range(1, max(1, partitions)):
+            target = i * total // partitions
+            if not bounds:
+                cursor.execute("SELECT user_id FROM user_data ORDER BY user_id LIMIT 1 OFFSET %s",
+                               (target,))
+            elif target > position:
+                cursor.execute("SELECT user_id FROM user_data WHERE user_id > %s "
+                               "ORDER BY user_id LIMIT 1 OFFSET %s",
+                               (bounds[-1], target - position - 1))
+            else:
+                continue
+            row = cursor.fetchone()
+            if not row:
+                # Rows deleted since the count: the remaining range is the last
+                break
+            bounds.append(row[0])
+            position = target
+    finally:
+        if cursor:
+            cursor.close()
+        if owned:
+            pool.release(connection)
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+def _range_query(bounds, columns, predicate, ordered):
+    low, high = bounds
+    conditions, params = [], []
+    if low is not None:
+        conditions.append("user_id >= %s")
+        params.append(low)
+    if high is not None:
+        conditions.append("user_id < %s")
+        params.append(high)
+    compiled = compile_predicate(predicate)
+    if compiled.where_sql:
+        conditions.append(f"({compiled.where_sql})")
+        params.extend(compiled.params)
+
+    query = f"SELECT {columns} FROM user_data"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if ordered:
+        query += " ORDER BY user_id"
+    return query, tuple(params), compiled
+
+
+def scan_partition(bounds, predicate=None, batch_size=DEFAULT_PREFETCH_SIZE,
+                   columns=USER_COLUMNS, ordered=False, dictionary=True):
+    """Streams one key range in batches over its own pooled connection"""
+    query, params, compiled = _range_query(bounds, columns, predicate, ordered)
+    pool = get_pool()
+    connection = pool.acquire()
+    cursor = None
+    finished = False
+    try:
+        cursor = connection.cursor(dictionary=dictionary, buffered=False)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield compiled.filter_rows(rows)
+        finished = True
+    finally:
+        # A scan closed early (e.g. parallel_scan's consumer stopped) drops its
+        # connection rather than reading the rest of its range off the wire
+        if cursor and finished:
+            cursor.close()
+        pool.release(connection, discard=not finished)
+
+
+def parallel_scan(partitions=8, ranges=None, predicate=None, batch_size=DEFAULT_PREFETCH_SIZE,
+                  ordered=False, workers=None, queue_depth=4):
+    """Scans user_data by key range on a thread pool and yields row batches
+
+    ordered=False yields batches as soon as any partition produces them.
+    ordered=True yields them in user_id order: later partitions keep scanning
+    ahead but block once `queue_depth` batches are waiting, so memory stays
+    bounded. Each worker holds one pooled connection; size the pool with
+    db_pool.configure_pool(size=...) to at least `workers`.
+    """
+    ranges = ranges or uuid_prefix_ranges(partitions)
+    workers = workers or min(len(ranges), get_pool().size)
+    stop = threading.Event()
+
+    if ordered:
+        queues = [queue.Queue(maxsize=queue_depth) for _ in ranges]
+    else:
+        shared = queue.Queue(maxsize=queue_depth * workers)
+        queues = [shared] * len(ranges)
+
+    def put(target, item):
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan(index):
+        target = queues[index]
+        batches = scan_partition(ranges[index], predicate, batch_size, ordered=ordered)
+        try:
+            for batch in batches:
+                if not put(target, batch):
+                    return
+            put(target, _DONE)
+        except Exception as e:
+            put(target, e)
+        finally:
+            batches.close()
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='user-data-scan')
+    futures = [executor.submit(scan, index) for index in range(len(ranges))]
+    try:
+        if ordered:
+            for target in queues:
+                while True:
+                    item = target.get()
+                    if item is _DONE:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+        else:
+            remaining = len(ranges)
+            while remaining:
+                item = shared.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        stop.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _run_partition(job):
+    map_partition, bounds, args = job
+    return map_partition(bounds, *args)
+
+
+def parallel_map_reduce(map_partition, combine, initial, partitions=8, ranges=None,
+                        args=(), workers=None, executor='process'):
+    """Runs map_partition(bounds, *args) for every key range and folds the results
+
+    executor='process' spreads CPU-heavy per-row work over cores; each child
+    process opens its own connections. map_partition and args must be
+    picklable, i.e. module-level functions and plain values.
+    """
+    ranges = ranges or uuid_prefix_ranges(partitions)
+    jobs = [(map_partition, bounds, args) for bounds in ranges]
+    workers = workers or min(len(ranges), multiprocessing.cpu_count())
+
+    if executor == 'process':
+        # spawn, so children never inherit the parent's open MySQL sockets
+        pool = ProcessPoolExecutor(max_workers=workers,
+                                   mp_context=multiprocessing.get_context('spawn'))
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+
+    result = initial
+    with pool:
+        for partial in pool.map(_run_partition, jobs):
+            result = combine(result, partial)
+    return result
+
+
+def _age_stats_partition(bounds):
+    stats = RunningStats()
+    for rows in scan_partition(bounds, columns="age", dictionary=False):
+        stats.update(row[0] for row in rows)
+    return stats
+
+
+def _count_partition(bounds, predicate):
+    query, params, compiled = _range_query(bounds, "COUNT(*)", predicate, ordered=False)
+    if compiled.residual is None:
+        # Fully expressible in SQL: let the server count
+        pool = get_pool()
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            count = cursor.fetchone()[0]
+            cursor.close()
+        return count
+
+    count = 0
+    for rows in scan_partition(bounds, predicate):
+        count += len(rows)
+    return count
+
+
+def parallel_age_stats(partitions=8, workers=None, executor='process'):
+    """Full-table age statistics computed per partition and merged"""
+    return parallel_map_reduce(_age_stats_partition, RunningStats.merge, RunningStats(),
+                               partitions=partitions, workers=workers, executor=executor)
+
+
+def parallel_count(predicate=None, partitions=8, workers=None, executor='process'):
+    """Counts the users matching predicate, one partition per worker"""
+    return parallel_map_reduce(_count_partition, lambda total, count: total + count, 0,
+                               partitions=partitions, args=(predicate,), workers=workers,
+                               executor=executor)
+
+
+if __name__ == "__main__":
+    from predicates import OVER_25
+
+    stats = parallel_age_stats()
+    print(f"Average age of users: {stats.mean}")
+    print(f"Users over 25: {parallel_count(OVER_25)}")
+
+    scan = parallel_scan(partitions=4, predicate=OVER_25, ordered=True)
+    try:
+        first_batch = next(scan, [])
+    finally:
+        scan.close()
+    for user in first_batch[:5]:
+        print(user)
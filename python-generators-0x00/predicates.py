@@ -0,0 +1,226 @@
+import operator
+from abc import ABC, abstractmethod
+
+# Columns a predicate may reference; anything else is rejected so column
+# names can be interpolated into SQL safely
+USER_COLUMNS = ('user_id', 'name', 'email', 'age')
+
+_OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+class Predicate(ABC):
+    """Row filter that can be pushed down into SQL when possible
+
+    to_sql() returns a (sql, params) pair, or None when the predicate can
+    only be evaluated in Python. matches(row) evaluates it on a dict row.
+    Predicates compose with &, | and ~.
+    """
+
+    def to_sql(self):
+        return None
+
+    @abstractmethod
+    def matches(self, row):
+        """True if the dict row satisfies the predicate"""
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Comparison(Predicate):
+
+    def __init__(self, column, op, value):
+        if column not in USER_COLUMNS:
+            raise ValueError(f"Unknown column: {column!r}")
+        if op not in _OPERATORS:
+            raise ValueError(f"Unsupported operator: {op!r}")
+        self.column = column
+        self.op = op
+        self.value = value
+
+    def to_sql(self):
+        return f"{self.column} {self.op} %s", (self.value,)
+
+    def matches(self, row):
+        return _OPERATORS[self.op](row[self.column], self.value)
+
+    def __repr__(self):
+        return f"Field({self.column!r}) {self.op} {self.value!r}"
+
+
+class In(Predicate):
+
+    def __init__(self, column, values):
+        if column not in USER_COLUMNS:
+            raise ValueError(f"Unknown column: {column!r}")
+        self.column = column
+        self.values = tuple(values)
+
+    def to_sql(self):
+        if not self.values:
+            return "FALSE", ()
+        placeholders = ", ".join(["%s"] * len(self.values))
+        return f"{self.column} IN ({placeholders})", self.values
+
+    def matches(self, row):
+        return row[self.column] in self.values
+
+
+class And(Predicate):
+
+    def __init__(self, *parts):
+        # Flatten (a & b) & c so every conjunct can be pushed down on its own
+        self.parts = tuple(
+            nested for part in parts
+            for nested in (part.parts if isinstance(part, And) else (part,))
+        )
+
+    def to_sql(self):
+        compiled = [part.to_sql() for part in self.parts]
+        if any(item is None for item in compiled):
+            return None
+        return (" AND ".join(f"({sql})" for sql, _ in compiled),
+                tuple(param for _, params in compiled for param in params))
+
+    def matches(self, row):
+        return all(part.matches(row) for part in self.parts)
+
+
+class Or(Predicate):
+
+    def __init__(self, *parts):
+        self.parts = parts
+
+    def to_sql(self):
+        compiled = [part.to_sql() for part in self.parts]
+        if any(item is None for item in compiled):
+            return None
+        return (" OR ".join(f"({sql})" for sql, _ in compiled),
+                tuple(param for _, params in compiled for param in params))
+
+    def matches(self, row):
+        return any(part.matches(row) for part in self.parts)
+
+
+class Not(Predicate):
+
+    def __init__(self, part):
+        self.part = part
+
+    def to_sql(self):
+        compiled = self.part.to_sql()
+        if compiled is None:
+            return None
+        sql, params = compiled
+        return f"NOT ({sql})", params
+
+    def matches(self, row):
+        return not self.part.matches(row)
+
+
+class PythonPredicate(Predicate):
+    """Wraps an arbitrary callable; always evaluated client-side"""
+
+    def __init__(self, func):
+        self.func = func
+
+    def matches(self, row):
+        return self.func(row)
+
+
+class Field:
+    """Entry point for building predicates: Field('age') > 25"""
+
+    def __init__(self, column):
+        if column not in USER_COLUMNS:
+            raise ValueError(f"Unknown column: {column!r}")
+        self.column = column
+
+    def __eq__(self, value):
+        return Comparison(self.column, '=', value)
+
+    def __ne__(self, value):
+        return Comparison(self.column, '!=', value)
+
+    def __lt__(self, value):
+        return Comparison(self.column, '<', value)
+
+    def __le__(self, value):
+        return Comparison(self.column, '<=', value)
+
+    def __gt__(self, value):
+        return Comparison(self.column, '>', value)
+
+    def __ge__(self, value):
+        return Comparison(self.column, '>=', value)
+
+    def isin(self, values):
+        return In(self.column, values)
+
+    __hash__ = None
+
+
+def where(func):
+    """Builds a Python-only predicate from a callable taking a row dict"""
+    return PythonPredicate(func)
+
+
+class CompiledPredicate:
+    """A predicate split into a SQL WHERE clause and a Python residual
+
+    Top-level AND terms that compile to SQL are pushed down; the rest are
+    kept as a residual applied to rows after they are fetched.
+    """
+
+    def __init__(self, predicate=None):
+        self.where_sql = ""
+        self.params = ()
+        self.residual = None
+        if predicate is None:
+            return
+
+        terms = predicate.parts if isinstance(predicate, And) else (predicate,)
+        pushed, residual = [], []
+        for term in terms:
+            compiled = term.to_sql()
+            if compiled is None:
+                residual.append(term)
+            else:
+                pushed.append(compiled)
+
+        if pushed:
+            self.where_sql = " AND ".join(f"({sql})" for sql, _ in pushed)
+            self.params = tuple(param for _, params in pushed for param in params)
+        if residual:
+            self.residual = residual[0] if len(residual) == 1 else And(*residual)
+
+    def where_clause(self, prefix=" WHERE "):
+        """Returns the pushed-down condition ready to append to a query"""
+        return f"{prefix}{self.where_sql}" if self.where_sql else ""
+
+    def filter_rows(self, rows):
+        """Applies the residual (client-side) part of the predicate to rows"""
+        if self.residual is None:
+            return rows
+        return [row for row in rows if self.residual.matches(row)]
+
+
+def compile_predicate(predicate):
+    return CompiledPredicate(predicate)
+
+
+# The filter used by the batch and pagination demos
+OVER_25 = Field('age') > 25
@@ -0,0 +1,73 @@
+from collections import namedtuple
+from functools import partial
+
+USER_FIELDS = ('user_id', 'name', 'email', 'age')
+
+
+class UserRow(namedtuple('UserRow', USER_FIELDS)):
+    """Compact user record: a tuple with named fields and no per-row dict
+
+    row['age'] is still accepted so code written against dictionary rows
+    (including predicates' residual filters) keeps working.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def as_dict(self):
+        return dict(zip(USER_FIELDS, self))
+
+
+# Builds a UserRow from a driver tuple entirely in C; noticeably cheaper per
+# row than the Python-level UserRow._make
+make_user_row = partial(tuple.__new__, UserRow)
+
+
+class UserColumns:
+    """Column-oriented batch of users: one sequence per field instead of one object per row"""
+
+    __slots__ = ('user_ids', 'names', 'emails', 'ages')
+
+    def __init__(self, user_ids=(), names=(), emails=(), ages=()):
+        self.user_ids = user_ids
+        self.names = names
+        self.emails = emails
+        self.ages = ages
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Transposes (user_id, name, email, age) tuples into columns"""
+        if not rows:
+            return cls()
+        return cls(*zip(*rows))
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __iter__(self):
+        return map(make_user_row, zip(self.user_ids, self.names, self.emails, self.ages))
+
+
+ROW_FORMATS = ('dict', 'record', 'columns')
+
+
+def convert_rows(rows, row_format, residual=None):
+    """Turns driver tuples into the requested format, applying a residual filter
+
+    Filtering happens on UserRow records, which support row['column'].
+    """
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"row_format must be one of {ROW_FORMATS}, not {row_format!r}")
+    if row_format == 'columns' and residual is None:
+        return UserColumns.from_rows(rows)
+    records = list(map(make_user_row, rows))
+    if residual is not None:
+        records = [record for record in records if residual.matches(record)]
+    if row_format == 'columns':
+        return UserColumns.from_rows(records)
+    if row_format == 'dict':
+        return [record.as_dict() for record in records]
+    return records
@@ -1,8 +1,14 @@
 import mysql.connector
 from mysql.connector import Error
-import pandas as pd
+from aggregates import age_stats_suspended, create_age_stats_table, drop_age_stats_triggers
+from decimal import Decimal, InvalidOperation
+import csv
+import multiprocessing
+import os
+import random
 import uuid
 import sys
+import time
 
 # Database configuration
 DB_CONFIG = {
@@ -14,6 +20,20 @@ DB_CONFIG = {
 
 DATABASE_NAME = 'ALX_prodev'
 
+# Rows sent per multi-row INSERT / commit in bulk mode
+BULK_CHUNK_SIZE = 5000
+
+# Parallel workers inserting into the unique email index can deadlock or time
+# out on each other's gap locks; such a chunk is rolled back and sent again
+RETRYABLE_ERRNOS = {1205, 1213}  # lock wait timeout, deadlock
+CHUNK_RETRIES = 5
+CHUNK_RETRY_DELAY = 0.05
+
+REQUIRED_COLUMNS = ['name', 'email', 'age']
+
+# user_data.age is DECIMAL(5,2)
+MAX_AGE = Decimal('999.99')
+
 
 def connect_db():
 
@@ -62,7 +82,12 @@ def create_table(connection):
             name VARCHAR(255) NOT NULL,
             email VARCHAR(255) NOT NULL,
             age DECIMAL(5,2) NOT NULL,
-            INDEX idx_user_id (user_id)
+            updated_at TIMESTAMP(6) NOT NULL
+                DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+            INDEX idx_user_id (user_id),
+            INDEX idx_age (age),
+            INDEX idx_updated_at (updated_at, user_id),
+            UNIQUE INDEX idx_email (email)
         )
         """
         cursor.execute(create_table_query)
@@ -72,36 +97,393 @@ def create_table(connection):
         print(f"Error creating table: {e}")
 
 
-def insert_data(connection, data):
-    """Inserts data in the database if it does not exist"""
+def _index_exists(cursor, index_name):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = 'user_data' "
+        "AND index_name = %s",
+        (index_name,)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def ensure_email_unique_index(connection):
+    """Adds the unique email index to a user_data table created before it existed"""
     try:
         cursor = connection.cursor()
+        if not _index_exists(cursor, 'idx_email'):
+            # Fails if the table already holds duplicate emails; bulk mode
+            # relies on this index to dedupe, so report it loudly.
+            cursor.execute("ALTER TABLE user_data ADD UNIQUE INDEX idx_email (email)")
+            print("Added unique index 'idx_email' to 'user_data'")
+        cursor.close()
+        return True
+    except Error as e:
+        print(f"Error adding unique email index: {e}")
+        return False
 
-        # Check if data already exists to avoid duplicates
-        check_query = "SELECT COUNT(*) FROM user_data WHERE email = %s"
-        insert_query = """
-        INSERT INTO user_data (user_id, name, email, age)
-        VALUES (%s, %s, %s, %s)
-        """
 
-        inserted_count = 0
-        for _, row in data.iterrows():
-            cursor.execute(check_query, (row['email'],))
-            if cursor.fetchone()[0] == 0:  # Email doesn't exist
-                user_id = str(uuid.uuid4())
-                cursor.execute(insert_query, (user_id, row['name'], row['email'], row['age']))
-                inserted_count += 1
+def ensure_age_index(connection):
+    """Adds the age index used by pushed-down age filters to an existing table"""
+    try:
+        cursor = connection.cursor()
+        if not _index_exists(cursor, 'idx_age'):
+            cursor.execute("ALTER TABLE user_data ADD INDEX idx_age (age)")
+            print("Added index 'idx_age' to 'user_data'")
+        cursor.close()
+        return True
+    except Error as e:
+        print(f"Error adding age index: {e}")
+        return False
+
 
-        connection.commit()
-        print(f"Successfully inserted {inserted_count} new records")
+def ensure_change_tracking(connection):
+    """Adds the updated_at high-water-mark column and its index to an existing table"""
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = 'user_data' "
+            "AND column_name = 'updated_at'"
+        )
+        if cursor.fetchone()[0] == 0:
+            # Existing rows get the time of the migration, so the first
+            # incremental sync after it picks every one of them up once
+            cursor.execute(
+                "ALTER TABLE user_data ADD COLUMN updated_at TIMESTAMP(6) NOT NULL "
+                "DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)"
+            )
+            print("Added column 'updated_at' to 'user_data'")
+        if not _index_exists(cursor, 'idx_updated_at'):
+            cursor.execute("ALTER TABLE user_data ADD INDEX idx_updated_at (updated_at, user_id)")
+            print("Added index 'idx_updated_at' to 'user_data'")
         cursor.close()
+        return True
     except Error as e:
-        print(f"Error inserting data: {e}")
+        print(f"Error adding change tracking: {e}")
+        return False
+
+
+def insert_data(connection, data):
+    """Inserts the users of the CSV file at `data`, skipping emails already present"""
+    unique_index = ensure_email_unique_index(connection)
+    with age_stats_suspended(connection):
+        return bulk_insert_data(connection, stream_user_batches(data), unique_index=unique_index)
+
+
+def _parse_user_row(name, email, age):
+    """Returns a typed (name, email, age) tuple, or None if the row is invalid"""
+    name = (name or '').strip()
+    email = (email or '').strip()
+    if not name or '@' not in email:
+        return None
+    try:
+        age = Decimal(age.strip())
+    except (AttributeError, InvalidOperation):
+        return None
+    if not age.is_finite() or abs(age) > MAX_AGE:
+        return None
+    return name, email, age
+
+
+def _column_indexes(header):
+    """Returns the positions of the required columns in a CSV header row"""
+    header = [column.strip() for column in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"CSV must contain columns: {REQUIRED_COLUMNS} (missing {missing})")
+    return tuple(header.index(column) for column in REQUIRED_COLUMNS)
+
+
+def stream_user_batches(csv_path, batch_size=BULK_CHUNK_SIZE):
+    """Yields validated lists of (name, email, age) tuples read lazily from the CSV
+
+    Only one batch is held in memory at a time, so peak memory depends on
+    batch_size and not on the size of the file.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, None)
+        if header is None:
+            return
+        name_idx, email_idx, age_idx = _column_indexes(header)
+        width = max(name_idx, email_idx, age_idx) + 1
+
+        batch = []
+        skipped = 0
+        for row in reader:
+            parsed = None
+            if len(row) >= width:
+                parsed = _parse_user_row(row[name_idx], row[email_idx], row[age_idx])
+            if parsed is None:
+                skipped += 1
+                continue
+            batch.append(parsed)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        if skipped:
+            print(f"Skipped {skipped} invalid rows in {csv_path}")
+
+
+def _existing_emails(cursor):
+    """Emails already in user_data, case-folded like the table's collation"""
+    cursor.execute("SELECT email FROM user_data")
+    return {email.casefold() for (email,) in cursor}
+
+
+def _drop_known_emails(batch, known):
+    """Rows of batch whose email is not in `known`; adds the kept emails to it"""
+    fresh = []
+    for row in batch:
+        key = row[1].casefold()
+        if key not in known:
+            known.add(key)
+            fresh.append(row)
+    return fresh
+
+
+def _insert_chunk(connection, cursor, insert_query, rows):
+    """Inserts and commits one chunk, resending it after a deadlock or lock timeout"""
+    for attempt in range(CHUNK_RETRIES + 1):
+        try:
+            cursor.executemany(insert_query, rows)
+            connection.commit()
+            return cursor.rowcount
+        except Error as e:
+            if e.errno not in RETRYABLE_ERRNOS or attempt == CHUNK_RETRIES:
+                raise
+            connection.rollback()
+            # Jittered so the workers that collided don't collide again
+            time.sleep(random.uniform(0, CHUNK_RETRY_DELAY * 2 ** attempt))
+            print(f"Retrying chunk of {len(rows)} rows after: {e}")
+
+
+def bulk_insert_data(connection, batches, unique_index=True):
+    """Bulk inserts batches of (name, email, age) rows, skipping known emails
+
+    Duplicates are rejected by the unique email index (INSERT IGNORE), so each
+    batch costs one multi-row INSERT and one commit instead of two round-trips
+    per record. Batches are consumed as they are produced, e.g. straight from
+    stream_user_batches().
+
+    unique_index=False is for a table the index could not be added to because
+    it already holds duplicate emails: the existing emails are read once up
+    front and duplicates are dropped client-side before each INSERT.
+    """
+    insert_query = """
+    INSERT IGNORE INTO user_data (user_id, name, email, age)
+    VALUES (%s, %s, %s, %s)
+    """
+
+    cursor = None
+    read_count = 0
+    inserted_count = 0
+    started = time.perf_counter()
+    try:
+        cursor = connection.cursor()
+        known = None if unique_index else _existing_emails(cursor)
+        for batch in batches:
+            size = len(batch)
+            if known is not None:
+                batch = _drop_known_emails(batch, known)
+            if batch:
+                rows = [(str(uuid.uuid4()), name, email, age) for name, email, age in batch]
+                # mysql-connector rewrites executemany on INSERT ... VALUES into
+                # a single multi-row statement
+                inserted_count += _insert_chunk(connection, cursor, insert_query, rows)
+            read_count += size
+    except FileNotFoundError as e:
+        print(f"Error: {e.filename} file not found")
+    except ValueError as e:
+        print(f"Error reading CSV file: {e}")
+    except Error as e:
+        print(f"Error bulk inserting data: {e}")
         connection.rollback()
+    finally:
+        if cursor:
+            cursor.close()
+
+    elapsed = time.perf_counter() - started
+    rate = read_count / elapsed if elapsed > 0 else 0.0
+    print(f"Bulk inserted {inserted_count} new records "
+          f"({read_count - inserted_count} duplicates skipped) "
+          f"in {elapsed:.2f}s, {rate:,.0f} rows/sec")
+    return inserted_count
+
+
+def partition_csv(csv_path, partitions):
+    """Splits the CSV body into contiguous byte ranges aligned to line starts
+
+    Returns the parsed header row and a list of (start, end) offsets. Rows must
+    not contain embedded newlines, which holds for user_data.csv.
+    """
+    size = os.path.getsize(csv_path)
+    with open(csv_path, 'rb') as csv_file:
+        header_line = csv_file.readline()
+        body_start = csv_file.tell()
+        step = max(1, (size - body_start) // max(1, partitions))
+
+        bounds = [body_start]
+        for i in range(1, partitions):
+            # Seek into the middle of a line, then skip to the next line start
+            csv_file.seek(max(bounds[-1], body_start + i * step))
+            csv_file.readline()
+            position = csv_file.tell()
+            if position >= size:
+                break
+            if position > bounds[-1]:
+                bounds.append(position)
+        bounds.append(size)
+
+    header = next(csv.reader([header_line.decode('utf-8')]), [])
+    return header, [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _partition_batches(csv_path, header, start, end, batch_size, stats):
+    """Yields validated batches from one byte range, tallying into stats"""
+    name_idx, email_idx, age_idx = _column_indexes(header)
+    width = max(name_idx, email_idx, age_idx) + 1
+
+    with open(csv_path, 'rb') as csv_file:
+        csv_file.seek(start)
+        batch = []
+        while csv_file.tell() < end:
+            line = csv_file.readline()
+            if not line:
+                break
+            stats['bytes'] += len(line)
+            row = next(csv.reader([line.decode('utf-8')]), [])
+            if not row:
+                continue
+            parsed = None
+            if len(row) >= width:
+                parsed = _parse_user_row(row[name_idx], row[email_idx], row[age_idx])
+            if parsed is None:
+                stats['skipped'] += 1
+                continue
+            batch.append(parsed)
+            stats['rows'] += 1
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _seed_partition(task):
+    """Worker: loads one byte range over its own connection and reports counts"""
+    index, csv_path, header, start, end, batch_size = task
+    stats = {'partition': index, 'start': start, 'end': end,
+             'bytes': 0, 'rows': 0, 'skipped': 0, 'inserted': 0}
+
+    connection = connect_to_prodev()
+    if not connection:
+        return stats
+    try:
+        batches = _partition_batches(csv_path, header, start, end, batch_size, stats)
+        stats['inserted'] = bulk_insert_data(connection, batches)
+    finally:
+        connection.close()
+    return stats
+
+
+def _count_users(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM user_data")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+def parallel_seed(csv_path, workers=None, batch_size=BULK_CHUNK_SIZE):
+    """Loads the CSV with one process and one MySQL connection per byte range
+
+    Per-partition counts are reconciled at the end: every partition must have
+    consumed its full byte range, and the table must have grown by exactly
+    the number of rows the workers report as inserted. Returns True when the
+    load reconciles.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    elif workers < 1:
+        raise ValueError(f"parallel_seed needs at least 1 worker, got {workers}")
+    try:
+        header, ranges = partition_csv(csv_path, workers)
+        _column_indexes(header)
+    except FileNotFoundError:
+        print(f"Error: {csv_path} file not found")
+        return False
+    except ValueError as e:
+        print(f"Error reading CSV file: {e}")
+        return False
+
+    connection = connect_to_prodev()
+    if not connection:
+        return False
+    before = _count_users(connection)
+
+    tasks = [(i, csv_path, header, start, end, batch_size)
+             for i, (start, end) in enumerate(ranges)]
+    started = time.perf_counter()
+    # With the age stats triggers in place every worker's inserts would queue
+    # on the single user_age_stats row
+    with age_stats_suspended(connection), \
+            multiprocessing.Pool(processes=min(workers, len(tasks)) or 1) as pool:
+        results = sorted(pool.imap_unordered(_seed_partition, tasks),
+                         key=lambda stats: stats['partition'])
+    elapsed = time.perf_counter() - started
+
+    after = _count_users(connection)
+    connection.close()
+
+    ok = True
+    for stats in results:
+        expected_bytes = stats['end'] - stats['start']
+        if stats['bytes'] != expected_bytes:
+            ok = False
+            print(f"Partition {stats['partition']} incomplete: read {stats['bytes']} "
+                  f"of {expected_bytes} bytes")
+
+    rows = sum(stats['rows'] for stats in results)
+    inserted = sum(stats['inserted'] for stats in results)
+    skipped = sum(stats['skipped'] for stats in results)
+    if after - before != inserted:
+        ok = False
+        print(f"Row count mismatch: table grew by {after - before}, "
+              f"workers reported {inserted} inserted")
+
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"Parallel seed over {len(results)} partitions: {rows} rows read, "
+          f"{inserted} inserted, {rows - inserted} duplicates, {skipped} invalid "
+          f"in {elapsed:.2f}s, {rate:,.0f} rows/sec")
+    print("Partition counts reconciled" if ok else "Partition counts did NOT reconcile")
+    return ok
+
+
+def _workers_from_argv(argv):
+    """Parses '--parallel [N]'; returns None when parallel mode is not requested"""
+    if '--parallel' not in argv:
+        return None
+    position = argv.index('--parallel')
+    if position + 1 < len(argv) and not argv[position + 1].startswith('--'):
+        value = argv[position + 1]
+        if not value.isdigit() or int(value) < 1:
+            raise ValueError(f"--parallel takes a worker count of at least 1, got {value!r}")
+        return int(value)
+    return os.cpu_count() or 1
 
 
 def main():
     """Main function to orchestrate the database setup"""
+    try:
+        workers = _workers_from_argv(sys.argv[1:])
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
     try:
 
         connection = connect_db()
@@ -119,27 +501,32 @@ def main():
 
 
         create_table(db_connection)
-
-
-        try:
-            data = pd.read_csv('user_data.csv')
-            print(f"Successfully loaded {len(data)} records from CSV")
-
-            # Validate required columns
-            required_columns = ['name', 'email', 'age']
-            if not all(col in data.columns for col in required_columns):
-                print(f"Error: CSV must contain columns: {required_columns}")
-                return
-
-        except FileNotFoundError:
-            print("Error: user_data.csv file not found")
-            return
-        except Exception as e:
-            print(f"Error reading CSV file: {e}")
-            return
-
-
-        insert_data(db_connection, data)
+        ensure_age_index(db_connection)
+        ensure_change_tracking(db_connection)
+
+        # Triggers left by an earlier run would update the single
+        # user_age_stats row for every inserted row, serializing the load
+        # (and the parallel workers) on it; they are reinstalled below
+        drop_age_stats_triggers(db_connection)
+
+        # Stream the CSV batch by batch straight into the bulk inserter so
+        # the whole file never has to be held in memory. With
+        # 'python seed.py --parallel [N]' the file is split across N workers.
+        if ensure_email_unique_index(db_connection):
+            if workers:
+                parallel_seed('user_data.csv', workers)
+            else:
+                bulk_insert_data(db_connection, stream_user_batches('user_data.csv'))
+        else:
+            # INSERT IGNORE only dedupes through the index, so dedupe in the
+            # client instead; that needs every email in one place, so serially
+            print("Loading without the unique email index; duplicate emails are "
+                  "dropped client-side and --parallel is ignored")
+            bulk_insert_data(db_connection, stream_user_batches('user_data.csv'),
+                             unique_index=False)
+
+        # Installed after the load, with one backfill scan over every row
+        create_age_stats_table(db_connection)
 
         # Close connection
         db_connection.close()
@@ -0,0 +1,259 @@
+"""Binary columnar snapshots of user_data for fast reseeding.
+
+    python snapshot.py export user_data.snap
+    python snapshot.py import user_data.snap [--replace]
+
+File layout (little-endian):
+
+    magic       8 bytes   b'UDSNAP01'
+    row groups  repeated:
+        uint32 n                       rows in the group (0 ends the list)
+        user_id, name, email columns:  uint32[n + 1] byte offsets, then UTF-8 blob
+        age column:                    int32[n] value in hundredths
+    uint64      total rows (checked on import)
+"""
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from decimal import Decimal
+
+from mysql.connector import Error
+
+from aggregates import age_stats_suspended
+from db_pool import get_pool
+
+MAGIC = b'UDSNAP01'
+ROW_GROUP_SIZE = 65536
+
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def _little_endian(values):
+    if _BIG_ENDIAN:
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_strings(values):
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = array('I', [0])
+    total = 0
+    for item in encoded:
+        total += len(item)
+        offsets.append(total)
+    return _little_endian(offsets) + b''.join(encoded)
+
+
+def _write_group(snapshot_file, rows):
+    user_ids, names, emails, ages = zip(*rows)
+    snapshot_file.write(_U32.pack(len(rows)))
+    for column in (user_ids, names, emails):
+        snapshot_file.write(_encode_strings(column))
+    # DECIMAL(5,2) is exact in hundredths
+    snapshot_file.write(_little_endian(array('i', (int(round(age * 100)) for age in ages))))
+
+
+def export_snapshot(path, group_size=ROW_GROUP_SIZE):
+    """Streams user_data into a snapshot file; returns the number of rows written"""
+    pool = get_pool()
+    connection = pool.acquire()
+    cursor = None
+    total = 0
+    started = time.perf_counter()
+    try:
+        cursor = connection.cursor(buffered=False)
+        cursor.execute("SELECT user_id, name, email, age FROM user_data")
+        with open(path, 'wb') as snapshot_file:
+            snapshot_file.write(MAGIC)
+            while True:
+                rows = cursor.fetchmany(group_size)
+                if not rows:
+                    break
+                _write_group(snapshot_file, rows)
+                total += len(rows)
+            snapshot_file.write(_U32.pack(0))
+            snapshot_file.write(_U64.pack(total))
+    finally:
+        if cursor:
+            cursor.close()
+        pool.release(connection)
+
+    elapsed = time.perf_counter() - started
+    print(f"Exported {total} rows to {path} in {elapsed:.2f}s")
+    return total
+
+
+def _take(buffer, offset, size, path):
+    """Returns buffer[offset:offset + size] and the offset after it
+
+    Raises ValueError if the file ends first, so a truncated snapshot never
+    reads as a short group.
+    """
+    end = offset + size
+    if end > len(buffer):
+        raise ValueError(f"{path} is truncated: needed {end} bytes, file has {len(buffer)}")
+    return buffer[offset:end], end
+
+
+def _read_u32_array(buffer, offset, count, path):
+    data, offset = _take(buffer, offset, 4 * count, path)
+    values = array('I')
+    values.frombytes(data)
+    if _BIG_ENDIAN:
+        values.byteswap()
+    return values, offset
+
+
+def _read_strings(buffer, offset, count, path, decode=True):
+    offsets, offset = _read_u32_array(buffer, offset, count + 1, path)
+    blob, offset = _take(buffer, offset, offsets[-1], path)
+    if not decode:
+        return None, offset
+    values = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(count)]
+    return values, offset
+
+
+def _groups(path, decode):
+    """Walks a snapshot's row groups, checking every length and the footer
+
+    Yields each group's rows, or only its row count when decode is False.
+    """
+    with open(path, 'rb') as snapshot_file:
+        if os.fstat(snapshot_file.fileno()).st_size < len(MAGIC):
+            raise ValueError(f"{path} is not a user_data snapshot")
+        with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if buffer[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a user_data snapshot")
+            offset = len(MAGIC)
+            seen = 0
+            while True:
+                header, offset = _take(buffer, offset, _U32.size, path)
+                (count,) = _U32.unpack(header)
+                if count == 0:
+                    break
+                user_ids, offset = _read_strings(buffer, offset, count, path, decode)
+                names, offset = _read_strings(buffer, offset, count, path, decode)
+                emails, offset = _read_strings(buffer, offset, count, path, decode)
+                age_bytes, offset = _take(buffer, offset, 4 * count, path)
+                seen += count
+                if not decode:
+                    yield count
+                    continue
+                ages = array('i')
+                ages.frombytes(age_bytes)
+                if _BIG_ENDIAN:
+                    ages.byteswap()
+                yield list(zip(user_ids, names, emails,
+                               (Decimal(age).scaleb(-2) for age in ages)))
+
+            footer, offset = _take(buffer, offset, _U64.size, path)
+            (expected,) = _U64.unpack(footer)
+            if expected != seen:
+                raise ValueError(f"{path} is truncated: footer says {expected} rows, read {seen}")
+            if offset != len(buffer):
+                raise ValueError(f"{path} has {len(buffer) - offset} bytes after its footer")
+
+
+def read_snapshot(path):
+    """Yields row groups of (user_id, name, email, age) tuples from a memory-mapped snapshot
+
+    A damaged file raises ValueError, but only when the read gets to the
+    damage: groups before it have already been yielded.
+    """
+    return _groups(path, decode=True)
+
+
+def check_snapshot(path):
+    """Validates a snapshot's lengths and footer without decoding it; returns its row count"""
+    return sum(_groups(path, decode=False))
+
+
+def import_snapshot(path, replace=False):
+    """Bulk-loads a snapshot into user_data, one multi-row INSERT per row group
+
+    replace=True empties the table first. Rows whose email already exists are
+    skipped, as in seed.bulk_insert_data. The whole file is validated before
+    anything is written, so a damaged snapshot leaves the table untouched.
+    The user_age_stats triggers are suspended for the load and the stats row
+    recomputed once at the end, as in seed.insert_data.
+    """
+    insert_query = """
+    INSERT IGNORE INTO user_data (user_id, name, email, age)
+    VALUES (%s, %s, %s, %s)
+    """
+    check_snapshot(path)
+    pool = get_pool()
+    connection = pool.acquire()
+    cursor = None
+    discard = False
+    read_count = 0
+    inserted_count = 0
+    started = time.perf_counter()
+    try:
+        cursor = connection.cursor()
+        # Per-row triggers would serialize the load on the single stats row;
+        # TRUNCATE bypasses them anyway. The row is recomputed on the way out.
+        with age_stats_suspended(connection):
+            try:
+                if replace:
+                    cursor.execute("TRUNCATE TABLE user_data")
+                    # The table is empty and a snapshot of user_data holds unique
+                    # emails, so InnoDB can skip the per-row unique-index lookups.
+                    # Merging into existing rows keeps them on to drop duplicates.
+                    cursor.execute("SET SESSION unique_checks = 0")
+                for rows in read_snapshot(path):
+                    cursor.executemany(insert_query, rows)
+                    connection.commit()
+                    read_count += len(rows)
+                    inserted_count += cursor.rowcount
+            except Error as e:
+                print(f"Error importing snapshot: {e}")
+                connection.rollback()
+                raise
+            finally:
+                if replace:
+                    # Failing here must not hide the import's own error, and a
+                    # session left without unique checks can't go back in the pool
+                    try:
+                        cursor.execute("SET SESSION unique_checks = 1")
+                    except Error as e:
+                        print(f"Could not restore unique_checks, dropping the connection: {e}")
+                        discard = True
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except Error:
+                discard = True
+        pool.release(connection, discard=discard)
+
+    elapsed = time.perf_counter() - started
+    rate = read_count / elapsed if elapsed > 0 else 0.0
+    print(f"Imported {inserted_count} of {read_count} rows from {path} "
+          f"in {elapsed:.2f}s, {rate:,.0f} rows/sec")
+    return inserted_count
+
+
+def main(argv):
+    if len(argv) < 2 or argv[0] not in ('export', 'import'):
+        print("Usage: python snapshot.py export|import <path> [--replace]")
+        return 1
+    command, path = argv[0], argv[1]
+    try:
+        if command == 'export':
+            export_snapshot(path)
+        else:
+            import_snapshot(path, replace='--replace' in argv[2:])
+    except (Error, OSError, ValueError) as e:
+        print(f"Snapshot {command} failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Unit tests for aggregates.py
+"""
+import statistics
+import unittest
+from decimal import Decimal
+
+from mysql.connector.errors import ProgrammingError
+
+from aggregates import NO_SUCH_TABLE_ERRNO, AgeHistogram, RunningStats, read_age_stats
+
+AGES = [22.5, 30.0, 30.0, 41.25, 67.0, 18.0, 55.5]
+
+
+class TestRunningStats(unittest.TestCase):
+    """
+    Tests the one-pass RunningStats accumulator.
+    """
+    def test_matches_statistics_module(self):
+        """
+        Test that count/sum/min/max/mean/variance match a two-pass computation.
+        """
+        stats = RunningStats().update(AGES)
+        self.assertEqual((stats.count, stats.min, stats.max), (7, 18.0, 67.0))
+        self.assertAlmostEqual(stats.total, sum(AGES))
+        self.assertAlmostEqual(stats.mean, statistics.fmean(AGES))
+        self.assertAlmostEqual(stats.variance, statistics.pvariance(AGES))
+        self.assertAlmostEqual(stats.stddev, statistics.pstdev(AGES))
+
+    def test_merge_equals_single_pass(self):
+        """
+        Test that merging partial stats gives the same result as one pass.
+        """
+        merged = RunningStats().update(AGES[:3]).merge(RunningStats().update(AGES[3:]))
+        single = RunningStats().update(AGES)
+        for name, value in single.as_dict().items():
+            self.assertAlmostEqual(merged.as_dict()[name], value)
+
+    def test_merge_with_empty(self):
+        """
+        Test that merging with an empty accumulator changes nothing.
+        """
+        stats = RunningStats().merge(RunningStats().update(AGES)).merge(RunningStats())
+        self.assertEqual(stats.count, len(AGES))
+
+    def test_empty(self):
+        """
+        Test that an empty accumulator reports no mean or variance.
+        """
+        stats = RunningStats()
+        self.assertEqual((stats.mean, stats.variance, stats.stddev), (None, None, None))
+
+    def test_from_block(self):
+        """
+        Test that building from a whole block matches adding values one by one.
+        """
+        stats = RunningStats.from_block(AGES)
+        self.assertAlmostEqual(stats.variance, RunningStats().update(AGES).variance)
+
+
+class TestAgeHistogram(unittest.TestCase):
+    """
+    Tests the exact AgeHistogram.
+    """
+    def test_percentiles(self):
+        """
+        Test nearest-rank percentiles against the sorted values.
+        """
+        histogram = AgeHistogram().add_block(AGES)
+        ordered = sorted(AGES)
+        self.assertEqual(histogram.percentiles([0, 50, 100]),
+                         [ordered[0], ordered[3], ordered[-1]])
+
+    def test_merge(self):
+        """
+        Test that merged histograms count every value once.
+        """
+        histogram = AgeHistogram().add_block(AGES[:4]).merge(AgeHistogram().add_block(AGES[4:]))
+        self.assertEqual(histogram.count, len(AGES))
+        self.assertEqual(histogram.percentile(50), sorted(AGES)[3])
+
+    def test_empty(self):
+        """
+        Test that an empty histogram has no percentiles or bins.
+        """
+        histogram = AgeHistogram()
+        self.assertEqual(histogram.percentiles([50]), [None])
+        self.assertEqual(histogram.histogram(), ([], []))
+
+    def test_histogram_counts_every_value(self):
+        """
+        Test that re-binning keeps the total count.
+        """
+        counts, edges = AgeHistogram().add_block(AGES).histogram(bins=5)
+        self.assertEqual(sum(counts), len(AGES))
+        self.assertEqual(len(edges), 6)
+
+
+class FakeCursor:
+    """Cursor returning one canned row, or raising a canned error"""
+    def __init__(self, row):
+        self.row = row
+
+    def execute(self, query, params=()):
+        if isinstance(self.row, Exception):
+            raise self.row
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Connection handing out a FakeCursor"""
+    def __init__(self, row):
+        self.row = row
+
+    def cursor(self):
+        return FakeCursor(self.row)
+
+
+class TestReadAgeStats(unittest.TestCase):
+    """
+    Tests read_age_stats on the materialized user_age_stats row.
+    """
+    def test_returns_floats(self):
+        """
+        Test that DECIMAL columns come back as floats, like RunningStats.
+        """
+        row = (3, Decimal('90.00'), Decimal('2900.0000'), Decimal('20.00'), Decimal('40.00'))
+        stats = read_age_stats(FakeConnection(row))
+        expected = RunningStats().update([20, 30, 40]).as_dict()
+        self.assertEqual(stats['count'], 3)
+        for name in ('sum', 'min', 'max', 'mean', 'variance'):
+            self.assertIsInstance(stats[name], float)
+            self.assertAlmostEqual(stats[name], expected[name])
+
+    def test_missing_table(self):
+        """
+        Test that a missing user_age_stats table reads as no stats.
+        """
+        error = ProgrammingError(errno=NO_SUCH_TABLE_ERRNO)
+        self.assertIsNone(read_age_stats(FakeConnection(error)))
+
+    def test_other_errors_propagate(self):
+        """
+        Test that errors other than a missing table are raised.
+        """
+        with self.assertRaises(ProgrammingError):
+            read_age_stats(FakeConnection(ProgrammingError(errno=1142)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Unit tests for predicates.py
+"""
+import unittest
+
+from parameterized import parameterized
+
+from predicates import Field, Predicate, compile_predicate, where
+
+ROWS = [
+    {'user_id': 'a', 'name': 'Ann', 'email': 'ann@example.com', 'age': 22},
+    {'user_id': 'b', 'name': 'Bob', 'email': 'bob@example.org', 'age': 30},
+    {'user_id': 'c', 'name': 'Cy', 'email': 'cy@example.com', 'age': 41},
+]
+
+
+class TestCompilePredicate(unittest.TestCase):
+    """
+    Tests how compile_predicate splits a predicate between SQL and Python.
+    """
+    def test_no_predicate(self):
+        """
+        Test that no predicate means no WHERE clause and no filtering.
+        """
+        compiled = compile_predicate(None)
+        self.assertEqual(compiled.where_clause(), "")
+        self.assertIs(compiled.filter_rows(ROWS), ROWS)
+
+    @parameterized.expand([
+        (Field('age') > 25, "(age > %s)", (25,)),
+        ((Field('age') >= 25) & (Field('name') != 'Bob'), "(age >= %s) AND (name != %s)", (25, 'Bob')),
+        (Field('user_id').isin(['a', 'b']), "(user_id IN (%s, %s))", ('a', 'b')),
+        (Field('user_id').isin([]), "(FALSE)", ()),
+        (~(Field('age') < 30), "(NOT (age < %s))", (30,)),
+        ((Field('age') < 25) | (Field('age') > 40), "((age < %s) OR (age > %s))", (25, 40)),
+    ])
+    def test_pushed_down(self, predicate, where_sql, params):
+        """
+        Test that SQL-expressible predicates become the WHERE clause entirely.
+        """
+        compiled = compile_predicate(predicate)
+        self.assertEqual(compiled.where_sql, where_sql)
+        self.assertEqual(compiled.params, params)
+        self.assertIsNone(compiled.residual)
+
+    def test_residual_is_filtered_client_side(self):
+        """
+        Test that Python-only terms of an AND stay as a residual filter.
+        """
+        predicate = (Field('age') > 25) & where(lambda row: row['email'].endswith('.com'))
+        compiled = compile_predicate(predicate)
+        self.assertEqual(compiled.where_clause(), " WHERE (age > %s)")
+        # The database already applied age > 25; only the residual runs here
+        fetched = [row for row in ROWS if row['age'] > 25]
+        self.assertEqual([row['user_id'] for row in compiled.filter_rows(fetched)], ['c'])
+
+    def test_or_with_python_term_stays_client_side(self):
+        """
+        Test that an OR containing a Python-only term is not pushed down.
+        """
+        predicate = (Field('age') > 40) | where(lambda row: row['name'] == 'Ann')
+        compiled = compile_predicate(predicate)
+        self.assertEqual(compiled.where_clause(), "")
+        self.assertEqual([row['user_id'] for row in compiled.filter_rows(ROWS)], ['a', 'c'])
+
+    def test_where_clause_prefix(self):
+        """
+        Test that where_clause can continue an existing condition.
+        """
+        compiled = compile_predicate(Field('age') > 25)
+        self.assertEqual(compiled.where_clause(" AND "), " AND (age > %s)")
+
+
+class TestPredicate(unittest.TestCase):
+    """
+    Tests building and evaluating predicates.
+    """
+    def test_matches_agrees_with_sql(self):
+        """
+        Test that matches() filters rows like the generated SQL would.
+        """
+        predicate = (Field('age') > 25) & ~Field('name').isin(['Cy'])
+        self.assertEqual([row['user_id'] for row in ROWS if predicate.matches(row)], ['b'])
+
+    @parameterized.expand([
+        ('password',),
+        ('age; DROP TABLE user_data',),
+    ])
+    def test_unknown_column(self, column):
+        """
+        Test that only user_data columns can be referenced.
+        """
+        with self.assertRaises(ValueError):
+            Field(column)
+
+    def test_predicate_is_abstract(self):
+        """
+        Test that Predicate can't be used without a matches() implementation.
+        """
+        with self.assertRaises(TypeError):
+            Predicate()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Unit tests for snapshot.py
+"""
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+
+from snapshot import MAGIC, _U32, _U64, _write_group, check_snapshot, read_snapshot
+
+GROUPS = [
+    [('id-1', 'Ann', 'ann@example.com', Decimal('22.50')),
+     ('id-2', 'Zoë', 'zoe@example.com', Decimal('100.00'))],
+    [('id-3', 'Bob', 'bob@example.org', Decimal('0.01'))],
+]
+
+
+class TestSnapshot(unittest.TestCase):
+    """
+    Tests reading back snapshot files and rejecting damaged ones.
+    """
+    def setUp(self):
+        """
+        Writes a two-group snapshot the way export_snapshot does.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'user_data.snap')
+        with open(self.path, 'wb') as snapshot_file:
+            snapshot_file.write(MAGIC)
+            for rows in GROUPS:
+                _write_group(snapshot_file, rows)
+            snapshot_file.write(_U32.pack(0))
+            snapshot_file.write(_U64.pack(sum(len(rows) for rows in GROUPS)))
+        with open(self.path, 'rb') as snapshot_file:
+            self.data = snapshot_file.read()
+
+    def write(self, data):
+        """
+        Writes a damaged copy of the snapshot and returns its path.
+        """
+        path = os.path.join(self.directory.name, 'damaged.snap')
+        with open(path, 'wb') as snapshot_file:
+            snapshot_file.write(data)
+        return path
+
+    def test_round_trip(self):
+        """
+        Test that every group reads back with the same rows and exact ages.
+        """
+        self.assertEqual(list(read_snapshot(self.path)), GROUPS)
+        self.assertEqual(check_snapshot(self.path), 3)
+
+    def test_every_truncation_is_detected(self):
+        """
+        Test that a snapshot cut at any byte fails both the check and a full read.
+        """
+        for size in range(len(self.data)):
+            path = self.write(self.data[:size])
+            with self.subTest(size=size):
+                with self.assertRaises(ValueError):
+                    check_snapshot(path)
+                with self.assertRaises(ValueError):
+                    list(read_snapshot(path))
+
+    def test_trailing_bytes(self):
+        """
+        Test that data after the footer is reported.
+        """
+        with self.assertRaises(ValueError):
+            check_snapshot(self.write(self.data + b'\0'))
+
+    def test_footer_mismatch(self):
+        """
+        Test that a footer disagreeing with the groups is reported.
+        """
+        data = self.data[:-_U64.size] + _U64.pack(4)
+        with self.assertRaises(ValueError):
+            check_snapshot(self.write(data))
+
+    def test_bad_magic(self):
+        """
+        Test that a file without the snapshot header is refused.
+        """
+        with self.assertRaises(ValueError):
+            check_snapshot(self.write(b'NOTASNAP' + self.data[len(MAGIC):]))
+
+
+if __name__ == "__main__":
+    unittest.main()